@@ -1,13 +1,16 @@
-import os, shutil
+import os, shutil, time
 import streamlit as st
-import base64
+import json
+import html as html_lib
 import streamlit.components.v1 as components
 
-from langchain_core.documents import Document
-from src.video_processor import save_uploaded_file, extract_audio
-from src.text_processor import transcribe_audio, chunk_text
-from src.vector_store_builder import create_and_save_vector_store
-from src.rag_qa import build_rag_pipeline, ask_question, MODEL_OPTIONS
+from src.video_processor import save_uploaded_file
+from src.vector_store_builder import list_videos, partial_videos
+from src.job_queue import submit_job, get_job, list_jobs, cancel_job, get_job_scheduler, ACTIVE_STATUSES
+from src.telemetry import span
+from src.media_server import get_media_url, get_metrics_url
+from src.rag_qa import build_rag_pipeline, stream_question, MODEL_OPTIONS
+from src.whisper_registry import WHISPER_MODEL_SIZES, DEFAULT_WHISPER_MODEL
 
 # ===== KHỞI TẠO TRẠNG THÁI PHIÊN =====
 def init_session_state():
@@ -27,6 +30,11 @@ def init_session_state():
         st.session_state.current_model_id = None
     if "last_sources" not in st.session_state:
         st.session_state.last_sources = []
+    if "whisper_model" not in st.session_state:
+        st.session_state.whisper_model = DEFAULT_WHISPER_MODEL
+    if "job_id" not in st.session_state:
+        # mở lại trang / kết nối lại -> attach vào job đang theo dõi (id nằm trên URL)
+        st.session_state.job_id = st.query_params.get("job")
 
 # ===== CÁC HÀM TIỆN ÍCH =====
 def reset_state_for_new_video(filename: str):
@@ -38,6 +46,8 @@ def reset_state_for_new_video(filename: str):
     st.session_state.is_processing = False
     st.session_state.current_model_id = None
     st.session_state.last_sources = []
+    st.session_state.job_id = None
+    st.query_params.pop("job", None)
 
 def apply_global_styles():
     st.markdown("""
@@ -204,6 +214,14 @@ def render_step1():
             reset_state_for_new_video(uploaded_file.name)
         
         st.markdown(f"**Video hiện tại:** `{uploaded_file.name}` <span class='badge'>Đã tải lên</span>", unsafe_allow_html=True)
+
+        # Chọn cỡ model Whisper (model nhỏ nhanh hơn, model lớn chính xác hơn)
+        st.selectbox(
+            "Model Whisper để phiên âm:",
+            WHISPER_MODEL_SIZES,
+            key="whisper_model",
+            disabled=st.session_state.processed,
+        )
         
         col_btn, col_status = st.columns([1, 3])
 
@@ -211,7 +229,7 @@ def render_step1():
             process_btn = st.button(
                 "🚀 Bắt đầu xử lý video",
                 type="primary",
-                disabled=st.session_state.processed,
+                disabled=st.session_state.processed or st.session_state.is_processing,
             )
         
         with col_status:
@@ -220,16 +238,31 @@ def render_step1():
         
         # CHỈ xử lý video khi user bấm nút
         if process_btn:
-            with st.spinner("Đang xử lý video..."):
-                process_video(uploaded_file)
-    else:
+            process_video(uploaded_file)
+    elif not st.session_state.job_id:
         st.info("Vui lòng tải lên một video để bắt đầu.")
 
+    if st.session_state.job_id:
+        render_job_progress()
+    render_active_jobs()
+
 def format_time(sec: float) -> str:
     m = int(sec // 60)
     s = int(sec % 60)
     return f"{m:02d}:{s:02d}"
 
+def format_metrics(metrics: dict) -> str:
+    parts = [f"tìm kiếm {metrics.get('retrieval_sec', 0):.2f}s"]
+    if "ttft_sec" in metrics:
+        parts.append(f"token đầu {metrics['ttft_sec']:.2f}s")
+    if "total_sec" in metrics:
+        parts.append(f"tổng {metrics['total_sec']:.2f}s")
+    if metrics.get("prompt_tokens"):
+        parts.append(f"prompt {metrics['prompt_tokens']} token")
+    if metrics.get("cache_hit"):
+        parts.append("⚡ trả lời từ cache")
+    return "⏱ " + " · ".join(parts)
+
 def render_step2():
     st.markdown("""
     <div class="step-card step-2">
@@ -241,6 +274,11 @@ def render_step2():
     if not st.session_state.qa_ready:
         st.warning("Vui lòng hoàn thành Bước 1 trước.")
         return
+    if st.session_state.is_processing and st.session_state.job_id:
+        job = get_job(st.session_state.job_id, events=0)
+        caption = indexed_caption(job, "bài giảng vẫn đang được xử lý, câu trả lời chỉ dựa trên phần đã index.") if job else None
+        if caption:
+            st.info(caption)
     
     # Chọn mô hình
     placeholder = "— Chọn mô hình LLM —"
@@ -257,31 +295,59 @@ def render_step2():
                 st.session_state.pipeline = build_rag_pipeline(selected_model_id)
             st.session_state.current_model_id = selected_model_id
         pipeline = st.session_state.pipeline
+
+        # Chọn bài giảng để tìm (index chứa nhiều bài giảng)
+        all_videos = list_videos()
+        # bài giảng đang index dần (job còn chạy) đã hỏi được dù chưa index xong;
+        # bài giảng index dở do job lỗi / bị kill thì vẫn ẩn
+        indexing = {job["video_name"] for job in list_jobs(ACTIVE_STATUSES)} & set(partial_videos())
+        all_videos = sorted(set(all_videos) | indexing)
+        default_videos = [st.session_state.video_name] if st.session_state.video_name in all_videos else []
+        selected_videos = st.multiselect(
+            "Tìm trong bài giảng (để trống = tất cả bài giảng):",
+            all_videos,
+            default=default_videos,
+            key="selected_videos",
+        )
         
         # Hiển thị chat
         for msg in st.session_state.messages:
             with st.chat_message(msg["role"]):
                 st.markdown(msg["content"])
+                if msg.get("metrics"):
+                    st.caption(format_metrics(msg["metrics"]))
 
         # ====================== VIDEO + PLAYLIST TIMELINE ======================
         if st.session_state.last_sources:
+            sources = st.session_state.last_sources
+            # phát video của đoạn liên quan nhất (có thể là bài giảng khác video vừa upload)
+            play_name = (getattr(sources[0], "metadata", {}) or {}).get("video_name")
             video_path = st.session_state.get("video_path")
+            if play_name and play_name != st.session_state.video_name:
+                video_path = os.path.join("temp", play_name)
             if not video_path or not os.path.exists(video_path):
                 st.warning("Không tìm thấy file video để phát lại.")
             else:
-                with open(video_path, "rb") as vf:
-                    video_bytes = vf.read()
-                video_b64 = base64.b64encode(video_bytes).decode("utf-8")
-
-                sources = st.session_state.last_sources
+                # video được phát qua media server (HTTP Range), không nhúng base64
+                video_url = get_media_url(video_path)
 
                 buttons_html = ""
                 for i, doc in enumerate(sources, 1):
                     meta = getattr(doc, "metadata", {}) or {}
                     start = meta.get("start")
                     end = meta.get("end")
+                    other_video = meta.get("video_name") not in (None, play_name)
 
-                    if start is not None:
+                    if other_video:
+                        buttons_html += f"""
+                        <button disabled
+                            style="margin:4px; padding:4px 10px; border-radius:999px;
+                                border:none; background:#ddd; color:#777;
+                                font-size:0.8rem;">
+                            Đoạn {i} ({html_lib.escape(meta.get("video_name"))}, ≈ {format_time(start or 0)})
+                        </button>
+                        """
+                    elif start is not None:
                         label_time = format_time(start)
                         label = f"Đoạn {i} (≈ {label_time})"
                         buttons_html += f"""
@@ -304,9 +370,8 @@ def render_step2():
 
                 html = f"""
                 <div style="margin-top:1rem; text-align:center;">
-                  <video id="video-player" controls
+                  <video id="video-player" controls preload="metadata"
                     style="max-height:440px; object-fit:contain">
-                    <source src="data:video/mp4;base64,{video_b64}" type="video/mp4" />
                     Trình duyệt không hỗ trợ phát video.
                   </video>
                   <div style="margin-top:0.5rem; display:flex; flex-wrap:wrap; justify-content:center;">
@@ -314,6 +379,17 @@ def render_step2():
                   </div>
                 </div>
                 <script>
+                (function() {{
+                  var src = {json.dumps(video_url)};
+                  // truy cập app từ máy khác: thay localhost bằng host của trang Streamlit
+                  try {{
+                    var host = window.parent.location.hostname;
+                    if (host && src.indexOf("//localhost:") >= 0) {{
+                      src = src.replace("//localhost:", "//" + host + ":");
+                    }}
+                  }} catch (e) {{}}
+                  document.getElementById("video-player").src = src;
+                }})();
                 function seekTo(t) {{
                   var v = document.getElementById("video-player");
                   if (v) {{
@@ -331,101 +407,158 @@ def render_step2():
                     components.html(html, height=500, scrolling=False)
         
         # ====================== CHAT INPUT ======================
+        queue_depth = pipeline["llm_service"].queue_depth() if pipeline else 0
+        if queue_depth:
+            st.caption(f"⏳ Đang có {queue_depth} câu hỏi chờ gọi LLM, câu trả lời có thể chậm hơn bình thường.")
         new_question = st.chat_input("Nhập câu hỏi của bạn...")
         if new_question:
             st.session_state.messages.append({"role": "user", "content": new_question})
-            result = ask_question(pipeline, new_question)
-            st.session_state.messages.append({"role": "assistant", "content": result["answer"]})
+            with st.chat_message("user"):
+                st.markdown(new_question)
+            # hiển thị câu trả lời dần theo từng token thay vì chờ sinh xong
+            with st.chat_message("assistant"):
+                token_stream, result = stream_question(pipeline, new_question, video_names=selected_videos)
+                st.write_stream(token_stream)
+            st.session_state.messages.append(
+                {"role": "assistant", "content": result["answer"], "metrics": result["metrics"]}
+            )
             st.session_state.last_sources = result["sources"]
             st.rerun()
     else:
         st.caption("⚠️ Vui lòng chọn mô hình trước khi hỏi đáp.")
 
 def process_video(uploaded_file):
+    # 1. Lưu video (nhanh, chạy ngay trong script)
+    with span("save", video=uploaded_file.name) as s:
+        video_path = save_uploaded_file(uploaded_file)
+        s.add_bytes(os.path.getsize(video_path))
+    st.session_state["video_path"] = video_path
+
+    # 2–5. Tách âm thanh, phiên âm, chia nhỏ, tạo vector store: giao cho hàng đợi job
+    # (chạy trong process worker, không mất khi đóng tab / script rerun)
+    job_id = submit_job(video_path, uploaded_file.name, st.session_state.whisper_model)
+    attach_job(job_id)
+    st.rerun()
+
+def attach_job(job_id: str):
+    """Theo dõi job `job_id` trong phiên này (ghi lên URL để kết nối lại vẫn attach được)."""
+    st.session_state.job_id = job_id
     st.session_state.is_processing = True
     st.session_state.qa_ready = False
-    
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-    
-    # 1. Lưu video
-    status_text.text("📂 Đang lưu video...")
-    video_path = save_uploaded_file(uploaded_file)
-    st.session_state["video_path"] = video_path
-    progress_bar.progress(20)
-    st.success("Video đã lưu thành công! ✅")
-    
-    # 2. Tách âm thanh
-    status_text.text("🎧 Đang tách âm thanh...")
-    audio_path = extract_audio(video_path)
-    if not audio_path:
-        st.error("Lỗi: Không thể tách âm thanh.")
-        st.session_state.is_processing = False
-        return
-    progress_bar.progress(40)
-    st.success("Âm thanh đã tách! 🎵")
-
-    # 3. Phiên âm
-    status_text.text("📝 Đang phiên âm...")
-    trans_result = transcribe_audio(audio_path)
-    if not trans_result:
-        st.error("Lỗi: Không thể phiên âm.")
+    st.query_params["job"] = job_id
+
+def open_qa(job: dict):
+    """Cho phép hỏi đáp trên bài giảng của job (đã xong, hoặc đã index được một phần)."""
+    st.session_state.video_name = job["video_name"]
+    st.session_state["video_path"] = os.path.join("temp", job["video_name"])
+    st.session_state.qa_ready = True
+
+def on_job_finished(job: dict):
+    st.session_state.is_processing = False
+    if job["status"] == "done":
+        open_qa(job)
+        st.session_state.processed = True
+
+def indexed_caption(job: dict, note: str = "phần này đã hỏi đáp được ở Bước 2.") -> str | None:
+    """Phần bài giảng đã index (khi index dần trong lúc phiên âm), None nếu chưa có."""
+    if not job.get("indexed_sec") or not job.get("total_sec"):
+        return None
+    fraction = min(job["indexed_sec"] / job["total_sec"], 1.0)
+    return (
+        f"📚 Đã index {format_time(job['indexed_sec'])} / {format_time(job['total_sec'])} "
+        f"({fraction:.0%}) bài giảng — {note}"
+    )
+
+JOB_STATUS_LABELS = {
+    "queued": "⏳ Đang chờ",
+    "running": "⚙️ Đang xử lý",
+    "done": "✅ Xong",
+    "failed": "❌ Lỗi",
+    "cancelled": "🚫 Đã huỷ",
+}
+STAGE_LABELS = {
+    "extract": "Tách âm thanh",
+    "transcribe": "Phiên âm",
+    "chunk": "Chia nhỏ",
+    "embed": "Embedding",
+    "index": "Vector store",
+}
+
+@st.fragment(run_every=1.0)
+def render_job_progress():
+    """Tiến độ job đang theo dõi, đọc từ hàng đợi job mỗi giây (không chặn phần còn lại của trang)."""
+    job = get_job(st.session_state.job_id, events=5)
+    if job is None:
+        st.warning("Không tìm thấy job xử lý video.")
+        st.session_state.job_id = None
         st.session_state.is_processing = False
         return
-    
-    segments = trans_result["segments"]
-    progress_bar.progress(60)
-    st.success("Phiên âm hoàn tất! 📜")
-    
-    # 4. Chia nhỏ + tạo Document có metadata start/end
-    status_text.text("✂️ Đang chia nhỏ văn bản...")
-    chunks, metadatas = chunk_text(segments)
-    if not chunks:
-        st.error("Lỗi: Không thể chia nhỏ.")
-        st.session_state.is_processing = False
+
+    st.markdown(f"**Job** `{job['video_name']}` · {JOB_STATUS_LABELS.get(job['status'], job['status'])}")
+    st.progress(int(job["percent"]))
+    if job["queue_position"]:
+        st.caption(f"Vị trí trong hàng đợi: {job['queue_position']}")
+    elif job["message"]:
+        st.caption(job["message"])
+    if job["stages"]:
+        st.caption(" · ".join(
+            f"{'✅' if stage['status'] == 'done' else '⏳'} {STAGE_LABELS.get(stage['stage'], stage['stage'])}"
+            for stage in job["stages"]
+        ))
+    for event in job["events"]:
+        if event["level"] == "error":
+            st.error(event["message"])
+
+    if job["status"] in ACTIVE_STATUSES:
+        caption = indexed_caption(job)
+        if caption:
+            st.caption(caption)
+            # phần đầu bài giảng đã vào index -> mở Bước 2 ngay, không chờ xử lý xong
+            if not st.session_state.qa_ready:
+                open_qa(job)
+                st.rerun(scope="app")
+        if st.button("Huỷ xử lý", key=f"cancel_{job['id']}"):
+            cancel_job(job["id"])
         return
-    progress_bar.progress(80)
-    st.success(f"Chia nhỏ thành {len(chunks)} đoạn! ✂️")
-
-    # 5. Tạo vector store (kèm metadata start/end)
-    status_text.text("📦 Đang tạo vector store...")
-    documents = []
-    for i in range(len(chunks)):
-        documents.append(
-            Document(
-                page_content=chunks[i],
-                metadata={
-                    "start": metadatas[i]["start"],   # 👈 Đổi thành start
-                    "end": metadatas[i]["end"],       # 👈 Đổi thành end
-                    "video_name": uploaded_file.name, # thêm cũng được
-                },
-            )
-        )
 
+    # job vừa kết thúc (hoặc attach lại job đã xong) -> cập nhật trạng thái phiên và vẽ lại cả trang (mở Bước 2)
+    if st.session_state.is_processing or (job["status"] == "done" and not st.session_state.qa_ready):
+        on_job_finished(job)
+        st.rerun(scope="app")
+    if job["status"] == "done":
+        result = job["result"] or {}
+        elapsed = (job["finished_at"] or time.time()) - (job["started_at"] or job["created_at"])
+        st.success(
+            f"Vector store sẵn sàng ({result.get('chunks', 0)} đoạn, {elapsed:.0f} giây)! "
+            "Bây giờ bạn có thể chuyển sang Bước 2 để hỏi đáp. 🎉"
+        )
+    elif job["status"] == "failed" and job["error"]:
+        st.error(job["error"])
 
-    if create_and_save_vector_store(documents):
-        progress_bar.progress(100)
-        st.session_state.qa_ready = True
-        st.session_state.is_processing = False
-        st.session_state.processed = True
-        st.success("Vector store sẵn sàng! Bây giờ bạn có thể chuyển sang Bước 2 để hỏi đáp. 🎉")        
-        
-        # Xoá file audio tạm, giữ video để phát lại
-        try:
-            if audio_path and os.path.exists(audio_path):
-                os.remove(audio_path)
-        except Exception as e:
-            st.warning(f"Không thể xoá file audio tạm: {e}")
-
-        st.rerun()
-    else:
-        st.error("Lỗi: Không thể tạo vector store.")
-        st.session_state.is_processing = False
+def render_active_jobs():
+    """Các job khác đang chờ / chạy (vd. từ tab khác): cho phép attach để theo dõi."""
+    jobs = [job for job in list_jobs(ACTIVE_STATUSES) if job["id"] != st.session_state.job_id]
+    if not jobs:
+        return
+    with st.expander(f"📋 Hàng đợi xử lý ({len(jobs)} video khác)"):
+        for job in jobs:
+            col_name, col_btn = st.columns([4, 1])
+            with col_name:
+                st.caption(f"{JOB_STATUS_LABELS.get(job['status'], job['status'])} · `{job['video_name']}` · {job['percent']}%")
+            with col_btn:
+                if st.button("Theo dõi", key=f"attach_{job['id']}"):
+                    attach_job(job["id"])
+                    st.rerun()
 
 # ===== ỨNG DỤNG CHÍNH =====
 def main():
     st.set_page_config(layout="wide", page_title="Hệ thống Hỏi đáp Video CS431", page_icon="🎓")
     init_session_state()
+    # scheduler + pool worker của hàng đợi job xử lý video (một lần mỗi process);
+    # model Whisper được load sẵn trong các worker, process app không phiên âm
+    get_job_scheduler()
+    # server /metrics riêng (chỉ khi đặt METRICS_PORT) -> khởi động sẵn để Prometheus scrape được
+    get_metrics_url()
     apply_global_styles()
     render_sidebar()
     render_hero()
@@ -0,0 +1,131 @@
+"""
+Hỏi hàng loạt từ dòng lệnh: chạy cả bộ câu hỏi ôn tập trên các bài giảng đã index
+(vd. để soạn đáp án), không cần gõ từng câu vào khung chat.
+
+Chạy từ thư mục gốc của project:
+    python ask_batch.py questions.txt -o answers.jsonl
+    python ask_batch.py questions.jsonl --videos lec01.mp4 lec02.mp4 --concurrency 16
+
+File câu hỏi: .txt mỗi dòng một câu hỏi, hoặc .jsonl mỗi dòng JSON {"question": ..., "id": ...}
+(id tuỳ chọn, mặc định là số thứ tự). Dòng trống / bắt đầu bằng # bị bỏ qua.
+
+Tất cả câu hỏi được embed một lần, tìm kiếm bằng một lần FAISS search trên cả ma trận,
+rồi gọi LLM song song (--concurrency) qua dịch vụ LLM dùng chung (hạn mức, retry).
+Mỗi câu xong được ghi ngay một dòng JSON vào file kết quả (thứ tự xong, có "index").
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from src.reporter import ConsoleReporter, use_reporter
+from src.rag_qa import MODEL_OPTIONS, BATCH_QA_CONCURRENCY, build_rag_pipeline, ask_questions
+from src.vector_store_builder import list_videos
+
+
+def read_questions(path: str):
+    """List (id, câu hỏi) từ file .txt hoặc .jsonl."""
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                entry = json.loads(line)
+                items.append((entry.get("id", len(items)), entry["question"]))
+            else:
+                items.append((len(items), line))
+    return items
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat(timespec="milliseconds")
+
+
+def _source(doc) -> dict:
+    meta = getattr(doc, "metadata", {}) or {}
+    return {
+        "video_name": meta.get("video_name"),
+        "start": meta.get("start"),
+        "end": meta.get("end"),
+        "chunk_index": meta.get("chunk_index"),
+        "text": doc.page_content,
+    }
+
+
+def to_record(index: int, question_id, result: dict) -> dict:
+    """Một dòng JSONL kết quả."""
+    metrics = dict(result["metrics"])
+    error = metrics.pop("error", None)
+    return {
+        "index": index,
+        "id": question_id,
+        "question": result["question"],
+        "answer": None if error else result["answer"],
+        "error": error,
+        "sources": [_source(doc) for doc in result["sources"]],
+        "started_at": _iso(result["started_at"]),
+        "finished_at": _iso(result["finished_at"]),
+        "latency": {k: round(v, 4) if isinstance(v, float) else v for k, v in metrics.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("questions", help="file câu hỏi (.txt hoặc .jsonl)")
+    parser.add_argument("-o", "--output", default="-", help="file JSONL kết quả (mặc định: stdout)")
+    parser.add_argument("--model", default=next(iter(MODEL_OPTIONS.values())), choices=list(MODEL_OPTIONS.values()))
+    parser.add_argument("--videos", nargs="*", help="chỉ tìm trong các bài giảng này (mặc định: tất cả)")
+    parser.add_argument("--concurrency", type=int, default=BATCH_QA_CONCURRENCY, help="số câu gọi LLM cùng lúc")
+    args = parser.parse_args()
+
+    reporter = ConsoleReporter()
+    items = read_questions(args.questions)
+    if not items:
+        parser.error("không có câu hỏi nào")
+    if args.videos:
+        unknown = sorted(set(args.videos) - set(list_videos()))
+        if unknown:
+            parser.error("không có trong index: " + ", ".join(unknown))
+
+    with use_reporter(reporter):
+        pipeline = build_rag_pipeline(args.model)
+    if pipeline is None:
+        return 1
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    write_lock = threading.Lock()
+    done = {"ok": 0, "failed": 0, "cached": 0}
+
+    def on_result(i: int, result: dict):
+        record = to_record(i, items[i][0], result)
+        with write_lock:
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            done["failed" if record["error"] else "ok"] += 1
+            done["cached"] += bool(result["metrics"].get("cache_hit"))
+            finished = done["ok"] + done["failed"]
+            if finished % 10 == 0 or finished == len(items):
+                reporter.progress(100 * finished // len(items), f"{finished}/{len(items)} câu")
+
+    reporter.info(f"Hỏi {len(items)} câu ({args.concurrency} câu cùng lúc, model {args.model}).")
+    t0 = time.perf_counter()
+    try:
+        ask_questions(pipeline, [q for _, q in items], args.videos or None, args.concurrency, on_result)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.perf_counter() - t0
+    reporter.success(
+        f"Xong {done['ok']}/{len(items)} câu trong {elapsed:.1f} giây "
+        f"({done['cached']} câu lấy từ cache, {done['failed']} câu lỗi)."
+    )
+    return 1 if done["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+"""
+So sánh các backend embedding (torch fp32 / int8 / onnx) ở nhiều batch size:
+tốc độ (chunk / giây) và chất lượng truy xuất so với model hiện tại
+(sentence-transformers fp32, batch 32 như HuggingFaceEmbeddings mặc định).
+
+Chạy từ thư mục gốc của project:
+    python -m benchmarks.bench_embed --minutes 60 --output bench/embed.json
+    python -m benchmarks.bench_embed --backends torch int8 --batch-sizes 32 128 --threads 4
+
+Corpus là các chunk của bài giảng tổng hợp (benchmarks.synthetic), truy vấn là các
+câu lấy từ cùng bài giảng. Chất lượng của mỗi backend:
+- recall@k: tỉ lệ top-k trùng với top-k của model hiện tại (FAISS flat, chính xác)
+- cosine  : cosine trung bình giữa vector của backend và vector của model hiện tại
+"""
+import argparse
+import json
+import os
+import platform
+import time
+
+import faiss
+import numpy as np
+
+from src.embedding_engine import EmbeddingEngine, EMBEDDING_BACKENDS
+from src.reporter import Reporter, use_reporter
+from src.resource_cache import EMBEDDING_MODEL_NAME
+from src.text_processor import clean_segments, chunk_text
+from benchmarks.bench_index import recall_at_k
+from benchmarks.bench_ingest import _git_commit
+from benchmarks.synthetic import synthetic_segments
+
+# batch mặc định của HuggingFaceEmbeddings (sentence-transformers encode)
+BASELINE_BATCH_SIZE = 32
+
+
+def make_corpus(minutes: float, queries: int, seed: int = 0):
+    """(chunks, câu truy vấn) từ bài giảng tổng hợp dài `minutes` phút."""
+    with use_reporter(Reporter()):
+        segments = clean_segments(synthetic_segments(minutes, seed=seed))
+        chunks, _ = chunk_text(segments)
+    rng = np.random.default_rng(seed)
+    picked = rng.choice(len(segments), min(queries, len(segments)), replace=False)
+    return chunks, [segments[i]["text"] for i in picked]
+
+
+def time_embed(engine: EmbeddingEngine, texts, repeat: int):
+    """Embed `texts` `repeat` lần, trả về (vector, giây tốt nhất)."""
+    best = None
+    vectors = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        vectors = engine.embed(texts)
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return vectors, best
+
+
+def top_k(doc_vectors: np.ndarray, query_vectors: np.ndarray, k: int) -> np.ndarray:
+    index = faiss.IndexFlatL2(doc_vectors.shape[1])
+    index.add(doc_vectors)
+    _, ids = index.search(query_vectors, k)
+    return ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=EMBEDDING_MODEL_NAME)
+    parser.add_argument("--backends", nargs="+", default=list(EMBEDDING_BACKENDS), choices=EMBEDDING_BACKENDS)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[16, 32, 64, 128])
+    parser.add_argument("--threads", type=int, default=0, help="số thread suy luận (0 = mặc định)")
+    parser.add_argument("--minutes", type=float, default=60.0, help="độ dài bài giảng tổng hợp")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="ghi kết quả JSON ra file")
+    args = parser.parse_args()
+
+    chunks, queries = make_corpus(args.minutes, args.queries, args.seed)
+
+    # model hiện tại: torch fp32, batch mặc định, không đổi số thread
+    baseline = EmbeddingEngine(args.model, "torch", batch_size=BASELINE_BATCH_SIZE, threads=0)
+    baseline.embed(["warm up"])
+    base_docs, base_sec = time_embed(baseline, chunks, args.repeat)
+    base_queries = baseline.embed(queries)
+    truth = top_k(base_docs, base_queries, args.k)
+
+    results = [{
+        "backend": "baseline",
+        "batch_size": BASELINE_BATCH_SIZE,
+        "chunks_per_sec": round(len(chunks) / base_sec, 1),
+    }]
+    print(json.dumps(results[0]), flush=True)
+
+    for backend in args.backends:
+        engine = EmbeddingEngine(args.model, backend, threads=args.threads)
+        try:
+            engine.embed(["warm up"])
+        except Exception as e:
+            # vd. onnx khi chưa cài optimum[onnxruntime]
+            entry = {"backend": backend, "error": f"{type(e).__name__}: {e}"}
+            results.append(entry)
+            print(json.dumps(entry, ensure_ascii=False), flush=True)
+            continue
+
+        quality = None
+        for batch_size in args.batch_sizes:
+            engine.batch_size = batch_size
+            doc_vectors, seconds = time_embed(engine, chunks, args.repeat)
+            if quality is None:
+                # vector không phụ thuộc batch size -> chỉ đo chất lượng một lần
+                query_vectors = engine.embed(queries)
+                found = top_k(doc_vectors, query_vectors, args.k)
+                quality = {
+                    f"recall@{args.k}": round(recall_at_k(found, truth), 4),
+                    "cosine": round(float(np.mean(np.sum(doc_vectors * base_docs, axis=1))), 5),
+                }
+            entry = {
+                "backend": backend,
+                "batch_size": batch_size,
+                "threads": args.threads,
+                "chunks_per_sec": round(len(chunks) / seconds, 1),
+                "speedup": round(base_sec / seconds, 2),
+                **quality,
+            }
+            results.append(entry)
+            print(json.dumps(entry), flush=True)
+
+    report = {
+        "benchmark": "embed",
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "model": args.model,
+        "chunks": len(chunks),
+        "queries": len(queries),
+        "repeat": args.repeat,
+        "results": results,
+    }
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+So sánh các loại FAISS index (flat / hnsw / ivfpq): recall@k so với flat (chính xác),
+độ trễ truy vấn, dung lượng index và thời gian build.
+
+Chạy từ thư mục gốc của project:
+    python -m benchmarks.bench_index --n 200000 --queries 500 --output bench/index.json
+    python -m benchmarks.bench_index --index vector_store_db      # dùng vector của index thật
+
+Không có --index thì dùng vector tổng hợp: hỗn hợp gaussian quanh --clusters tâm, chuẩn hoá
+về độ dài 1 (giống embedding sentence-transformers). Truy vấn lấy từ cùng phân phối.
+"""
+import argparse
+import json
+import os
+import time
+
+import faiss
+import numpy as np
+
+from src import index_factory
+from src.index_factory import build_index, index_memory_bytes, all_vectors
+
+
+def synthetic_vectors(n: int, dim: int, clusters: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=n)
+    vectors = centers[labels] + 0.35 * rng.standard_normal((n, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    k = truth.shape[1]
+    hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+    return hits / (len(truth) * k)
+
+
+def time_queries(index, queries: np.ndarray, k: int):
+    """Truy vấn từng câu một (như app), trả về (kết quả, list độ trễ giây)."""
+    latencies = []
+    found = np.empty((len(queries), k), dtype=np.int64)
+    for i, q in enumerate(queries):
+        t0 = time.perf_counter()
+        _, ids = index.search(q[None, :], k)
+        latencies.append(time.perf_counter() - t0)
+        found[i] = ids[0]
+    return found, latencies
+
+
+def _latency_summary(latencies):
+    ms = np.asarray(latencies) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(ms, 50)), 4),
+        "p95_ms": round(float(np.percentile(ms, 95)), 4),
+        "qps": round(len(ms) / (ms.sum() / 1000), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=100000, help="số vector (dữ liệu tổng hợp)")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--index", help="thư mục FAISS index có sẵn để lấy vector thật")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 32, 64, 128])
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--threads", type=int, default=1, help="số thread FAISS khi truy vấn")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="ghi kết quả JSON ra file")
+    args = parser.parse_args()
+
+    if args.index:
+        vectors = all_vectors(faiss.read_index(os.path.join(args.index, "index.faiss")))
+        rng = np.random.default_rng(args.seed)
+        queries = vectors[rng.choice(len(vectors), min(args.queries, len(vectors)), replace=False)]
+        queries = queries + 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+    else:
+        data = synthetic_vectors(args.n + args.queries, args.dim, args.clusters, args.seed)
+        vectors, queries = data[:args.n], data[args.n:]
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+
+    # benchmark luôn build đúng loại được hỏi, kể cả khi ít vector hơn ngưỡng train của app
+    index_factory.IVF_MIN_TRAIN = 0
+
+    results = []
+    truth = None
+    for index_type in ("flat", "hnsw", "ivfpq"):
+        faiss.omp_set_num_threads(os.cpu_count() or 1)
+        t0 = time.perf_counter()
+        index = build_index(index_type, vectors, seed=args.seed)
+        build_sec = time.perf_counter() - t0
+        faiss.omp_set_num_threads(args.threads)
+
+        if index_type == "hnsw":
+            settings = [("ef_search", ef) for ef in args.ef_search]
+        elif index_type == "ivfpq":
+            settings = [("nprobe", nprobe) for nprobe in args.nprobe]
+        else:
+            settings = [(None, None)]
+
+        for param, value in settings:
+            if param == "ef_search":
+                index.hnsw.efSearch = value
+            elif param == "nprobe":
+                index.nprobe = value
+            found, latencies = time_queries(index, queries, args.k)
+            if truth is None:
+                truth = found   # flat chạy trước: kết quả chính xác
+            entry = {
+                "index": index_type,
+                "build_sec": round(build_sec, 3),
+                "memory_mb": round(index_memory_bytes(index) / 2**20, 2),
+                f"recall@{args.k}": round(recall_at_k(found, truth), 4),
+                **_latency_summary(latencies),
+            }
+            if param:
+                entry[param] = value
+            results.append(entry)
+            print(json.dumps(entry), flush=True)
+
+    report = {
+        "benchmark": "index",
+        "n": int(len(vectors)),
+        "dim": int(vectors.shape[1]),
+        "queries": int(len(queries)),
+        "k": args.k,
+        "threads": args.threads,
+        "source": args.index or f"synthetic({args.clusters} clusters)",
+        "results": results,
+    }
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
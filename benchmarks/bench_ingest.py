@@ -0,0 +1,223 @@
+"""
+Benchmark từng stage của pipeline xử lý bài giảng trên dữ liệu tổng hợp:
+extract_audio, transcribe_audio (model tiny), clean_transcript, chunk_text,
+embedding, FAISS build / save / load — ở nhiều độ dài bài giảng.
+
+Chạy từ thư mục gốc của project:
+    python -m benchmarks.bench_ingest --minutes 1 5 15 --output bench/ingest.json
+    python -m benchmarks.bench_ingest --compare bench/ingest_main.json   # báo stage chậm đi
+
+Kết quả là JSON (mỗi stage: median / min giây qua --repeat lần, kèm giây trên mỗi
+phút audio) để so sánh giữa các commit. --compare trả mã lỗi 1 nếu có stage chậm
+hơn baseline quá --tolerance.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+
+from src.reporter import Reporter, use_reporter
+from src.video_processor import extract_audio, release_audio
+from src.text_processor import transcribe_audio, clean_segments, chunk_text
+from src.resource_cache import get_embeddings, EMBEDDING_MODEL_NAME
+from src.disk_store import save_store, load_store
+from benchmarks.synthetic import make_lecture_mp4, synthetic_segments
+
+
+class _ErrorCollector(Reporter):
+    """Reporter im lặng, chỉ giữ lại các thông báo lỗi (các hàm pipeline trả None khi lỗi)."""
+
+    def __init__(self):
+        self.errors = []
+
+    def error(self, message: str):
+        self.errors.append(message)
+
+
+def _timed(fn, repeat: int):
+    """Chạy fn() `repeat` lần, trả về (kết quả lần cuối, list thời gian)."""
+    times = []
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - t0)
+    return result, times
+
+
+def _summary(times, minutes: float):
+    median = statistics.median(times)
+    return {
+        "median_sec": round(median, 6),
+        "min_sec": round(min(times), 6),
+        "sec_per_audio_min": round(median / minutes, 6),
+    }
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except Exception:
+        return None
+
+
+def _load_embeddings(model_name: str):
+    """Model embedding thật; None nếu không load được (vd. máy không có mạng để tải model)."""
+    try:
+        embeddings = get_embeddings(model_name)
+        embeddings.embed_query("warm up")
+        return embeddings, None
+    except Exception as e:
+        return None, str(e)
+
+
+def bench_length(minutes: float, args, embeddings, workdir: str):
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.embeddings import FakeEmbeddings
+
+    stages = {}
+    video_path = make_lecture_mp4(os.path.join(workdir, f"lecture_{minutes:g}min.mp4"), minutes, seed=args.seed)
+
+    # ----- tách âm thanh -----
+    with use_reporter(_ErrorCollector()) as collector:
+        audio, times = _timed(lambda: extract_audio(video_path, use_memmap=False), args.repeat)
+    if audio is None:
+        raise RuntimeError("extract_audio() thất bại: " + "; ".join(collector.errors))
+    stages["extract_audio"] = _summary(times, minutes)
+
+    # ----- phiên âm (chạy 1 lần: chậm, và audio tổng hợp không có lời thật) -----
+    if args.skip_transcribe:
+        stages["transcribe"] = {"skipped": True}
+    else:
+        with use_reporter(_ErrorCollector()) as collector:
+            result, times = _timed(lambda: transcribe_audio(audio, model_size=args.model, workers=1), 1)
+        if result is None:
+            stages["transcribe"] = {"error": "; ".join(collector.errors) or "transcribe_audio() thất bại"}
+        else:
+            stages["transcribe"] = dict(_summary(times, minutes), model=args.model, segments=len(result["segments"]))
+    release_audio(audio)
+
+    # ----- làm sạch + chia chunk trên segment tổng hợp -----
+    raw_segments = synthetic_segments(minutes, seed=args.seed)
+    segments, times = _timed(lambda: clean_segments(raw_segments), args.repeat)
+    stages["clean"] = dict(_summary(times, minutes), segments=len(raw_segments))
+
+    (chunks, metadatas), times = _timed(lambda: chunk_text(segments), args.repeat)
+    stages["chunk"] = dict(_summary(times, minutes), chunks=len(chunks))
+
+    # ----- embedding -----
+    if embeddings is not None:
+        vectors, times = _timed(lambda: embeddings.embed_documents(chunks), args.repeat)
+        stages["embed"] = dict(_summary(times, minutes), model=args.embedding_model)
+        store_embeddings = embeddings
+    else:
+        # không có model: các stage FAISS vẫn đo được với vector ngẫu nhiên cùng số chiều
+        rng = np.random.default_rng(args.seed)
+        vectors = rng.standard_normal((len(chunks), args.dim)).astype(np.float32).tolist()
+        stages["embed"] = {"skipped": True}
+        store_embeddings = FakeEmbeddings(size=args.dim)
+
+    # ----- FAISS build / save / load -----
+    text_embeddings = list(zip(chunks, vectors))
+    store, times = _timed(
+        lambda: FAISS.from_embeddings(text_embeddings, embedding=store_embeddings, metadatas=metadatas),
+        args.repeat,
+    )
+    stages["faiss_build"] = _summary(times, minutes)
+
+    index_dir = os.path.join(workdir, f"index_{minutes:g}min")
+    _, times = _timed(lambda: save_store(store, index_dir), args.repeat)
+    stages["faiss_save"] = _summary(times, minutes)
+
+    # load như app: index mmap + docstore SQLite
+    _, times = _timed(lambda: load_store(index_dir, store_embeddings), args.repeat)
+    stages["faiss_load"] = _summary(times, minutes)
+
+    return {"minutes": minutes, "video_bytes": os.path.getsize(video_path), "stages": stages}
+
+
+def compare(report: dict, baseline: dict, tolerance: float):
+    """Danh sách stage chậm hơn baseline quá `tolerance` (tỉ lệ, vd. 0.2 = 20%)."""
+    base = {r["minutes"]: r["stages"] for r in baseline.get("results", [])}
+    regressions = []
+    for result in report["results"]:
+        old_stages = base.get(result["minutes"])
+        if not old_stages:
+            continue
+        for stage, new in result["stages"].items():
+            old = old_stages.get(stage, {})
+            if "median_sec" not in new or "median_sec" not in old or old["median_sec"] <= 0:
+                continue
+            ratio = new["median_sec"] / old["median_sec"]
+            if ratio > 1 + tolerance:
+                regressions.append({
+                    "minutes": result["minutes"],
+                    "stage": stage,
+                    "baseline_sec": old["median_sec"],
+                    "current_sec": new["median_sec"],
+                    "ratio": round(ratio, 2),
+                })
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, nargs="+", default=[1.0, 5.0, 15.0], help="các độ dài bài giảng")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--model", default="tiny", help="model Whisper cho stage transcribe")
+    parser.add_argument("--skip-transcribe", action="store_true")
+    parser.add_argument("--embedding-model", default=EMBEDDING_MODEL_NAME)
+    parser.add_argument("--dim", type=int, default=384, help="số chiều vector khi không load được model embedding")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="thư mục chứa video / index tổng hợp (mặc định thư mục tạm)")
+    parser.add_argument("--output", help="ghi kết quả JSON ra file")
+    parser.add_argument("--compare", help="file JSON kết quả cũ để so sánh")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_ingest_")
+    embeddings, embedding_error = _load_embeddings(args.embedding_model)
+
+    results = []
+    # các hàm pipeline báo tiến độ qua reporter -> tắt để không lẫn vào output
+    with use_reporter(Reporter()):
+        for minutes in args.minutes:
+            results.append(bench_length(minutes, args, embeddings, workdir))
+
+    report = {
+        "benchmark": "ingest",
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "repeat": args.repeat,
+        "embedding_error": embedding_error,
+        "results": results,
+    }
+
+    exit_code = 0
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        report["baseline_commit"] = baseline.get("commit")
+        report["regressions"] = compare(report, baseline, args.tolerance)
+        exit_code = 1 if report["regressions"] else 0
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    return exit_code
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,63 @@
+"""
+So sánh thời gian phiên âm tuần tự và song song (theo cửa sổ).
+
+Chạy từ thư mục gốc của project:
+    python -m benchmarks.bench_parallel_transcribe --input temp/lecture.mp4 --workers 8
+Không có --input thì dùng audio tổng hợp (tiếng ồn + khoảng lặng) dài --minutes phút.
+"""
+import argparse
+import json
+import os
+import time
+
+from src.video_processor import SAMPLE_RATE, extract_audio
+from src.transcription_engine import TRANSCRIBE_ENGINES, TRANSCRIBE_ENGINE, get_engine
+from src.parallel_transcriber import transcribe_parallel
+from benchmarks.synthetic import synthetic_audio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", help="video/audio để phiên âm")
+    parser.add_argument("--minutes", type=float, default=10.0)
+    parser.add_argument("--model", default="tiny")
+    parser.add_argument("--engine", default=TRANSCRIBE_ENGINE, choices=TRANSCRIBE_ENGINES)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--window-sec", type=float, default=120.0)
+    parser.add_argument("--output", help="ghi kết quả JSON ra file")
+    args = parser.parse_args()
+
+    audio = extract_audio(args.input) if args.input else synthetic_audio(args.minutes)
+    duration = len(audio) / SAMPLE_RATE
+
+    # tuần tự: không tính thời gian load model (registry giữ model sẵn)
+    engine = get_engine(args.engine, args.model, device="cpu")
+    t0 = time.perf_counter()
+    serial = engine.transcribe(audio, language="vi")
+    serial_sec = time.perf_counter() - t0
+
+    # song song: tính cả thời gian khởi động worker + load model trong worker
+    t0 = time.perf_counter()
+    parallel = transcribe_parallel(audio, args.model, args.workers, window_sec=args.window_sec, engine=args.engine)
+    parallel_sec = time.perf_counter() - t0
+
+    report = {
+        "audio_sec": round(duration, 1),
+        "model": args.model,
+        "engine": args.engine,
+        "workers": args.workers,
+        "window_sec": args.window_sec,
+        "serial_sec": round(serial_sec, 2),
+        "parallel_sec": round(parallel_sec, 2),
+        "speedup": round(serial_sec / parallel_sec, 2) if parallel_sec else None,
+        "serial_segments": len(serial),
+        "parallel_segments": len(parallel),
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
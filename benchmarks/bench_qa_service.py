@@ -0,0 +1,148 @@
+"""
+Thử tải lớp gọi LLM với nhiều phiên hỏi cùng lúc (vd. cả lớp hỏi trước giờ thi),
+trên server giả lập Groq (benchmarks.mock_groq) có giới hạn tốc độ và trả 429.
+
+So sánh:
+- naive  : mỗi câu hỏi một ChatGroq riêng gọi đồng bộ (như trước đây)
+- service: qua src.llm_service (client dùng chung, token bucket, retry, hàng đợi)
+
+Chạy từ thư mục gốc của project:
+    python -m benchmarks.bench_qa_service --sessions 40 --rpm 60 --tpm 20000
+    python -m benchmarks.bench_qa_service --mode service --stream --error-rate 0.1
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.mock_groq import start_mock_server
+
+MODEL_ID = "llama-3.1-8b-instant"
+UNLIMITED = 10 ** 9
+
+
+def _prompt(i: int, words: int) -> str:
+    return f"Câu hỏi {i}: " + " ".join(f"gradient descent learning rate {j}" for j in range(words // 4))
+
+
+def run_naive(prompts, base_url: str):
+    from langchain_groq import ChatGroq
+
+    def ask(prompt):
+        llm = ChatGroq(model=MODEL_ID, temperature=0.2, base_url=base_url)
+        return llm.invoke(prompt).content
+
+    return ask
+
+
+def run_service(prompts, base_url: str, stream: bool, max_queue: int, rpm: int, tpm: int):
+    from src import llm_service
+    from src.context_packer import count_tokens
+
+    llm_service.GROQ_BASE_URL = base_url
+    llm_service.GROQ_RPM, llm_service.GROQ_TPM = rpm, tpm
+    service = llm_service.LLMService(max_queue=max_queue)
+
+    def ask(prompt):
+        if stream:
+            return "".join(service.stream(MODEL_ID, prompt, count_tokens(prompt)))
+        return service.complete(MODEL_ID, prompt, count_tokens(prompt))
+
+    return ask, service
+
+
+def bench(mode: str, args, base_url: str, server):
+    prompts = [_prompt(i, args.prompt_words) for i in range(args.sessions)]
+    service = None
+    if mode == "naive":
+        ask = run_naive(prompts, base_url)
+    else:
+        # hạn mức phía client: mặc định đúng bằng hạn mức của server (0 = không giới hạn)
+        rpm = args.client_rpm or args.rpm or UNLIMITED
+        tpm = args.client_tpm or args.tpm or UNLIMITED
+        ask, service = run_service(prompts, base_url, args.stream, args.max_queue, rpm, tpm)
+
+    max_depth = 0
+    stop = threading.Event()
+
+    def watch_queue():
+        nonlocal max_depth
+        while not stop.is_set():
+            max_depth = max(max_depth, service.queue_depth())
+            time.sleep(0.01)
+
+    if service is not None:
+        threading.Thread(target=watch_queue, daemon=True).start()
+
+    latencies, errors = [], {}
+
+    def one(prompt):
+        t0 = time.perf_counter()
+        try:
+            ask(prompt)
+            latencies.append(time.perf_counter() - t0)
+        except Exception as e:
+            name = type(e).__name__
+            errors[name] = errors.get(name, 0) + 1
+
+    counts_before = dict(server.state.counts)
+    t0 = time.perf_counter()
+    # mỗi phiên Streamlit là một thread riêng
+    with ThreadPoolExecutor(args.sessions) as pool:
+        list(pool.map(one, prompts))
+    elapsed = time.perf_counter() - t0
+    stop.set()
+
+    lat = np.asarray(latencies) if latencies else np.zeros(1)
+    return {
+        "mode": mode,
+        "stream": args.stream if mode == "service" else False,
+        "sessions": args.sessions,
+        "ok": len(latencies),
+        "errors": errors,
+        "elapsed_sec": round(elapsed, 2),
+        "p50_sec": round(float(np.percentile(lat, 50)), 3),
+        "p95_sec": round(float(np.percentile(lat, 95)), 3),
+        "max_queue_depth": max_depth if service is not None else None,
+        "server": {k: server.state.counts[k] - counts_before[k] for k in counts_before},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["naive", "service", "both"], default="both")
+    parser.add_argument("--sessions", type=int, default=40, help="số phiên hỏi cùng lúc")
+    parser.add_argument("--prompt-words", type=int, default=400)
+    parser.add_argument("--stream", action="store_true", help="service: dùng stream()")
+    parser.add_argument("--max-queue", type=int, default=64)
+    parser.add_argument("--rpm", type=int, default=60, help="hạn mức requests/phút của server giả lập")
+    parser.add_argument("--tpm", type=int, default=30000, help="hạn mức tokens/phút của server giả lập")
+    parser.add_argument("--client-rpm", type=int, default=0, help="hạn mức service tự đặt (0 = bằng --rpm)")
+    parser.add_argument("--client-tpm", type=int, default=0, help="hạn mức service tự đặt (0 = bằng --tpm)")
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="tỉ lệ lỗi 503 của server giả lập")
+    parser.add_argument("--output", help="ghi kết quả JSON ra file")
+    args = parser.parse_args()
+
+    os.environ.setdefault("GROQ_API_KEY", "test")
+    results = []
+    for mode in (["naive", "service"] if args.mode == "both" else [args.mode]):
+        # server mới cho mỗi chế độ: hạn mức đầy như nhau
+        server, base_url = start_mock_server(rpm=args.rpm, tpm=args.tpm, latency=args.latency, error_rate=args.error_rate)
+        result = bench(mode, args, base_url, server)
+        server.shutdown()
+        results.append(result)
+        print(json.dumps(result), flush=True)
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"benchmark": "qa_service", "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
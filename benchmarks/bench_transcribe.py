@@ -0,0 +1,149 @@
+"""
+So sánh các engine phiên âm (src.transcription_engine) trên cùng một đoạn audio:
+- rtf: real-time factor = thời gian phiên âm / độ dài audio (không tính load model)
+- wer: tỉ lệ khác biệt theo từ (word error rate) so với engine tham chiếu
+  (engine đầu tiên trong --engines, mặc định openai-whisper fp32)
+Output của mọi engine được cho qua clean_segments() + chunk_text() để chắc chắn
+cùng dạng segment.
+
+Chạy từ thư mục gốc của project:
+    python -m benchmarks.bench_transcribe --input temp/lecture.mp4 --seconds 120 --model small
+    python -m benchmarks.bench_transcribe --input clip.wav --compute-types int8 float32 --beam-sizes 1 5 --threads 4
+
+Repo không kèm sẵn file tiếng nói: --input là video/audio bài giảng thật, lấy đoạn
+--seconds giây từ --start. Không có --input thì dùng audio tổng hợp (tiếng ồn + khoảng lặng)
+— chỉ đo được rtf, wer không có ý nghĩa.
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import time
+
+from src.video_processor import SAMPLE_RATE, extract_audio
+from src.reporter import Reporter, use_reporter
+from src.text_processor import clean_segments, chunk_text
+from src.transcription_engine import TRANSCRIBE_ENGINES, WhisperEngine, FasterWhisperEngine
+from benchmarks.bench_ingest import _git_commit
+from benchmarks.synthetic import synthetic_audio
+
+
+def _words(segments):
+    text = " ".join(seg["text"] for seg in segments)
+    return re.findall(r"\w+", text.lower())
+
+
+def word_error_rate(reference, hypothesis) -> float:
+    """Khoảng cách edit theo từ (thêm / bớt / thay) chia cho số từ của `reference`."""
+    if not reference:
+        return 0.0 if not hypothesis else 1.0
+    prev = list(range(len(hypothesis) + 1))
+    for i, ref_word in enumerate(reference, 1):
+        cur = [i] + [0] * len(hypothesis)
+        for j, hyp_word in enumerate(hypothesis, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ref_word != hyp_word))
+        prev = cur
+    return prev[-1] / len(reference)
+
+
+def engine_configs(args):
+    """(nhãn, hàm tạo engine) theo thứ tự --engines; faster-whisper nhân theo compute type x beam."""
+    configs = []
+    for name in args.engines:
+        if name == "whisper":
+            configs.append(({"engine": name}, lambda: WhisperEngine(args.model, device="cpu", threads=args.threads)))
+            continue
+        for compute_type in args.compute_types:
+            for beam_size in args.beam_sizes:
+                label = {"engine": name, "compute_type": compute_type, "beam_size": beam_size}
+                configs.append((label, lambda c=compute_type, b=beam_size: FasterWhisperEngine(
+                    args.model, device="cpu", threads=args.threads, compute_type=c, beam_size=b,
+                )))
+    return configs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", help="video/audio bài giảng để phiên âm")
+    parser.add_argument("--start", type=float, default=0.0, help="bắt đầu đoạn audio (giây)")
+    parser.add_argument("--seconds", type=float, default=60.0, help="độ dài đoạn audio (giây)")
+    parser.add_argument("--model", default="base")
+    parser.add_argument("--engines", nargs="+", default=list(TRANSCRIBE_ENGINES), choices=TRANSCRIBE_ENGINES,
+                        help="engine đầu tiên là tham chiếu cho wer")
+    parser.add_argument("--compute-types", nargs="+", default=["int8"], help="faster-whisper: compute type")
+    parser.add_argument("--beam-sizes", type=int, nargs="+", default=[1], help="faster-whisper: beam size")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1, help="số thread CPU của mỗi engine")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--output", help="ghi kết quả JSON ra file")
+    args = parser.parse_args()
+
+    if args.input:
+        audio = extract_audio(args.input)
+        if audio is None:
+            parser.error(f"không tách được âm thanh từ {args.input}")
+        start = int(args.start * SAMPLE_RATE)
+        audio = audio[start:start + int(args.seconds * SAMPLE_RATE)]
+    else:
+        audio = synthetic_audio(args.seconds / 60)
+    audio_sec = len(audio) / SAMPLE_RATE
+
+    results = []
+    reference = None
+    for label, make_engine in engine_configs(args):
+        try:
+            t0 = time.perf_counter()
+            engine = make_engine()
+            load_sec = time.perf_counter() - t0
+            best = None
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                segments = engine.transcribe(audio, language="vi")
+                elapsed = time.perf_counter() - t0
+                best = elapsed if best is None else min(best, elapsed)
+        except Exception as e:
+            # vd. faster-whisper chưa được cài
+            entry = dict(label, error=f"{type(e).__name__}: {e}")
+            results.append(entry)
+            print(json.dumps(entry, ensure_ascii=False), flush=True)
+            continue
+
+        with use_reporter(Reporter()):
+            chunks, _ = chunk_text(clean_segments(segments))
+        words = _words(segments)
+        if reference is None:
+            reference = words
+        entry = dict(
+            label,
+            load_sec=round(load_sec, 2),
+            transcribe_sec=round(best, 2),
+            rtf=round(best / max(audio_sec, 1e-9), 3),
+            segments=len(segments),
+            chunks=len(chunks),
+            words=len(words),
+            wer=round(word_error_rate(reference, words), 4),
+        )
+        results.append(entry)
+        print(json.dumps(entry), flush=True)
+
+    report = {
+        "benchmark": "transcribe",
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "input": args.input or "synthetic",
+        "audio_sec": round(audio_sec, 1),
+        "model": args.model,
+        "threads": args.threads,
+        "repeat": args.repeat,
+        "results": results,
+    }
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
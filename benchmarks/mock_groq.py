@@ -0,0 +1,217 @@
+"""
+Server giả lập API chat completions của Groq (OpenAI-compatible) để thử tải dịch vụ LLM
+mà không tốn quota thật: có giới hạn requests/phút và tokens/phút (trả 429 kèm
+retry-after như Groq), lỗi 5xx ngẫu nhiên, độ trễ và stream SSE.
+
+Chạy riêng:
+    python -m benchmarks.mock_groq --port 8099 --rpm 30 --tpm 6000
+    GROQ_BASE_URL=http://127.0.0.1:8099 GROQ_API_KEY=test streamlit run app.py
+
+Hoặc dùng trong code: start_mock_server(port=0, rpm=...) trả về (server, base_url).
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHAT_PATH = "/openai/v1/chat/completions"
+WINDOW_SEC = 60.0
+
+
+class MockGroqState:
+    """
+    Cấu hình + hạn mức. Như Groq, hạn mức được nạp lại liên tục (rpm/60 request mỗi
+    giây) chứ không reset theo từng phút; retry-after = thời gian chờ nạp đủ.
+    """
+
+    def __init__(self, rpm: int, tpm: int, latency: float, tokens_per_sec: float, error_rate: float, seed: int = 0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.latency = latency
+        self.tokens_per_sec = tokens_per_sec
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests_left = float(rpm)
+        self.tokens_left = float(tpm)
+        self.updated = time.monotonic()
+        self.counts = {"ok": 0, "rate_limited": 0, "server_error": 0}
+
+    def admit(self, tokens: int):
+        """None nếu nhận request, không thì số giây client nên chờ (retry-after)."""
+        with self.lock:
+            now = time.monotonic()
+            elapsed = now - self.updated
+            self.updated = now
+            if self.rpm:
+                self.requests_left = min(self.rpm, self.requests_left + elapsed * self.rpm / WINDOW_SEC)
+            if self.tpm:
+                tokens = min(tokens, self.tpm)
+                self.tokens_left = min(self.tpm, self.tokens_left + elapsed * self.tpm / WINDOW_SEC)
+
+            wait = 0.0
+            if self.rpm and self.requests_left < 1:
+                wait = max(wait, (1 - self.requests_left) * WINDOW_SEC / self.rpm)
+            if self.tpm and self.tokens_left < tokens:
+                wait = max(wait, (tokens - self.tokens_left) * WINDOW_SEC / self.tpm)
+            if wait > 0:
+                self.counts["rate_limited"] += 1
+                return wait
+            if self.rpm:
+                self.requests_left -= 1
+            if self.tpm:
+                self.tokens_left -= tokens
+            return None
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text.encode("utf-8")) // 4)
+
+
+def _answer_words(prompt: str, n: int = 40):
+    words = prompt.split()[-200:] or ["ok"]
+    rng = random.Random(len(prompt))
+    return [rng.choice(words) for _ in range(n)]
+
+
+def make_handler(state: MockGroqState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _json(self, status: int, body: dict, headers=None):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            if self.path != CHAT_PATH:
+                self._json(404, {"error": {"message": "not found"}})
+                return
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            prompt = "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+            prompt_tokens = _estimate_tokens(prompt)
+            words = _answer_words(prompt)
+            completion_tokens = len(words)
+
+            retry_after = state.admit(prompt_tokens + completion_tokens)
+            if retry_after is not None:
+                self._json(
+                    429,
+                    {"error": {
+                        "message": f"Rate limit reached for model `{body.get('model')}`. Please try again in {retry_after:.2f}s.",
+                        "type": "tokens",
+                        "code": "rate_limit_exceeded",
+                    }},
+                    {"retry-after": f"{retry_after:.2f}", "x-ratelimit-limit-requests": str(state.rpm)},
+                )
+                return
+            with state.lock:
+                failed = state.random.random() < state.error_rate
+                if failed:
+                    state.counts["server_error"] += 1
+            if failed:
+                self._json(503, {"error": {"message": "Service Unavailable", "type": "internal_server_error"}})
+                return
+
+            time.sleep(state.latency)
+            completion_id = "chatcmpl-" + uuid.uuid4().hex[:12]
+            usage = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            }
+            base = {"id": completion_id, "created": int(time.time()), "model": body.get("model")}
+            with state.lock:
+                state.counts["ok"] += 1
+
+            if not body.get("stream"):
+                self._json(200, {
+                    **base,
+                    "object": "chat.completion",
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": " ".join(words)},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": usage,
+                })
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            def send(payload):
+                data = f"data: {payload}\n\n".encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            for i, word in enumerate(words):
+                delta = {"role": "assistant", "content": ""} if i == 0 else {}
+                delta["content"] = word if i == 0 else " " + word
+                send(json.dumps({**base, "object": "chat.completion.chunk",
+                                 "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}))
+                if state.tokens_per_sec:
+                    time.sleep(1.0 / state.tokens_per_sec)
+            send(json.dumps({**base, "object": "chat.completion.chunk",
+                             "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                             "x_groq": {"id": completion_id, "usage": usage}}))
+            send("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+
+    return Handler
+
+
+def start_mock_server(
+    port: int = 0,
+    rpm: int = 30,
+    tpm: int = 6000,
+    latency: float = 0.2,
+    tokens_per_sec: float = 200.0,
+    error_rate: float = 0.0,
+    seed: int = 0,
+):
+    """Chạy server ở thread nền. Trả về (server, base_url); server.state chứa bộ đếm."""
+    state = MockGroqState(rpm, tpm, latency, tokens_per_sec, error_rate, seed)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    server.daemon_threads = True
+    server.state = state
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--rpm", type=int, default=30, help="requests/phút (0 = không giới hạn)")
+    parser.add_argument("--tpm", type=int, default=6000, help="tokens/phút (0 = không giới hạn)")
+    parser.add_argument("--latency", type=float, default=0.2, help="giây trước token đầu tiên")
+    parser.add_argument("--tokens-per-sec", type=float, default=200.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="tỉ lệ trả lỗi 503")
+    args = parser.parse_args()
+
+    server, base_url = start_mock_server(args.port, args.rpm, args.tpm, args.latency, args.tokens_per_sec, args.error_rate)
+    print(f"Mock Groq: {base_url}{CHAT_PATH}", flush=True)
+    try:
+        while True:
+            time.sleep(5)
+            print(json.dumps(server.state.counts), flush=True)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
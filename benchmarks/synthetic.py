@@ -0,0 +1,92 @@
+"""
+Dữ liệu bài giảng tổng hợp cho benchmark (tạo offline, không cần mạng / TTS):
+- audio: các đoạn "nói" (tone + noise) xen kẽ khoảng lặng
+- video MP4: audio trên ghép với hình nền đen, mã hoá bằng ffmpeg
+- segment kiểu Whisper: câu tiếng Việt có thuật ngữ ML (kể cả lỗi nghe nhầm
+  mà clean_transcript() phải sửa)
+Cùng seed -> cùng dữ liệu, để kết quả giữa các lần chạy so sánh được.
+"""
+import os
+import subprocess
+import wave
+
+import numpy as np
+
+from src.video_processor import SAMPLE_RATE, _ffmpeg_exe
+
+_WORDS = [
+    "hôm nay", "chúng ta", "sẽ", "tìm hiểu", "về", "mạng neural", "hàm", "đạo hàm",
+    "gradient", "descent", "learning rate", "trọng số", "theta", "cross entropy",
+    "ma trận", "vector", "dữ liệu", "huấn luyện", "mô hình", "tối ưu", "và", "là",
+    "logistic", "regression", "softmax", "batch", "epoch", "overfitting",
+]
+# các cách nghe nhầm Whisper hay gặp (xem REPLACEMENTS trong clean_transcript)
+_MISHEARD = ["lót sít", "gradiền", "thê ta", "crox entơpi", "đạo hảm", "logit stick"]
+
+
+def synthetic_audio(minutes: float, seed: int = 0) -> np.ndarray:
+    """Các đoạn 'nói' (tone + noise) 5-20s xen kẽ khoảng lặng 0.5-3s."""
+    rng = np.random.default_rng(seed)
+    total = int(minutes * 60 * SAMPLE_RATE)
+    audio = np.zeros(total, dtype=np.float32)
+    pos = 0
+    while pos < total:
+        speech = int(rng.uniform(5, 20) * SAMPLE_RATE)
+        end = min(pos + speech, total)
+        t = np.arange(end - pos) / SAMPLE_RATE
+        audio[pos:end] = 0.1 * np.sin(2 * np.pi * rng.uniform(120, 300) * t) + 0.05 * rng.standard_normal(end - pos)
+        pos = end + int(rng.uniform(0.5, 3.0) * SAMPLE_RATE)
+    return audio
+
+
+def write_wav(path: str, audio: np.ndarray):
+    pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2")
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(pcm.tobytes())
+
+
+def make_lecture_mp4(path: str, minutes: float, seed: int = 0) -> str:
+    """
+    Tạo video bài giảng tổng hợp dài `minutes` phút (H.264 320x240 @ 5 fps + AAC).
+    File đã tồn tại thì dùng lại.
+    """
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    wav_path = path + ".wav"
+    write_wav(wav_path, synthetic_audio(minutes, seed))
+    cmd = [
+        _ffmpeg_exe(), "-nostdin", "-v", "error", "-y",
+        "-f", "lavfi", "-i", f"color=c=black:s=320x240:r=5:d={minutes * 60}",
+        "-i", wav_path,
+        "-c:v", "libx264", "-preset", "ultrafast", "-tune", "stillimage",
+        "-c:a", "aac", "-b:a", "64k", "-shortest",
+        path,
+    ]
+    try:
+        subprocess.run(cmd, check=True, capture_output=True)
+    finally:
+        os.remove(wav_path)
+    return path
+
+
+def synthetic_segments(minutes: float, seed: int = 0):
+    """Segment kiểu Whisper (start/end/text) phủ `minutes` phút, mỗi câu 2-8 giây."""
+    rng = np.random.default_rng(seed)
+    segments = []
+    t = 0.0
+    total = minutes * 60
+    while t < total:
+        n_words = int(rng.integers(6, 20))
+        words = list(rng.choice(_WORDS, size=n_words))
+        if rng.random() < 0.3:
+            words.insert(int(rng.integers(0, n_words)), str(rng.choice(_MISHEARD)))
+        # khoảng trắng / dấu câu lộn xộn như output thô của Whisper
+        text = " " + "  ".join(words) + " ." if rng.random() < 0.5 else " " + " ".join(words) + ","
+        duration = float(rng.uniform(2.0, 8.0))
+        segments.append({"start": round(t, 2), "end": round(min(t + duration, total), 2), "text": text})
+        t += duration + float(rng.uniform(0.0, 1.0))
+    return segments
@@ -0,0 +1,204 @@
+"""
+Xử lý hàng loạt bài giảng từ dòng lệnh (không cần mở app Streamlit).
+
+Chạy từ thư mục gốc của project:
+    python ingest.py lectures/ --jobs 3 --model small
+    python ingest.py --manifest lectures.jsonl --reporter jsonl > ingest.log
+    python ingest.py lectures/ --engine faster-whisper   # CTranslate2 int8, cần `pip install faster-whisper`
+
+Manifest: mỗi dòng một đường dẫn video, hoặc JSON {"path": ..., "name": ...}
+(name = tên bài giảng trong index, mặc định là tên file). Dòng bắt đầu bằng # bị bỏ qua.
+Các file khác nhau trùng tên (vd. week1/lec01.mp4 và week2/lec01.mp4) được đặt tên
+theo đường dẫn: week1__lec01.mp4, week2__lec01.mp4.
+
+Nhiều video được xử lý cùng lúc (--jobs): trong khi một video đang phiên âm,
+các video khác được tách âm thanh / embedding. Tất cả ghi vào cùng vector store
+mà app dùng; video được link vào temp/ để app phát lại được.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from src.reporter import REPORTERS, use_reporter, get_reporter
+from src.ingest_pipeline import ingest_video, make_stage_limits, store_video_file
+from src.vector_store_builder import list_videos
+from src.whisper_registry import WHISPER_MODEL_SIZES, DEFAULT_WHISPER_MODEL
+from src.transcription_engine import TRANSCRIBE_ENGINES, TRANSCRIBE_ENGINE
+from src.parallel_transcriber import default_workers
+
+VIDEO_EXTENSIONS = (".mp4", ".mkv", ".webm", ".mov", ".avi", ".m4a", ".mp3", ".wav")
+
+
+def collect_inputs(paths, manifest: str | None = None, recursive: bool = False):
+    """
+    Danh sách (đường dẫn, tên bài giảng) từ các file / thư mục và manifest.
+    Tên mặc định là tên file; các file khác nhau trùng tên file được đặt tên theo
+    đường dẫn (xem _path_names). Hai file khác nhau cùng tên ghi trong manifest -> ValueError.
+    """
+    items = []   # (đường dẫn, tên ghi trong manifest hoặc None)
+    for path in paths:
+        if os.path.isdir(path):
+            walker = os.walk(path) if recursive else [(path, [], os.listdir(path))]
+            for root, _, files in walker:
+                for name in sorted(files):
+                    if name.lower().endswith(VIDEO_EXTENSIONS):
+                        items.append((os.path.join(root, name), None))
+        else:
+            items.append((path, None))
+
+    if manifest:
+        base_dir = os.path.dirname(os.path.abspath(manifest))
+        with open(manifest, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                if line.startswith("{"):
+                    entry = json.loads(line)
+                    path, name = entry["path"], entry.get("name")
+                else:
+                    path, name = line, None
+                path = os.path.join(base_dir, path)   # đường dẫn tương đối tính từ manifest
+                items.append((path, name))
+
+    # bỏ trùng: cùng một file được liệt kê nhiều lần -> giữ lần xuất hiện đầu
+    seen = set()
+    unique = []
+    for path, name in items:
+        key = os.path.realpath(path)
+        if key not in seen:
+            seen.add(key)
+            unique.append((path, name))
+
+    # file khác nhau cùng tên file -> đặt tên theo đường dẫn (tên trong manifest giữ nguyên)
+    by_basename = {}
+    for path, name in unique:
+        if name is None:
+            by_basename.setdefault(os.path.basename(path), []).append(path)
+    renamed = {}
+    for group in by_basename.values():
+        if len(group) > 1:
+            renamed.update(_path_names(group))
+    if renamed:
+        get_reporter().warning(
+            "Các file trùng tên được đặt tên theo đường dẫn: "
+            + ", ".join(f"{path} -> {name}" for path, name in renamed.items())
+        )
+
+    result = []
+    owner = {}
+    for path, name in unique:
+        name = name or renamed.get(path) or os.path.basename(path)
+        if name in owner:
+            raise ValueError(f"Hai file khác nhau cùng tên bài giảng {name!r}: {owner[name]} và {path}")
+        owner[name] = path
+        result.append((path, name))
+    return result
+
+
+def _path_names(paths):
+    """
+    Tên bài giảng cho các file trùng tên file: đường dẫn tính từ thư mục cha chung,
+    "/" thay bằng "__" (tên bài giảng cũng là tên file trong temp/).
+    """
+    abs_paths = [os.path.abspath(path) for path in paths]
+    base = os.path.commonpath([os.path.dirname(path) for path in abs_paths])
+    return {
+        path: os.path.relpath(abs_path, base).replace(os.sep, "__")
+        for path, abs_path in zip(paths, abs_paths)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="file video hoặc thư mục chứa video")
+    parser.add_argument("--manifest", help="file danh sách video (.txt hoặc .jsonl)")
+    parser.add_argument("--recursive", action="store_true", help="tìm video trong cả thư mục con")
+    parser.add_argument("--model", default=DEFAULT_WHISPER_MODEL, choices=WHISPER_MODEL_SIZES)
+    parser.add_argument("--engine", default=TRANSCRIBE_ENGINE, choices=TRANSCRIBE_ENGINES,
+                        help="engine phiên âm (mặc định theo TRANSCRIBE_ENGINE)")
+    parser.add_argument("--jobs", type=int, default=3, help="số video xử lý cùng lúc")
+    parser.add_argument("--decode-jobs", type=int, default=2, help="số video tách âm thanh cùng lúc")
+    parser.add_argument("--transcribe-jobs", type=int, default=1,
+                        help="số video phiên âm cùng lúc (engine whisper: cần --whisper-workers > 1)")
+    parser.add_argument("--whisper-workers", type=int, default=None,
+                        help="số process phiên âm cho mỗi video (mặc định theo WHISPER_PARALLEL_WORKERS)")
+    parser.add_argument("--reporter", default="console", choices=["console", "jsonl"])
+    parser.add_argument("--skip-existing", action="store_true", help="bỏ qua video đã có trong index")
+    parser.add_argument("--no-link", action="store_true", help="không đưa video vào temp/ để phát lại")
+    parser.add_argument("--progressive", action=argparse.BooleanOptionalAction, default=None,
+                        help="index dần trong lúc phiên âm (mặc định theo INGEST_PROGRESSIVE)")
+    args = parser.parse_args()
+
+    # engine whisper trong cùng process chỉ có một model, không phiên âm song song được;
+    # --whisper-workers > 1 thì mỗi video dùng process worker riêng (model riêng)
+    whisper_workers = args.whisper_workers if args.whisper_workers is not None else default_workers()
+    if args.engine == "whisper" and args.transcribe_jobs > 1 and whisper_workers <= 1:
+        parser.error("--transcribe-jobs > 1 với engine whisper cần --whisper-workers > 1 hoặc --engine faster-whisper")
+
+    reporter_cls = REPORTERS[args.reporter]
+    main_reporter = reporter_cls()
+
+    try:
+        with use_reporter(main_reporter):
+            items = collect_inputs(args.paths, args.manifest, args.recursive)
+    except ValueError as e:
+        parser.error(str(e))
+    if not items:
+        parser.error("không tìm thấy video nào")
+
+    if args.skip_existing:
+        existing = set(list_videos())
+        skipped = [name for _, name in items if name in existing]
+        items = [(path, name) for path, name in items if name not in existing]
+        if skipped:
+            main_reporter.info(f"Bỏ qua {len(skipped)} video đã có trong index.")
+
+    limits = make_stage_limits(decode=args.decode_jobs, transcribe=args.transcribe_jobs)
+
+    def run_one(path: str, name: str):
+        with use_reporter(reporter_cls(name)) as reporter:
+            try:
+                if not os.path.exists(path):
+                    reporter.error(f"Không tìm thấy file: {path}")
+                    return None
+                if not args.no_link:
+                    path = store_video_file(path, name)
+                return ingest_video(path, video_name=name, model_size=args.model,
+                                    workers=args.whisper_workers, limits=limits, progressive=args.progressive,
+                                    engine=args.engine)
+            except Exception as e:
+                reporter.error(f"Lỗi khi xử lý video: {e}")
+                return None
+
+    main_reporter.info(f"Bắt đầu xử lý {len(items)} video ({args.jobs} video cùng lúc, model {args.model}, engine {args.engine}).")
+    t0 = time.perf_counter()
+    done, failed = [], []
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs), thread_name_prefix="ingest") as pool:
+        futures = {pool.submit(run_one, path, name): name for path, name in items}
+        for future in as_completed(futures):
+            result = future.result()
+            if result is None:
+                failed.append(futures[future])
+            else:
+                done.append(result)
+            main_reporter.progress(
+                100 * (len(done) + len(failed)) // len(items),
+                f"{len(done) + len(failed)}/{len(items)} video",
+            )
+
+    elapsed = time.perf_counter() - t0
+    main_reporter.success(
+        f"Xong {len(done)}/{len(items)} video trong {elapsed / 60:.1f} phút "
+        f"({sum(r['chunks'] for r in done)} đoạn, {sum(r['cached'] for r in done)} video lấy từ cache)."
+    )
+    if failed:
+        main_reporter.error("Lỗi: " + ", ".join(sorted(failed)))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
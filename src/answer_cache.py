@@ -0,0 +1,264 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.documents import Document
+
+from src.resource_cache import get_embeddings, EMBEDDING_MODEL_NAME
+
+# ====== CACHE CÂU TRẢ LỜI THEO NGỮ NGHĨA ======
+# Sinh viên cùng lớp hay hỏi lại cùng một câu (hoặc gần giống). Câu hỏi mới có
+# embedding đủ gần (cosine >= ngưỡng) với câu đã hỏi -> trả lại ngay câu trả lời
+# và nguồn đã lưu, không cần tìm kiếm + gọi Groq nữa.
+# Cache được chia theo "scope" = (phiên bản index, model LLM, bài giảng được chọn),
+# nên build lại index hay đổi model thì không dùng lại câu trả lời cũ.
+# Lưu xuống đĩa (ANSWER_CACHE_PATH) dạng JSONL: mỗi câu trả lời mới ghi nối một dòng,
+# file chỉ được ghi lại toàn bộ (compact) khi số dòng vượt COMPACT_FACTOR * MAX_ENTRIES;
+# việc ghi file không giữ lock mà lookup() cần.
+
+SIMILARITY_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+TTL_SEC = float(os.getenv("ANSWER_CACHE_TTL_SEC", "86400"))
+MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+# để trống = chỉ giữ trong bộ nhớ
+PERSIST_PATH = os.getenv("ANSWER_CACHE_PATH", "")
+# file có quá COMPACT_FACTOR * max_entries dòng (entry đã bị bỏ vẫn còn trong file) -> ghi lại
+COMPACT_FACTOR = 2
+
+QUERY_EMBEDDING_CACHE_SIZE = 4096
+
+_query_lock = threading.Lock()
+_query_embeddings: "OrderedDict[tuple, list]" = OrderedDict()
+
+
+def _normalize_question(question: str) -> str:
+    return " ".join(question.lower().split())
+
+
+def embed_query(question: str, model_name: str = EMBEDDING_MODEL_NAME) -> list:
+    """Embedding của câu hỏi, có nhớ (một câu hỏi không bao giờ bị embed 2 lần)."""
+    key = (model_name, _normalize_question(question))
+    with _query_lock:
+        vec = _query_embeddings.get(key)
+        if vec is not None:
+            _query_embeddings.move_to_end(key)
+            return vec
+
+    vec = get_embeddings(model_name).embed_query(question)
+
+    with _query_lock:
+        _query_embeddings[key] = vec
+        while len(_query_embeddings) > QUERY_EMBEDDING_CACHE_SIZE:
+            _query_embeddings.popitem(last=False)
+    return vec
+
+
+def embed_queries(questions, model_name: str = EMBEDDING_MODEL_NAME) -> list:
+    """Như embed_query() cho nhiều câu hỏi: các câu chưa có trong cache được embed trong một lần gọi model."""
+    keys = [(model_name, _normalize_question(q)) for q in questions]
+    vecs = [None] * len(keys)
+    with _query_lock:
+        for i, key in enumerate(keys):
+            vecs[i] = _query_embeddings.get(key)
+
+    missing = {}
+    for i, key in enumerate(keys):
+        if vecs[i] is None:
+            missing.setdefault(key, []).append(i)
+    if missing:
+        texts = [questions[idxs[0]] for idxs in missing.values()]
+        new_vecs = get_embeddings(model_name).embed_documents(texts)
+        with _query_lock:
+            for (key, idxs), vec in zip(missing.items(), new_vecs):
+                for i in idxs:
+                    vecs[i] = vec
+                _query_embeddings[key] = vec
+            while len(_query_embeddings) > QUERY_EMBEDDING_CACHE_SIZE:
+                _query_embeddings.popitem(last=False)
+    return vecs
+
+
+def make_scope(index_version, model_id: str, video_names=None) -> str:
+    """Key của scope: câu trả lời chỉ dùng lại trong cùng index + model + bộ lọc bài giảng."""
+    payload = json.dumps(
+        {"index": repr(index_version), "model": model_id, "videos": sorted(video_names or [])},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _unit(vec) -> np.ndarray:
+    vec = np.asarray(vec, dtype=np.float32)
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm > 0 else vec
+
+
+class SemanticAnswerCache:
+    """Cache câu trả lời với TTL + LRU, lưu xuống đĩa (JSON) nếu có `persist_path`."""
+
+    def __init__(
+        self,
+        threshold: float = SIMILARITY_THRESHOLD,
+        ttl_sec: float = TTL_SEC,
+        max_entries: int = MAX_ENTRIES,
+        persist_path: str = PERSIST_PATH,
+    ):
+        self.threshold = threshold
+        self.ttl_sec = ttl_sec
+        self.max_entries = max_entries
+        self.persist_path = persist_path
+        self._lock = threading.Lock()
+        # ghi file: lock riêng, không chặn lookup() trong lúc ghi
+        self._file_lock = threading.Lock()
+        self._file_lines = 0
+        self._entries: "OrderedDict[int, dict]" = OrderedDict()
+        self._next_id = 0
+        self.counters = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+        if persist_path:
+            self._load()
+
+    # ----- tra cứu / thêm -----
+    def lookup(self, scope: str, query_vec):
+        """Trả về {"question", "answer", "sources", "similarity"} nếu có câu đủ giống, ngược lại None."""
+        q = _unit(query_vec)
+        now = time.time()
+        with self._lock:
+            best_id, best_sim = None, -1.0
+            for entry_id, entry in list(self._entries.items()):
+                if now - entry["created"] > self.ttl_sec:
+                    del self._entries[entry_id]
+                    self.counters["expired"] += 1
+                    continue
+                if entry["scope"] != scope:
+                    continue
+                sim = float(np.dot(q, entry["vector"]))
+                if sim > best_sim:
+                    best_id, best_sim = entry_id, sim
+
+            if best_id is None or best_sim < self.threshold:
+                self.counters["misses"] += 1
+                return None
+
+            self._entries.move_to_end(best_id)
+            self.counters["hits"] += 1
+            entry = self._entries[best_id]
+            return {
+                "question": entry["question"],
+                "answer": entry["answer"],
+                "sources": [Document(page_content=s["page_content"], metadata=s["metadata"]) for s in entry["sources"]],
+                "similarity": best_sim,
+            }
+
+    def put(self, scope: str, question: str, query_vec, answer: str, sources):
+        entry = {
+            "scope": scope,
+            "question": question,
+            "vector": _unit(query_vec),
+            "answer": answer,
+            "sources": [{"page_content": d.page_content, "metadata": dict(d.metadata)} for d in sources],
+            "created": time.time(),
+        }
+        with self._lock:
+            self._entries[self._next_id] = entry
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counters["evictions"] += 1
+        if self.persist_path:
+            self._persist(entry)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.counters["hits"] + self.counters["misses"]
+            return dict(
+                self.counters,
+                entries=len(self._entries),
+                hit_rate=self.counters["hits"] / total if total else 0.0,
+            )
+
+    # ----- lưu / đọc file -----
+    @staticmethod
+    def _record(entry: dict) -> str:
+        return json.dumps(dict(entry, vector=entry["vector"].tolist()), ensure_ascii=False)
+
+    def _persist(self, entry: dict):
+        """Ghi nối một entry; file quá dài thì ghi lại chỉ các entry đang giữ."""
+        line = self._record(entry)
+        with self._file_lock:
+            self._file_lines += 1
+            if self._file_lines > COMPACT_FACTOR * self.max_entries:
+                self._compact_file_locked()
+                return
+            os.makedirs(os.path.dirname(os.path.abspath(self.persist_path)), exist_ok=True)
+            with open(self.persist_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def _compact_file_locked(self):
+        with self._lock:
+            entries = list(self._entries.values())
+        tmp_path = self.persist_path + ".tmp"
+        os.makedirs(os.path.dirname(os.path.abspath(self.persist_path)), exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(self._record(entry) + "\n")
+        os.replace(tmp_path, self.persist_path)
+        self._file_lines = len(entries)
+
+    def _load(self):
+        if not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as f:
+                content = f.read()
+        except OSError:
+            return
+        legacy = content.lstrip().startswith("[")
+        if legacy:
+            # bản cũ: cả cache là một mảng JSON
+            try:
+                data = json.loads(content)
+            except ValueError:
+                return
+        else:
+            data = []
+            for line in content.splitlines():
+                try:
+                    data.append(json.loads(line))
+                except ValueError:
+                    continue   # dòng trống / ghi dở
+        self._file_lines = len(data)
+
+        # giữ max_entries entry mới nhất theo thời điểm tạo (ghi nối không giữ lock nên thứ tự
+        # dòng có thể lệch chút ít); compact chạy xen giữa lúc thêm và lúc ghi nối một entry
+        # thì entry đó có 2 dòng
+        kept, seen = [], set()
+        for entry in sorted(data, key=lambda e: e["created"], reverse=True):
+            key = (entry["scope"], entry["question"], entry["created"])
+            if key not in seen:
+                seen.add(key)
+                kept.append(entry)
+            if len(kept) >= self.max_entries:
+                break
+        for entry in reversed(kept):
+            entry["vector"] = np.asarray(entry["vector"], dtype=np.float32)
+            self._entries[self._next_id] = entry
+            self._next_id += 1
+        if legacy:
+            with self._file_lock:
+                self._compact_file_locked()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> SemanticAnswerCache:
+    """Cache câu trả lời dùng chung cho mọi phiên trong process."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SemanticAnswerCache()
+        return _cache
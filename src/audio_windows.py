@@ -0,0 +1,66 @@
+import numpy as np
+
+from src.video_processor import SAMPLE_RATE
+
+# ====== CHIA AUDIO THÀNH CÁC CỬA SỔ TẠI CHỖ IM LẶNG ======
+# Dùng cho phiên âm song song: mỗi cửa sổ được phiên âm độc lập, nên điểm cắt
+# phải rơi vào chỗ im lặng để không cắt đôi một câu nói.
+
+FRAME_SEC = 0.03  # 30 ms / frame
+
+
+def frame_energy_db(audio: np.ndarray, frame_sec: float = FRAME_SEC) -> np.ndarray:
+    """Năng lượng RMS (dB) của từng frame không chồng lấn."""
+    frame_len = max(int(frame_sec * SAMPLE_RATE), 1)
+    n_frames = len(audio) // frame_len
+    if n_frames == 0:
+        return np.zeros(0, dtype=np.float32)
+
+    energies = np.empty(n_frames, dtype=np.float32)
+    # tính theo từng khối để không tạo bản sao float64 của cả file audio
+    block = 10_000
+    for i in range(0, n_frames, block):
+        j = min(i + block, n_frames)
+        frames = np.asarray(audio[i * frame_len: j * frame_len], dtype=np.float32).reshape(j - i, frame_len)
+        energies[i:j] = np.sqrt(np.mean(frames * frames, axis=1))
+    return 20.0 * np.log10(energies + 1e-10)
+
+
+def split_at_silence(
+    audio: np.ndarray,
+    window_sec: float = 300.0,
+    search_sec: float = 30.0,
+    min_silence_sec: float = 0.3,
+):
+    """
+    Chia audio thành các cửa sổ dài khoảng `window_sec` giây.
+    Mỗi điểm cắt được chọn là chỗ yên lặng nhất (năng lượng trung bình trong
+    `min_silence_sec` thấp nhất) trong khoảng ±`search_sec` quanh điểm cắt lý tưởng.
+
+    Trả về list (start_sample, end_sample).
+    """
+    total = len(audio)
+    window = int(window_sec * SAMPLE_RATE)
+    if total <= window * 1.5:
+        return [(0, total)]
+
+    energy = frame_energy_db(audio)
+    frame_len = int(FRAME_SEC * SAMPLE_RATE)
+    smooth = max(int(min_silence_sec / FRAME_SEC), 1)
+    if len(energy) >= smooth:
+        energy = np.convolve(energy, np.ones(smooth) / smooth, mode="same")
+
+    bounds = [0]
+    while total - bounds[-1] > window * 1.5:
+        target = bounds[-1] + window
+        lo = max((target - int(search_sec * SAMPLE_RATE)) // frame_len, 0)
+        hi = min((target + int(search_sec * SAMPLE_RATE)) // frame_len, len(energy))
+        if hi > lo:
+            cut = (lo + int(np.argmin(energy[lo:hi]))) * frame_len
+        else:
+            cut = target
+        # luôn tiến về phía trước
+        bounds.append(max(cut, bounds[-1] + frame_len))
+    bounds.append(total)
+
+    return list(zip(bounds[:-1], bounds[1:]))
@@ -0,0 +1,169 @@
+import os
+import threading
+
+from langchain_core.documents import Document
+
+# ====== ĐÓNG GÓI CONTEXT THEO NGÂN SÁCH TOKEN ======
+# Trước khi ghép prompt:
+# 1. bỏ các đoạn có điểm liên quan quá thấp so với đoạn tốt nhất (theo điểm gốc
+#    của FAISS / BM25, không theo điểm RRF — xem src.retriever)
+# 2. gộp các chunk liền kề của cùng một video thành một đoạn (không lặp header,
+#    timestamp bao trọn cả đoạn)
+# 3. cắt cho vừa ngân sách token của từng model
+# Token được đếm bằng tokenizer cục bộ (tiktoken nếu có), không gọi API.
+
+# ngân sách token cho phần TRANSCRIPT trong prompt, theo model
+MODEL_CONTEXT_BUDGET = {
+    "llama-3.1-8b-instant": 1500,
+    "llama-3.3-70b-versatile": 2500,
+    "openai/gpt-oss-20b": 2500,
+}
+DEFAULT_CONTEXT_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+
+# bỏ đoạn có relevance (điểm gốc / điểm tốt nhất của cùng nguồn) < MIN_SCORE_RATIO
+MIN_SCORE_RATIO = float(os.getenv("CONTEXT_MIN_SCORE_RATIO", "0.5"))
+
+# 2 chunk cùng video cách nhau không quá chừng này giây thì coi là liền kề
+ADJACENT_GAP_SEC = 5.0
+
+# đoạn cuối chỉ được cắt bớt nếu còn ít nhất chừng này token
+MIN_TRUNCATED_TOKENS = 60
+
+_encoder = None
+_encoder_lock = threading.Lock()
+_encoder_failed = False
+
+
+def _get_encoder():
+    global _encoder, _encoder_failed
+    if _encoder is not None or _encoder_failed:
+        return _encoder
+    with _encoder_lock:
+        if _encoder is None and not _encoder_failed:
+            try:
+                import tiktoken
+                _encoder = tiktoken.get_encoding("cl100k_base")
+            except Exception:
+                # không có tiktoken hoặc không tải được bảng BPE -> ước lượng
+                _encoder_failed = True
+    return _encoder
+
+
+def count_tokens(text: str) -> int:
+    """
+    Số token của text. Dùng tiktoken (cl100k_base) nếu có, nếu không thì ước lượng
+    ~4 byte UTF-8 / token (tiếng Việt có dấu tốn nhiều byte hơn tiếng Anh).
+    """
+    encoder = _get_encoder()
+    if encoder is not None:
+        return len(encoder.encode(text))
+    return (len(text.encode("utf-8")) + 3) // 4
+
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cắt text cho vừa max_tokens, dừng ở ranh giới từ."""
+    encoder = _get_encoder()
+    if encoder is not None:
+        text = encoder.decode(encoder.encode(text)[:max_tokens])
+    else:
+        text = text.encode("utf-8")[: max_tokens * 4].decode("utf-8", errors="ignore")
+    cut = text.rfind(" ")
+    if cut > 0:
+        text = text[:cut]
+    return text.rstrip() + " …"
+
+
+def _is_adjacent(prev: Document, doc: Document) -> bool:
+    a, b = prev.metadata, doc.metadata
+    if a.get("video_name") != b.get("video_name"):
+        return False
+    ia, ib = a.get("chunk_index"), b.get("chunk_index")
+    if ia is not None and ib is not None:
+        return abs(int(ia) - int(ib)) == 1
+    if a.get("start") is None or b.get("start") is None:
+        return False
+    return b["start"] <= a["end"] + ADJACENT_GAP_SEC and a["start"] <= b["end"] + ADJACENT_GAP_SEC
+
+
+def _merge_adjacent(scored_docs):
+    """
+    Gộp các chunk liền kề cùng video. Giữ thứ tự theo điểm của chunk tốt nhất
+    trong nhóm. Trả về list (Document, score, số chunk đã gộp).
+    """
+    groups = []   # mỗi nhóm: list (doc, score)
+    for doc, score in scored_docs:
+        for group in groups:
+            if any(_is_adjacent(member, doc) for member, _ in group):
+                group.append((doc, score))
+                break
+        else:
+            groups.append([(doc, score)])
+
+    merged = []
+    for group in groups:
+        best_score = max(score for _, score in group)
+        if len(group) == 1:
+            merged.append((group[0][0], best_score, 1))
+            continue
+        members = sorted(
+            (doc for doc, _ in group),
+            key=lambda d: (d.metadata.get("chunk_index", 0), d.metadata.get("start", 0.0)),
+        )
+        metadata = dict(members[0].metadata)
+        metadata["start"] = min(m.metadata.get("start", 0.0) for m in members)
+        metadata["end"] = max(m.metadata.get("end", 0.0) for m in members)
+        chunk_ids = [m.metadata["chunk_index"] for m in members if m.metadata.get("chunk_index") is not None]
+        if chunk_ids:
+            metadata["merged_chunks"] = chunk_ids
+        content = " ".join(m.page_content.strip() for m in members)
+        merged.append((Document(page_content=content, metadata=metadata), best_score, len(members)))
+
+    merged.sort(key=lambda item: item[1], reverse=True)
+    return merged
+
+
+def pack_context(scored_docs, model_id: str | None = None, budget: int | None = None):
+    """
+    scored_docs: list (Document, score, relevance) đã xếp hạng (score càng cao càng liên quan,
+    relevance trong [0, 1] như hybrid_search() trả về).
+    Trả về (docs, stats):
+    - docs: các đoạn sẽ đưa vào prompt (đã lọc, gộp, cắt)
+    - stats: {"context_tokens", "budget", "dropped_low_score", "merged", "dropped_budget"}
+    """
+    if budget is None:
+        budget = MODEL_CONTEXT_BUDGET.get(model_id, DEFAULT_CONTEXT_BUDGET)
+
+    stats = {"context_tokens": 0, "budget": budget, "dropped_low_score": 0, "merged": 0, "dropped_budget": 0}
+    if not scored_docs:
+        return [], stats
+
+    # 1. lọc theo điểm gốc (đoạn xếp hạng cao nhất luôn được giữ)
+    kept = [
+        (doc, score) for i, (doc, score, relevance) in enumerate(scored_docs)
+        if i == 0 or relevance >= MIN_SCORE_RATIO
+    ]
+    stats["dropped_low_score"] = len(scored_docs) - len(kept)
+
+    # 2. gộp chunk liền kề
+    merged = _merge_adjacent(kept)
+    stats["merged"] = sum(n - 1 for _, _, n in merged)
+
+    # 3. cắt theo ngân sách token
+    packed = []
+    used = 0
+    for doc, _, _ in merged:
+        tokens = count_tokens(doc.page_content)
+        if used + tokens <= budget:
+            packed.append(doc)
+            used += tokens
+            continue
+        remaining = budget - used
+        if remaining >= MIN_TRUNCATED_TOKENS:
+            text = _truncate_to_tokens(doc.page_content, remaining - 1)
+            packed.append(Document(page_content=text, metadata=dict(doc.metadata, truncated=True)))
+            used += count_tokens(text)
+        stats["dropped_budget"] = len(merged) - len(packed)
+        break
+
+    stats["context_tokens"] = used
+    return packed, stats
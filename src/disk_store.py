@@ -0,0 +1,256 @@
+import json
+import os
+import sqlite3
+import threading
+from collections.abc import Mapping
+from contextlib import closing
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.docstore.base import Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from src.index_factory import load_config
+
+# ====== ĐỊNH DẠNG LƯU INDEX TRÊN ĐĨA: FAISS MMAP + SQLITE ======
+# - index.faiss    : vector, được memory-map khi đọc (không đọc cả file vào RAM;
+#                    nhiều process dùng chung qua page cache của hệ điều hành)
+# - docstore.sqlite: text + metadata của từng chunk, đọc lười theo id / vị trí
+# Không còn index.pkl (pickle) -> không cần allow_dangerous_deserialization.
+# File mới được ghi ra file tạm rồi os.replace: process đang đọc vẫn giữ bản cũ
+# (inode cũ) cho tới khi load lại. Riêng khi chỉ nối thêm chunk (append_rows), dòng
+# mới được INSERT thẳng vào docstore.sqlite ở các vị trí sau ntotal của index cũ.
+
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "docstore.sqlite"
+LEGACY_DOCSTORE_FILE = "index.pkl"
+
+_SCHEMA = """
+CREATE TABLE chunks (
+    pos        INTEGER PRIMARY KEY,   -- vị trí vector trong FAISS index
+    id         TEXT NOT NULL UNIQUE,  -- docstore id ("<video>::<chunk_index>")
+    video_name TEXT,
+    text       TEXT NOT NULL,
+    metadata   TEXT NOT NULL          -- JSON (start, end, video_name, chunk_index, ...)
+);
+CREATE INDEX chunks_video ON chunks(video_name);
+"""
+
+
+class SQLiteDocstore(Docstore):
+    """
+    Docstore chỉ đọc trên docstore.sqlite. Connection được mở ngay khi tạo
+    (giữ đúng file của phiên bản index đã load kể cả khi file bị thay thế sau đó)
+    và dùng chung giữa các thread, truy vấn được tuần tự hoá bằng lock.
+    """
+
+    def __init__(self, path: str, ntotal: int | None = None):
+        self.path = path
+        uri = "file:" + os.path.abspath(path) + "?mode=ro"
+        self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        # chỉ thấy các dòng có vector trong index đã load: append_rows() có thể thêm dòng
+        # vào cùng file trong khi process này vẫn đang dùng index cũ
+        self.ntotal = ntotal if ntotal is not None else 2 ** 62
+
+    def _query(self, sql: str, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def search(self, search: str):
+        rows = self._query("SELECT text, metadata FROM chunks WHERE id = ? AND pos < ?", (search, self.ntotal))
+        if not rows:
+            return f"ID {search} not found."
+        text, metadata = rows[0]
+        return Document(page_content=text, metadata=json.loads(metadata), id=search)
+
+    def add(self, texts):
+        raise NotImplementedError("SQLiteDocstore chỉ đọc, hãy sửa index qua vector_store_builder.")
+
+    def delete(self, ids):
+        raise NotImplementedError("SQLiteDocstore chỉ đọc, hãy sửa index qua vector_store_builder.")
+
+    def video_names(self):
+        rows = self._query(
+            "SELECT DISTINCT video_name FROM chunks WHERE video_name IS NOT NULL AND pos < ?", (self.ntotal,)
+        )
+        return sorted(r[0] for r in rows if r[0])
+
+    def positions_of_videos(self, video_names) -> np.ndarray:
+        """Vị trí (trong FAISS index) của mọi chunk thuộc các bài giảng `video_names`."""
+        names = list(video_names)
+        placeholders = ",".join("?" * len(names))
+        rows = self._query(
+            f"SELECT pos FROM chunks WHERE video_name IN ({placeholders}) AND pos < ?", names + [self.ntotal]
+        )
+        return np.asarray([r[0] for r in rows], dtype=np.int64)
+
+    def __len__(self):
+        return self._query("SELECT COUNT(*) FROM chunks WHERE pos < ?", (self.ntotal,))[0][0]
+
+
+class PositionMap(Mapping):
+    """index_to_docstore_id (vị trí -> id) đọc lười từ SQLite thay vì dict trong RAM."""
+
+    def __init__(self, docstore: SQLiteDocstore):
+        self.docstore = docstore
+
+    def __getitem__(self, pos):
+        if not 0 <= int(pos) < self.docstore.ntotal:
+            raise KeyError(pos)
+        rows = self.docstore._query("SELECT id FROM chunks WHERE pos = ?", (int(pos),))
+        if not rows:
+            raise KeyError(pos)
+        return rows[0][0]
+
+    def __iter__(self):
+        rows = self.docstore._query("SELECT pos FROM chunks WHERE pos < ? ORDER BY pos", (self.docstore.ntotal,))
+        return iter([r[0] for r in rows])
+
+    def __len__(self):
+        return len(self.docstore)
+
+    def items(self):
+        return self.docstore._query("SELECT pos, id FROM chunks WHERE pos < ? ORDER BY pos", (self.docstore.ntotal,))
+
+    def values(self):
+        return [r[0] for r in self.docstore._query(
+            "SELECT id FROM chunks WHERE pos < ? ORDER BY pos", (self.docstore.ntotal,)
+        )]
+
+
+def has_store(index_dir: str) -> bool:
+    return os.path.exists(os.path.join(index_dir, INDEX_FILE)) and os.path.exists(os.path.join(index_dir, DOCSTORE_FILE))
+
+
+def _read_index(path: str, kind: str | None, mmap: bool):
+    if not mmap:
+        return faiss.read_index(path)
+    # flat / hnsw: mmap mảng vector; ivf: mmap inverted lists
+    flags = faiss.IO_FLAG_MMAP if kind == "ivfpq" else faiss.IO_FLAG_MMAP_IFC
+    try:
+        return faiss.read_index(path, flags | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        return faiss.read_index(path)
+
+
+def load_store(index_dir: str, embeddings, mmap: bool = True):
+    """
+    Mở index để ĐỌC: vector được mmap, text / metadata lấy lười từ SQLite.
+    Trả về None nếu chưa có index ở định dạng mới.
+    """
+    if not has_store(index_dir):
+        return None
+    kind = (load_config(index_dir) or {}).get("active_type")
+    index = _read_index(os.path.join(index_dir, INDEX_FILE), kind, mmap)
+    docstore = SQLiteDocstore(os.path.join(index_dir, DOCSTORE_FILE), int(index.ntotal))
+    return FAISS(embeddings, index, docstore, PositionMap(docstore))
+
+
+def load_store_for_write(index_dir: str, embeddings):
+    """Load toàn bộ index vào RAM (bản riêng, sửa được bằng API của langchain)."""
+    if not has_store(index_dir):
+        return None
+    index = faiss.read_index(os.path.join(index_dir, INDEX_FILE))
+    conn = sqlite3.connect(os.path.join(index_dir, DOCSTORE_FILE))
+    try:
+        docs = {}
+        mapping = {}
+        # dòng có pos >= ntotal: append_rows() ghi xong nhưng index chưa kịp ghi -> bỏ qua
+        rows = conn.execute(
+            "SELECT pos, id, text, metadata FROM chunks WHERE pos < ? ORDER BY pos", (int(index.ntotal),)
+        )
+        for pos, doc_id, text, metadata in rows:
+            docs[doc_id] = Document(page_content=text, metadata=json.loads(metadata), id=doc_id)
+            mapping[pos] = doc_id
+    finally:
+        conn.close()
+    return FAISS(embeddings, index, InMemoryDocstore(docs), mapping)
+
+
+def read_index_for_write(index_dir: str):
+    """Đọc FAISS index vào RAM (không mmap) để thêm vector. None nếu chưa có index."""
+    if not has_store(index_dir):
+        return None
+    return faiss.read_index(os.path.join(index_dir, INDEX_FILE))
+
+
+def write_index(index, index_dir: str):
+    """Ghi index.faiss (qua file tạm, thay thế nguyên tử)."""
+    index_path = os.path.join(index_dir, INDEX_FILE)
+    tmp_index = index_path + ".tmp"
+    faiss.write_index(index, tmp_index)
+    os.replace(tmp_index, index_path)
+
+
+def video_row_count(index_dir: str, video_name: str) -> int:
+    """Số chunk của bài giảng `video_name` trong docstore.sqlite."""
+    if not has_store(index_dir):
+        return 0
+    with closing(sqlite3.connect(os.path.join(index_dir, DOCSTORE_FILE))) as conn:
+        return conn.execute("SELECT COUNT(*) FROM chunks WHERE video_name = ?", (video_name,)).fetchone()[0]
+
+
+def append_rows(index_dir: str, start_pos: int, ids, texts, metadatas):
+    """
+    Thêm chunk vào docstore.sqlite ngay trên file (không ghi lại cả docstore), ở các vị trí
+    start_pos, start_pos + 1, ... Gọi TRƯỚC khi ghi index có các vector tương ứng: process
+    đọc index cũ không bao giờ tra tới vị trí >= ntotal của nó.
+    """
+    rows = [
+        (start_pos + i, doc_id, md.get("video_name"), text, json.dumps(md, ensure_ascii=False))
+        for i, (doc_id, text, md) in enumerate(zip(ids, texts, metadatas))
+    ]
+    with closing(sqlite3.connect(os.path.join(index_dir, DOCSTORE_FILE))) as conn:
+        # dòng thừa của lần append trước bị dừng giữa chừng (index không có vector tương ứng)
+        conn.execute("DELETE FROM chunks WHERE pos >= ?", (int(start_pos),))
+        conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?, ?)", rows)
+        conn.commit()
+
+
+def save_store(vector_store, index_dir: str):
+    """Ghi index.faiss + docstore.sqlite (qua file tạm, thay thế nguyên tử)."""
+    os.makedirs(index_dir, exist_ok=True)
+    index_path = os.path.join(index_dir, INDEX_FILE)
+    db_path = os.path.join(index_dir, DOCSTORE_FILE)
+
+    tmp_db = db_path + ".tmp"
+    if os.path.exists(tmp_db):
+        os.remove(tmp_db)
+    conn = sqlite3.connect(tmp_db)
+    try:
+        conn.executescript(_SCHEMA)
+        rows = []
+        for pos, doc_id in sorted(vector_store.index_to_docstore_id.items()):
+            doc = vector_store.docstore.search(doc_id)
+            if not isinstance(doc, Document):
+                continue
+            rows.append((
+                int(pos), doc_id, doc.metadata.get("video_name"),
+                doc.page_content, json.dumps(doc.metadata, ensure_ascii=False),
+            ))
+        conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?, ?)", rows)
+        conn.commit()
+    finally:
+        conn.close()
+
+    tmp_index = index_path + ".tmp"
+    faiss.write_index(vector_store.index, tmp_index)
+
+    # docstore trước, index sau: phiên bản index (resource_cache) đổi khi cả hai đã xong
+    os.replace(tmp_db, db_path)
+    os.replace(tmp_index, index_path)
+
+
+def migrate_legacy(index_dir: str, embeddings) -> bool:
+    """
+    Chuyển index cũ (index.faiss + index.pkl của langchain) sang định dạng mới.
+    Chỉ đọc pickle một lần, với file do chính app này ghi ra. File cũ được giữ nguyên.
+    """
+    if has_store(index_dir) or not os.path.exists(os.path.join(index_dir, LEGACY_DOCSTORE_FILE)):
+        return False
+    legacy = FAISS.load_local(index_dir, embeddings, allow_dangerous_deserialization=True)
+    save_store(legacy, index_dir)
+    return True
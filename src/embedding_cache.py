@@ -0,0 +1,204 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+from src.resource_cache import get_embeddings, EMBEDDING_MODEL_NAME
+from src.embedding_engine import engine_fingerprint
+from src.telemetry import inc
+
+# ====== CACHE EMBEDDING THEO NỘI DUNG CHUNK ======
+# Đổi rule làm sạch, đổi max_chars hay build lại index thì phần lớn chunk vẫn giống
+# hệt lần trước -> lấy lại vector đã tính thay vì gọi model.
+# Key = (model + backend embedding, sha256 của text đã chuẩn hoá khoảng trắng).
+# Mỗi model có một thư mục cache/embeddings/<id>/:
+#   vectors.f32  -> mảng float32 (n, dim) ghi nối đuôi, đọc bằng np.memmap
+#   rows.sqlite  -> hash -> số thứ tự dòng trong vectors.f32
+#   meta.json    -> tên model, số chiều
+# Ghi được tuần tự hoá bằng transaction của SQLite nên nhiều process (app, CLI)
+# dùng chung một cache được.
+
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", os.path.join("cache", "embeddings"))
+# số chunk mỗi lần gọi model (để báo tiến độ)
+EMBED_BATCH_SIZE = 64
+
+_SQL_BATCH = 500
+
+_lock = threading.Lock()
+_caches: dict = {}   # fingerprint -> EmbeddingCache
+
+
+def text_hash(text: str) -> str:
+    """Hash của chunk sau khi gộp khoảng trắng (khác nhau chỉ ở khoảng trắng -> cùng vector)."""
+    normalized = " ".join(text.split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:32]
+
+
+class EmbeddingCache:
+    """Cache vector của một model embedding (xem đầu file)."""
+
+    def __init__(self, directory: str, fingerprint: str):
+        self.directory = directory
+        self.fingerprint = fingerprint
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.meta_path = os.path.join(directory, "meta.json")
+        os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(os.path.join(directory, "rows.sqlite"), check_same_thread=False, timeout=60)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS rows (hash TEXT PRIMARY KEY, row INTEGER NOT NULL)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self._dim = None
+        self._mmap = None
+
+    @property
+    def dim(self):
+        if self._dim is None and os.path.exists(self.meta_path):
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                self._dim = int(json.load(f)["dim"])
+        return self._dim
+
+    def _rows_on_disk(self) -> int:
+        try:
+            return os.path.getsize(self.vectors_path) // (4 * self.dim)
+        except OSError:
+            return 0
+
+    def _vectors(self, max_row: int):
+        """memmap của vectors.f32, map lại khi file đã dài thêm (process khác vừa ghi)."""
+        if self._mmap is None or max_row >= len(self._mmap):
+            rows = self._rows_on_disk()
+            self._mmap = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim)) if rows else None
+        return self._mmap
+
+    def _rows_of(self, hashes):
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        for i in range(0, len(unique), _SQL_BATCH):
+            part = unique[i:i + _SQL_BATCH]
+            placeholders = ",".join("?" * len(part))
+            found.update(self._conn.execute(f"SELECT hash, row FROM rows WHERE hash IN ({placeholders})", part))
+        return found
+
+    def lookup(self, texts):
+        """
+        Tra vector của `texts`.
+        Trả về (vectors, missing): vectors là mảng (n, dim) — dòng của text chưa có
+        trong cache bằng 0 — và missing là list chỉ số các text chưa có.
+        vectors=None nếu cache còn rỗng.
+        """
+        hashes = [text_hash(t) for t in texts]
+        with self._lock:
+            if self.dim is None:
+                return None, list(range(len(texts)))
+            rows = self._rows_of(hashes)
+            vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+            missing = []
+            mmap = self._vectors(max(rows.values(), default=-1))
+            for i, h in enumerate(hashes):
+                row = rows.get(h)
+                if row is None or mmap is None or row >= len(mmap):
+                    missing.append(i)
+                else:
+                    vectors[i] = mmap[row]
+        return vectors, missing
+
+    def add(self, texts, vectors):
+        """Ghi thêm vector của `texts` (text đã có trong cache thì bỏ qua)."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if not len(texts):
+            return
+        with self._lock:
+            if self.dim is None:
+                tmp_path = self.meta_path + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump({"model": self.fingerprint, "dim": int(vectors.shape[1])}, f)
+                os.replace(tmp_path, self.meta_path)
+                self._dim = int(vectors.shape[1])
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"Vector {vectors.shape[1]} chiều, cache {self.fingerprint} là {self.dim} chiều")
+
+            hashes = [text_hash(t) for t in texts]
+            # BEGIN IMMEDIATE: chỉ một process được ghi tại một thời điểm
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                existing = self._rows_of(hashes)
+                new = {}
+                for h, vec in zip(hashes, vectors):
+                    if h not in existing and h not in new:
+                        new[h] = vec
+                if new:
+                    start = self._rows_on_disk()
+                    with open(self.vectors_path, "ab") as f:
+                        # bỏ phần dòng ghi dở (nếu lần trước bị ngắt giữa chừng)
+                        f.truncate(start * 4 * self.dim)
+                        f.write(np.stack(list(new.values())).tobytes())
+                    self._conn.executemany(
+                        "INSERT INTO rows (hash, row) VALUES (?, ?)",
+                        [(h, start + i) for i, h in enumerate(new)],
+                    )
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+        try:
+            size = os.path.getsize(self.vectors_path)
+        except OSError:
+            size = 0
+        return {"model": self.fingerprint, "rows": rows, "size_mb": round(size / (1024 * 1024), 2)}
+
+
+def get_embedding_cache(fingerprint: str):
+    """Cache dùng chung của model `fingerprint`; None nếu EMBEDDING_CACHE_DIR để trống (tắt cache)."""
+    if not EMBEDDING_CACHE_DIR:
+        return None
+    with _lock:
+        cache = _caches.get(fingerprint)
+        if cache is None:
+            slug = hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()[:16]
+            cache = EmbeddingCache(os.path.join(EMBEDDING_CACHE_DIR, slug), fingerprint)
+            _caches[fingerprint] = cache
+        return cache
+
+
+def embed_texts(texts, model_name: str = EMBEDDING_MODEL_NAME, progress=None, batch_size: int = EMBED_BATCH_SIZE):
+    """
+    Embedding của `texts`, lấy từ cache khi có, chỉ gọi model cho các text mới.
+    progress(fraction): báo tiến độ theo số text đã có vector.
+    Trả về (vectors: mảng float32 (n, dim), hits: số text lấy từ cache).
+    """
+    texts = list(texts)
+    cache = get_embedding_cache(engine_fingerprint(model_name))
+    vectors, missing = cache.lookup(texts) if cache is not None else (None, list(range(len(texts))))
+    hits = len(texts) - len(missing)
+    if progress is not None and texts:
+        progress(hits / len(texts))
+
+    if missing:
+        embeddings = get_embeddings(model_name)
+        done = hits
+        for i in range(0, len(missing), batch_size):
+            idxs = missing[i:i + batch_size]
+            batch_texts = [texts[j] for j in idxs]
+            batch = np.asarray(embeddings.embed_documents(batch_texts), dtype=np.float32)
+            if vectors is None:
+                vectors = np.zeros((len(texts), batch.shape[1]), dtype=np.float32)
+            vectors[idxs] = batch
+            if cache is not None:
+                cache.add(batch_texts, batch)
+            done += len(idxs)
+            if progress is not None:
+                progress(done / len(texts))
+
+    inc("embedding_cache_hits_total", hits)
+    inc("embedding_cache_misses_total", len(missing))
+    if vectors is None:
+        vectors = np.zeros((0, 0), dtype=np.float32)
+    return vectors, hits
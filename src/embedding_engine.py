@@ -0,0 +1,128 @@
+import os
+import threading
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# ====== ENGINE EMBEDDING (BATCH + LƯỢNG TỬ HOÁ CHO CPU) ======
+# Thay cho HuggingFaceEmbeddings mặc định: kiểm soát được batch size, số thread
+# và backend suy luận:
+# - torch: sentence-transformers fp32 (giống trước đây)
+# - int8 : lượng tử hoá động (dynamic quantization) các lớp Linear sang int8,
+#          chạy trên CPU, nhanh hơn ~2x mà vector gần như không đổi
+# - onnx : ONNX Runtime qua sentence-transformers (cần `optimum[onnxruntime]`);
+#          EMBEDDING_ONNX_FILE chọn file trong repo model, vd. bản đã lượng tử hoá
+#          "onnx/model_qint8_avx512_vnni.onnx"
+# Vector luôn được chuẩn hoá về độ dài 1: khi đó khoảng cách L2 của FAISS xếp hạng
+# giống hệt inner product / cosine.
+# Đổi backend làm vector thay đổi chút ít -> nên build lại index (key cache
+# embedding của ingest_cache đã gồm backend).
+
+EMBEDDING_BACKENDS = ("torch", "int8", "onnx")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+# 0 = để torch / onnxruntime tự chọn
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "")
+
+
+def engine_fingerprint(model_name: str, backend: str = EMBEDDING_BACKEND) -> str:
+    """Định danh của (model, backend) cho key cache; backend torch giữ nguyên tên model như trước."""
+    if backend == "torch":
+        return model_name
+    if backend == "onnx" and EMBEDDING_ONNX_FILE:
+        return f"{model_name}:onnx:{EMBEDDING_ONNX_FILE}"
+    return f"{model_name}:{backend}"
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class EmbeddingEngine(Embeddings):
+    """
+    Model embedding dùng chung (interface Embeddings của langchain, dùng được cho FAISS).
+    Model chỉ được load ở lần embed đầu tiên.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        backend: str = EMBEDDING_BACKEND,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        threads: int = EMBEDDING_THREADS,
+        normalize: bool = True,
+    ):
+        if backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"EMBEDDING_BACKEND phải là một trong {EMBEDDING_BACKENDS}")
+        self.model_name = model_name
+        self.backend = backend
+        self.batch_size = batch_size
+        self.threads = threads
+        self.normalize = normalize
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def fingerprint(self) -> str:
+        return engine_fingerprint(self.model_name, self.backend)
+
+    def _load(self):
+        from sentence_transformers import SentenceTransformer
+
+        if self.backend == "onnx":
+            model_kwargs = {"provider": "CPUExecutionProvider"}
+            if EMBEDDING_ONNX_FILE:
+                model_kwargs["file_name"] = EMBEDDING_ONNX_FILE
+            if self.threads > 0:
+                import onnxruntime
+                options = onnxruntime.SessionOptions()
+                options.intra_op_num_threads = self.threads
+                model_kwargs["session_options"] = options
+            return SentenceTransformer(self.model_name, backend="onnx", device="cpu", model_kwargs=model_kwargs)
+
+        import torch
+        if self.threads > 0:
+            # torch chỉ có một thread pool cho cả process (dùng chung với Whisper)
+            torch.set_num_threads(self.threads)
+        if self.backend == "int8":
+            model = SentenceTransformer(self.model_name, device="cpu")
+            model.eval()
+            return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return SentenceTransformer(self.model_name)
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._load()
+        return self._model
+
+    def embed(self, texts) -> np.ndarray:
+        """Embed danh sách text -> mảng float32 (n, dim), đã chuẩn hoá nếu normalize=True."""
+        texts = [text.replace("\n", " ") for text in texts]
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        vectors = self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.normalize:
+            vectors = _normalize(vectors)
+        return vectors
+
+    @property
+    def dimension(self) -> int:
+        get_dimension = getattr(self.model, "get_embedding_dimension", None) or self.model.get_sentence_embedding_dimension
+        return int(get_dimension())
+
+    def embed_documents(self, texts) -> list:
+        return self.embed(texts).tolist()
+
+    def embed_query(self, text: str) -> list:
+        return self.embed([text])[0].tolist()
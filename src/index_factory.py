@@ -0,0 +1,220 @@
+import json
+import math
+import os
+
+import faiss
+import numpy as np
+
+# ====== CHỌN LOẠI FAISS INDEX (FLAT / HNSW / IVF-PQ) ======
+# - flat : tìm chính xác, quét toàn bộ vector mỗi truy vấn (mặc định, hợp với ít bài giảng)
+# - hnsw : đồ thị HNSW, truy vấn ~log(n), tốn thêm RAM cho cạnh đồ thị; không hỗ trợ
+#          xoá vector nên khi xoá / thay video thì index được build lại
+# - ivfpq: chia cụm (IVF) + nén vector (PQ), RAM nhỏ hơn nhiều lần; cần train trên một
+#          mẫu vector, nên chỉ chuyển sang khi index đủ lớn (dưới ngưỡng vẫn dùng flat).
+#          remove_ids của IVF giữ nguyên id cũ của các vector còn lại, trong khi langchain
+#          đánh lại vị trí 0..n-1 -> xoá qua remove_positions() thay vì FAISS.delete
+# Loại index được lưu trong INDEX_CONFIG_FILE cạnh index; VECTOR_INDEX_TYPE (nếu đặt)
+# là loại mong muốn cho lần ghi index tiếp theo.
+
+INDEX_TYPES = ("flat", "hnsw", "ivfpq")
+INDEX_CONFIG_FILE = "index_config.json"
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "").lower()
+
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+PQ_M = int(os.getenv("PQ_M", "48"))          # số sub-vector (phải chia hết số chiều)
+PQ_NBITS = 8
+# PQ 8 bit cần ~39 * 256 điểm để train ổn định
+IVF_MIN_TRAIN = int(os.getenv("IVF_MIN_TRAIN", "10000"))
+IVF_TRAIN_SAMPLE = int(os.getenv("IVF_TRAIN_SAMPLE", "100000"))
+
+
+def index_kind(index) -> str:
+    """Loại của một FAISS index: "flat" / "hnsw" / "ivfpq"."""
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivfpq"
+    return "flat"
+
+
+def supports_remove(index) -> bool:
+    """Xoá tại chỗ bằng FAISS.delete của langchain được không (vị trí còn lại dồn về 0..n-1)."""
+    return index_kind(index) == "flat"
+
+
+def _compact_ivf(index, remap: np.ndarray):
+    """Bản IVF cùng quantizer + codebook đã train, chép code PQ của các vector còn lại với id mới."""
+    compacted = faiss.clone_index(index)
+    compacted.reset()
+    # direct map sẽ lệch vì thêm thẳng vào inverted list; all_vectors() dựng lại khi cần
+    compacted.set_direct_map_type(faiss.DirectMap.NoMap)
+    invlists = index.invlists
+    code_size = invlists.code_size
+    for list_no in range(index.nlist):
+        n = invlists.list_size(list_no)
+        if not n:
+            continue
+        ids = faiss.rev_swig_ptr(invlists.get_ids(list_no), n)
+        codes = faiss.rev_swig_ptr(invlists.get_codes(list_no), n * code_size).reshape(n, code_size)
+        new_ids = remap[ids]
+        kept = new_ids >= 0
+        if kept.any():
+            new_ids = np.ascontiguousarray(new_ids[kept])
+            kept_codes = np.ascontiguousarray(codes[kept])
+            compacted.invlists.add_entries(list_no, len(new_ids), faiss.swig_ptr(new_ids), faiss.swig_ptr(kept_codes))
+    compacted.ntotal = int((remap >= 0).sum())
+    return compacted
+
+
+def remove_positions(index, positions):
+    """
+    Index mới không còn các vị trí `positions`, các vector còn lại giữ thứ tự và dồn về
+    0..n-1 (giống cách langchain đánh lại index_to_docstore_id).
+    IVF-PQ: giữ nguyên phần đã train và code đã nén (không train / nén lại);
+    HNSW: đổi về flat (được build lại thành HNSW khi ghi index).
+    """
+    remap = np.full(index.ntotal, -1, dtype=np.int64)
+    keep = np.setdiff1d(np.arange(index.ntotal, dtype=np.int64), np.asarray(positions, dtype=np.int64))
+    remap[keep] = np.arange(len(keep))
+    if isinstance(index, faiss.IndexIVF):
+        return _compact_ivf(index, remap)
+    return build_index("flat", all_vectors(index)[keep])
+
+
+def ivf_nlist(n: int) -> int:
+    """Số cụm IVF theo số vector: ~4*sqrt(n), mỗi cụm vẫn còn >= 39 điểm để train."""
+    return int(min(max(4 * math.sqrt(n), 16), max(n // 39, 1), 65536))
+
+
+def _pq_m(dim: int) -> int:
+    m = min(PQ_M, dim)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def resolve_index_type(index_dir: str | None = None) -> str:
+    """Loại index mong muốn: VECTOR_INDEX_TYPE, nếu không đặt thì loại đã lưu, mặc định flat."""
+    if VECTOR_INDEX_TYPE:
+        if VECTOR_INDEX_TYPE not in INDEX_TYPES:
+            raise ValueError(f"VECTOR_INDEX_TYPE phải là một trong {INDEX_TYPES}")
+        return VECTOR_INDEX_TYPE
+    config = load_config(index_dir) if index_dir else None
+    return (config or {}).get("type", "flat")
+
+
+def effective_type(index_type: str, n: int) -> str:
+    """IVF-PQ chỉ dùng khi đủ vector để train, còn lại dùng flat."""
+    if index_type == "ivfpq" and n < IVF_MIN_TRAIN:
+        return "flat"
+    return index_type
+
+
+def build_index(index_type: str, vectors: np.ndarray, seed: int = 0):
+    """Tạo index loại `index_type` (metric L2 như FAISS mặc định của langchain) chứa `vectors`."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, dim = vectors.shape
+    index_type = effective_type(index_type, n)
+
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, HNSW_M)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    elif index_type == "ivfpq":
+        quantizer = faiss.IndexFlatL2(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, ivf_nlist(n), _pq_m(dim), PQ_NBITS)
+        # train trên một mẫu ngẫu nhiên (train trên cả triệu vector rất chậm mà không tốt hơn bao nhiêu)
+        if n > IVF_TRAIN_SAMPLE:
+            sample = vectors[np.random.default_rng(seed).choice(n, IVF_TRAIN_SAMPLE, replace=False)]
+        else:
+            sample = vectors
+        index.train(sample)
+        index.nprobe = IVF_NPROBE
+    else:
+        index = faiss.IndexFlatL2(dim)
+
+    if n:
+        index.add(vectors)
+    return index
+
+
+def all_vectors(index) -> np.ndarray:
+    """Lấy lại toàn bộ vector theo đúng thứ tự vị trí (IVF-PQ: vector đã nén, chỉ xấp xỉ)."""
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    if isinstance(index, faiss.IndexIVF):
+        index.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def convert_index(index, index_type: str):
+    """
+    Đổi index sang loại `index_type` (giữ nguyên thứ tự vector, nên mapping
+    vị trí -> docstore id của langchain vẫn đúng). Trả về index cũ nếu không cần đổi.
+    """
+    current = index_kind(index)
+    target = effective_type(index_type, index.ntotal)
+    # ivfpq đã train thì giữ nguyên kể cả khi bị xoá bớt xuống dưới ngưỡng train
+    if target == current or index_type == current:
+        return index
+    return build_index(target, all_vectors(index))
+
+
+def apply_search_params(index):
+    """Đặt tham số truy vấn (efSearch / nprobe) theo cấu hình hiện tại."""
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    elif isinstance(index, faiss.IndexIVF):
+        index.nprobe = IVF_NPROBE
+    return index
+
+
+def filtered_search_params(index, positions: np.ndarray):
+    """
+    SearchParameters chỉ cho phép các vị trí `positions` (lọc ngay trong FAISS thay vì
+    lấy hết rồi lọc), giữ nguyên efSearch / nprobe đang đặt trên index.
+    """
+    selector = faiss.IDSelectorBatch(np.ascontiguousarray(positions, dtype=np.int64))
+    if isinstance(index, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    elif isinstance(index, faiss.IndexIVF):
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    # selector phải sống ít nhất bằng params (SWIG không giữ tham chiếu)
+    params._selector = selector
+    return params
+
+
+def index_memory_bytes(index) -> int:
+    """Dung lượng index khi serialize (xấp xỉ RAM index chiếm)."""
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def load_config(index_dir: str):
+    path = os.path.join(index_dir, INDEX_CONFIG_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_config(index_dir: str, index, requested_type: str):
+    """Lưu loại index đang dùng và loại được yêu cầu (ivfpq có thể đang tạm là flat)."""
+    config = {"type": requested_type, "active_type": index_kind(index), "ntotal": int(index.ntotal)}
+    if isinstance(index, faiss.IndexHNSW):
+        config.update(M=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION)
+    elif isinstance(index, faiss.IndexIVF):
+        config.update(nlist=int(index.nlist), nprobe=int(index.nprobe))
+        pq = getattr(index, "pq", None)
+        if pq is not None:
+            config["pq_m"] = int(pq.M)
+    path = os.path.join(index_dir, INDEX_CONFIG_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+    os.replace(tmp_path, path)
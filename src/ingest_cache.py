@@ -0,0 +1,178 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+# ====== CACHE KẾT QUẢ XỬ LÝ VIDEO THEO NỘI DUNG (CONTENT-ADDRESSED) ======
+# Key của mỗi video = sha256 của bytes video, nên upload lại cùng bài giảng
+# (kể cả đổi tên file) sẽ dùng lại kết quả cũ.
+#
+# Mỗi video có một thư mục cache/ingest/<hash>/ chứa các stage:
+#   audio        -> metadata audio (duration, sample_rate)
+#   transcript   -> segment Whisper thô       (phụ thuộc: model Whisper, VAD)
+#   segments     -> segment đã clean          (+ rule clean_transcript)
+#   chunks       -> chunk text + metadata     (+ max_chars, overlap_sec)
+#   embeddings   -> vector của các chunk      (+ model embedding)
+# Key của mỗi stage = hash(tham số của stage + key của stage trước), nên đổi
+# tham số của stage nào thì chỉ stage đó và các stage sau bị tính lại.
+
+CACHE_DIR = os.getenv("INGEST_CACHE_DIR", os.path.join("cache", "ingest"))
+MAX_CACHE_MB = int(os.getenv("INGEST_CACHE_MAX_MB", "2048"))
+
+_HASH_BLOCK_BYTES = 1 << 20
+_lock = threading.Lock()
+
+
+def file_sha256(path: str) -> str:
+    """Hash sha256 của file, đọc theo từng khối 1 MB (không load cả video vào RAM)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK_BYTES), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def stage_key(params: dict, parent_key: str = "") -> str:
+    """Key của một stage từ tham số của nó và key của stage phía trước."""
+    payload = json.dumps({"parent": parent_key, "params": params}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def ingest_keys(
+    model_size: str,
+    use_vad: bool,
+    clean_version: str,
+    max_chars: int,
+    overlap_sec: float,
+    embedding_model: str,
+    transcribe_engine: str = "whisper",
+) -> dict:
+    """Tính key cho toàn bộ chuỗi stage với bộ tham số hiện tại."""
+    keys = {}
+    keys["audio"] = stage_key({"decoder": "ffmpeg-f32le-16k"})
+    transcript_params = {"model_size": model_size, "vad": use_vad}
+    if transcribe_engine != "whisper":
+        # engine mặc định giữ nguyên key cũ -> không mất transcript đã cache
+        transcript_params["engine"] = transcribe_engine
+    keys["transcript"] = stage_key(transcript_params, keys["audio"])
+    keys["segments"] = stage_key({"clean_rules": clean_version}, keys["transcript"])
+    keys["chunks"] = stage_key({"max_chars": max_chars, "overlap_sec": overlap_sec}, keys["segments"])
+    keys["embeddings"] = stage_key({"model": embedding_model}, keys["chunks"])
+    return keys
+
+
+def _video_dir(video_hash: str) -> str:
+    return os.path.join(CACHE_DIR, video_hash)
+
+
+def _stage_path(video_hash: str, stage: str, key: str) -> str:
+    ext = ".npy" if stage == "embeddings" else ".json"
+    return os.path.join(_video_dir(video_hash), f"{stage}-{key}{ext}")
+
+
+def _touch(video_hash: str):
+    """Cập nhật thời điểm dùng gần nhất (mtime thư mục) cho LRU."""
+    try:
+        os.utime(_video_dir(video_hash))
+    except OSError:
+        pass
+
+
+def checkpoint_path(video_hash: str, stage: str, key: str) -> str:
+    """
+    File checkpoint của một stage đang chạy dở (vd. phiên âm từng cửa sổ).
+    Tên bắt đầu bằng "<stage>-" nên save_stage() của stage đó tự xoá checkpoint khi xong.
+    """
+    return os.path.join(_video_dir(video_hash), f"{stage}-{key}.partial.jsonl")
+
+
+def load_stage(video_hash: str, stage: str, key: str):
+    """Đọc kết quả của stage; trả về None nếu chưa có (hoặc tham số đã đổi)."""
+    path = _stage_path(video_hash, stage, key)
+    if not os.path.exists(path):
+        return None
+    try:
+        if stage == "embeddings":
+            value = np.load(path)
+        else:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+    except (OSError, ValueError):
+        return None
+    _touch(video_hash)
+    return value
+
+
+def save_stage(video_hash: str, stage: str, key: str, value):
+    """
+    Ghi kết quả của stage (ghi file tạm rồi rename để không bao giờ đọc phải file dở).
+    Bản cũ của cùng stage (tham số khác) bị xoá.
+    """
+    video_dir = _video_dir(video_hash)
+    os.makedirs(video_dir, exist_ok=True)
+    path = _stage_path(video_hash, stage, key)
+    tmp_path = path + ".tmp"
+
+    if stage == "embeddings":
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.asarray(value, dtype=np.float32))
+    else:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+    for name in os.listdir(video_dir):
+        if name.startswith(stage + "-") and os.path.join(video_dir, name) != path:
+            try:
+                os.remove(os.path.join(video_dir, name))
+            except OSError:
+                pass
+
+    _touch(video_hash)
+    evict()
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def evict(max_mb: int = MAX_CACHE_MB):
+    """Xoá các video ít được dùng gần đây nhất cho tới khi cache nhỏ hơn max_mb."""
+    if not os.path.isdir(CACHE_DIR):
+        return
+    with _lock:
+        entries = []
+        for name in os.listdir(CACHE_DIR):
+            path = os.path.join(CACHE_DIR, name)
+            if os.path.isdir(path):
+                entries.append((os.path.getmtime(path), _dir_size(path), path))
+
+        total = sum(size for _, size, _ in entries)
+        limit = max_mb * 1024 * 1024
+        for _, size, path in sorted(entries):
+            if total <= limit:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+def cache_stats() -> dict:
+    """Số video và tổng dung lượng (MB) đang nằm trong cache."""
+    if not os.path.isdir(CACHE_DIR):
+        return {"videos": 0, "size_mb": 0.0}
+    dirs = [os.path.join(CACHE_DIR, n) for n in os.listdir(CACHE_DIR)]
+    dirs = [d for d in dirs if os.path.isdir(d)]
+    return {
+        "videos": len(dirs),
+        "size_mb": round(sum(_dir_size(d) for d in dirs) / (1024 * 1024), 2),
+    }
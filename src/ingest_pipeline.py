@@ -0,0 +1,360 @@
+import os
+import shutil
+import threading
+import time
+from contextlib import nullcontext
+
+from langchain_core.documents import Document
+
+from src.reporter import get_reporter, StageProgress
+from src.telemetry import span
+from src.video_processor import extract_audio, release_audio, SAMPLE_RATE
+from src.text_processor import (
+    transcribe_audio, chunk_text, clean_segments, clean_rules_version, IncrementalChunker,
+    CHUNK_MAX_CHARS, CHUNK_OVERLAP_SEC,
+)
+from src.vector_store_builder import (
+    create_and_save_vector_store, append_video_documents, delete_chunks, list_videos, mark_complete, VECTOR_STORE_DIR,
+)
+from src.resource_cache import EMBEDDING_MODEL_NAME
+from src.embedding_cache import embed_texts
+from src.embedding_engine import engine_fingerprint
+from src.ingest_cache import file_sha256, ingest_keys, load_stage, save_stage, checkpoint_path
+from src.whisper_registry import DEFAULT_WHISPER_MODEL
+from src.transcription_engine import TRANSCRIBE_ENGINE, engine_fingerprint as transcribe_fingerprint
+from src.vad import USE_VAD
+
+# ====== PIPELINE XỬ LÝ MỘT VIDEO (DÙNG CHUNG CHO APP VÀ CLI) ======
+# tách âm thanh -> phiên âm -> chia chunk -> embedding -> ghi vào index chung,
+# mỗi stage được tra cache nội dung (ingest_cache) trước khi chạy.
+# Tiến độ được báo qua reporter hiện hành (src.reporter), không gọi st.* trực tiếp.
+
+# thư mục chứa video để phát lại trong app (media server đọc từ đây)
+VIDEO_DIR = "temp"
+
+# tỉ trọng thời gian ước tính của từng stage (để vẽ thanh tiến độ)
+STAGE_WEIGHTS = {"extract": 8, "transcribe": 72, "chunk": 2, "embed": 13, "index": 5}
+
+# index dần khi đang phiên âm: mỗi cửa sổ audio xong -> chunk đã đóng được embed
+# và thêm ngay vào index, hỏi đáp được phần đầu bài giảng trước khi phiên âm xong
+PROGRESSIVE_INGEST = os.getenv("INGEST_PROGRESSIVE", "1") == "1"
+# mỗi lần nối vào index vẫn ghi lại index.faiss -> gom các chunk đã đóng, tối đa
+# INGEST_LIVE_FLUSH_SEC giây mới nối một lần (và một lần cuối khi phiên âm xong)
+LIVE_FLUSH_SEC = float(os.getenv("INGEST_LIVE_FLUSH_SEC", "30"))
+
+
+def make_stage_limits(decode: int = 2, transcribe: int = 1, embed: int = 1):
+    """
+    Giới hạn số video được chạy đồng thời ở từng stage (khi xử lý nhiều video song song).
+    Mặc định chỉ 1 video phiên âm tại một thời điểm (Whisper đã dùng hết CPU/GPU),
+    trong lúc đó các video khác vẫn được tách âm thanh / embedding.
+    """
+    return {
+        "decode": threading.Semaphore(decode),
+        "transcribe": threading.Semaphore(transcribe),
+        "embed": threading.Semaphore(embed),
+    }
+
+
+def _stage(limits, name: str):
+    if limits is None:
+        return nullcontext()
+    return limits[name]
+
+
+def store_video_file(src_path: str, video_name: str | None = None) -> str:
+    """
+    Đưa file video vào VIDEO_DIR (hard link nếu cùng ổ đĩa, không thì copy)
+    để app phát lại được. Trả về đường dẫn trong VIDEO_DIR.
+    """
+    os.makedirs(VIDEO_DIR, exist_ok=True)
+    dst_path = os.path.join(VIDEO_DIR, video_name or os.path.basename(src_path))
+    if os.path.exists(dst_path) and os.path.samefile(src_path, dst_path):
+        return dst_path
+    if os.path.exists(dst_path):
+        os.remove(dst_path)
+    with span("save", video=os.path.basename(dst_path)) as s:
+        try:
+            os.link(src_path, dst_path)
+        except OSError:
+            shutil.copy2(src_path, dst_path)
+        s.add_bytes(os.path.getsize(dst_path))
+    return dst_path
+
+
+def _dir_bytes(path: str) -> int:
+    try:
+        return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+    except OSError:
+        return 0
+
+
+class _LiveIndexer:
+    """
+    Nhận segment đã clean theo thứ tự trong lúc phiên âm (transcribe_audio(on_segments=...)),
+    chia chunk bằng IncrementalChunker, embed và nối các chunk đã đóng vào index chung
+    theo lô (xem LIVE_FLUSH_SEC).
+    Lỗi khi index dần chỉ tắt chế độ này: index đầy đủ vẫn được ghi ở stage "index".
+    Video được đánh dấu "chưa xong" trong index (ẩn khỏi list_videos()) cho tới khi
+    ingest_video() hoàn tất; lỗi giữa chừng thì xoá đúng các chunk lần này đã nối.
+    Bài giảng đã có bản đầy đủ trong index (xử lý lại) thì không index dần: bản cũ vẫn
+    được dùng để hỏi đáp và chỉ được thay ở stage "index" khi lần xử lý này xong.
+    """
+
+    def __init__(self, video_name: str, total_sec: float, reporter):
+        self.video_name = video_name
+        self.total_sec = total_sec
+        self.reporter = reporter
+        self.chunker = IncrementalChunker()
+        self.chunks = []
+        self.metadatas = []
+        self.vectors = []
+        self.ids = []   # docstore id của các chunk đã nối vào index
+        self.pending = []   # chunk đã đóng, chưa nối vào index
+        self.last_flush = time.monotonic()
+        self.ok = video_name not in list_videos()
+        if not self.ok:
+            reporter.info("Bài giảng đã có trong index: bản cũ vẫn được dùng cho tới khi xử lý xong.")
+
+    def _append(self, closed, force: bool = False):
+        if not self.ok:
+            return
+        self.pending.extend(closed)
+        if not self.pending or (not force and time.monotonic() - self.last_flush < LIVE_FLUSH_SEC):
+            return
+        closed, self.pending = self.pending, []
+        self.last_flush = time.monotonic()
+        try:
+            texts = [chunk for chunk, _ in closed]
+            metas = [meta for _, meta in closed]
+            with span("index_live", video=self.video_name, chunks=len(texts)):
+                vectors, _ = embed_texts(texts)
+                documents = [
+                    Document(page_content=text, metadata={**meta, "video_name": self.video_name})
+                    for text, meta in zip(texts, metas)
+                ]
+                # lần đầu bỏ phần index dở của lần xử lý trước bị dừng (nếu có), sau đó chỉ nối thêm
+                ids = append_video_documents(self.video_name, documents, vectors, replace=not self.chunks)
+        except Exception as e:
+            self.ok = False
+            self.reporter.warning(f"Không index dần được ({e}), sẽ index khi phiên âm xong.")
+            return
+        self.chunks.extend(texts)
+        self.metadatas.extend(metas)
+        self.vectors.extend(vectors)
+        self.ids.extend(ids)
+        self.reporter.indexed(min(metas[-1]["end"], self.total_sec), self.total_sec)
+
+    def add(self, segments):
+        closed = []
+        for seg in segments:
+            closed.extend(self.chunker.add(seg))
+        self._append(closed)
+
+    def finish(self):
+        self._append(self.chunker.flush(), force=True)
+
+    def discard(self):
+        """Xoá các chunk lần này đã index dần (video xử lý lỗi / bị huỷ giữa chừng)."""
+        if not self.ids:
+            return
+        try:
+            delete_chunks(self.video_name, self.ids)
+            self.reporter.warning("Đã xoá phần bài giảng đã index dần do xử lý không thành công.")
+        except Exception as e:
+            self.reporter.warning(f"Không xoá được phần bài giảng đã index dần: {e}")
+
+
+def ingest_video(
+    video_path: str,
+    video_name: str | None = None,
+    model_size: str = DEFAULT_WHISPER_MODEL,
+    workers: int | None = None,
+    limits=None,
+    progressive: bool | None = None,
+    engine: str | None = None,
+):
+    """
+    Xử lý một video và ghi các chunk vào vector store chung.
+    video_name: tên bài giảng trong index (mặc định tên file).
+    workers: số process phiên âm song song cho video này (None = theo WHISPER_PARALLEL_WORKERS).
+    limits: giới hạn đồng thời theo stage từ make_stage_limits() (None = không giới hạn).
+    progressive: index dần trong lúc phiên âm (None = theo INGEST_PROGRESSIVE); tiến độ
+        được báo qua reporter.indexed().
+    engine: engine phiên âm "whisper" / "faster-whisper" (None = theo TRANSCRIBE_ENGINE).
+
+    Trả về dict {"video_name", "chunks", "cached", "skipped_sec", "elapsed_sec"}
+    hoặc None nếu lỗi (lỗi đã được báo qua reporter).
+    """
+    reporter = get_reporter()
+    video_name = video_name or os.path.basename(video_path)
+    t0 = time.perf_counter()
+    engine = engine or TRANSCRIBE_ENGINE
+
+    # Cache theo nội dung video: xử lý lại cùng bài giảng (kể cả khác tên file)
+    # thì dùng lại kết quả của các stage đã có
+    video_hash = file_sha256(video_path)
+    keys = ingest_keys(
+        model_size=model_size,
+        use_vad=USE_VAD,
+        clean_version=clean_rules_version(),
+        max_chars=CHUNK_MAX_CHARS,
+        overlap_sec=CHUNK_OVERLAP_SEC,
+        embedding_model=engine_fingerprint(EMBEDDING_MODEL_NAME),
+        transcribe_engine=transcribe_fingerprint(engine),
+    )
+    audio = None
+    skipped_sec = 0.0
+    cached = False
+    live = None
+    completed = False
+    if progressive is None:
+        progressive = PROGRESSIVE_INGEST
+    progress = StageProgress(reporter, STAGE_WEIGHTS)
+
+    try:
+        cached_chunks = load_stage(video_hash, "chunks", keys["chunks"])
+        if cached_chunks is not None:
+            chunks, metadatas = cached_chunks["chunks"], cached_chunks["metadatas"]
+            cached = True
+            progress.done("chunk")
+            reporter.success(f"Video đã được xử lý trước đó, dùng lại {len(chunks)} đoạn từ cache! ⚡")
+        else:
+            segments = load_stage(video_hash, "segments", keys["segments"])
+            if segments is None:
+                raw_segments = load_stage(video_hash, "transcript", keys["transcript"])
+                if raw_segments is None:
+                    # 1. Tách âm thanh
+                    progress.start("extract", "🎧 Đang tách âm thanh...")
+                    with _stage(limits, "decode"), span("extract", video=video_name) as s:
+                        # decode thẳng ra PCM 16 kHz trong bộ nhớ, không ghi file .mp3 trung gian
+                        audio = extract_audio(video_path)
+                        if audio is not None:
+                            s.add_bytes(audio.nbytes)
+                            s.set(audio_sec=len(audio) / SAMPLE_RATE)
+                    if audio is None:
+                        reporter.error("Lỗi: Không thể tách âm thanh.")
+                        return None
+                    progress.done("extract")
+                    reporter.success("Âm thanh đã tách! 🎵")
+                    save_stage(video_hash, "audio", keys["audio"], {
+                        "duration": len(audio) / SAMPLE_RATE,
+                        "sample_rate": SAMPLE_RATE,
+                    })
+
+                    # 2. Phiên âm
+                    progress.start("transcribe", "📝 Đang phiên âm...")
+                    if progressive:
+                        live = _LiveIndexer(video_name, len(audio) / SAMPLE_RATE, reporter)
+                    with _stage(limits, "transcribe"), span("transcribe", video=video_name, model=model_size, engine=engine) as s:
+                        s.add_bytes(audio.nbytes)
+                        # mỗi cửa sổ audio xong được ghi checkpoint: lỗi / bị kill giữa chừng
+                        # thì lần chạy sau tiếp tục từ cửa sổ cuối cùng đã xong
+                        trans_result = transcribe_audio(
+                            audio, model_size=model_size, workers=workers,
+                            progress=lambda fraction: progress.update("transcribe", fraction),
+                            checkpoint=checkpoint_path(video_hash, "transcript", keys["transcript"]),
+                            on_segments=live.add if live is not None else None,
+                            engine=engine,
+                        )
+                        if trans_result and live is not None:
+                            live.finish()
+                        if trans_result:
+                            s.set(**trans_result.get("vad", {}), segments=len(trans_result["segments"]))
+                    # PCM không cần nữa sau khi phiên âm -> giải phóng sớm
+                    release_audio(audio)
+                    audio = None
+                    if not trans_result:
+                        reporter.error("Lỗi: Không thể phiên âm.")
+                        return None
+
+                    save_stage(video_hash, "transcript", keys["transcript"], trans_result["raw_segments"])
+                    segments = trans_result["segments"]
+                    skipped_sec = trans_result.get("vad", {}).get("skipped_sec", 0.0)
+                    reporter.success(f"Phiên âm hoàn tất! 📜 (bỏ qua {skipped_sec:.0f} giây im lặng)")
+                else:
+                    # transcript thô có sẵn, chỉ rule làm sạch thay đổi
+                    segments = clean_segments(raw_segments)
+                    reporter.success("Dùng lại transcript từ cache! 📜")
+                save_stage(video_hash, "segments", keys["segments"], segments)
+            else:
+                reporter.success("Dùng lại transcript từ cache! 📜")
+            progress.done("transcribe")
+
+            # 3. Chia nhỏ
+            progress.start("chunk", "✂️ Đang chia nhỏ văn bản...")
+            with span("chunk", video=video_name) as s:
+                chunks, metadatas = chunk_text(segments)
+                s.add_bytes(sum(len(c.encode("utf-8")) for c in chunks))
+                s.set(chunks=len(chunks))
+            if not chunks:
+                reporter.error("Lỗi: Không thể chia nhỏ.")
+                return None
+            save_stage(video_hash, "chunks", keys["chunks"], {"chunks": chunks, "metadatas": metadatas})
+            progress.done("chunk")
+            reporter.success(f"Chia nhỏ thành {len(chunks)} đoạn! ✂️")
+
+        # 4. Embedding + ghi vào vector store (kèm metadata start/end)
+        progress.start("embed", "📦 Đang tạo vector store...")
+        documents = [
+            Document(
+                page_content=chunks[i],
+                metadata={
+                    "start": metadatas[i]["start"],
+                    "end": metadatas[i]["end"],
+                    "video_name": video_name,
+                    "chunk_index": metadatas[i]["chunk_index"],
+                },
+            )
+            for i in range(len(chunks))
+        ]
+
+        with _stage(limits, "embed"):
+            vectors = load_stage(video_hash, "embeddings", keys["embeddings"])
+            if vectors is None or len(vectors) != len(chunks):
+                try:
+                    with span("embed", video=video_name, chunks=len(chunks)) as s:
+                        # chunk trùng nội dung với lần xử lý trước lấy vector từ embedding_cache
+                        vectors, hits = embed_texts(chunks, progress=lambda f: progress.update("embed", f))
+                        s.add_bytes(vectors.nbytes)
+                        s.set(cache_hits=hits)
+                    save_stage(video_hash, "embeddings", keys["embeddings"], vectors)
+                    reporter.info(f"Embedding: {hits}/{len(chunks)} đoạn lấy từ cache ({100 * hits / len(chunks):.0f}%)")
+                except Exception as e:
+                    reporter.error(f"Lỗi khi tạo embedding: {e}")
+                    return None
+            progress.done("embed")
+
+            progress.start("index")
+            if live is not None and live.ok and live.chunks == chunks and live.metadatas == metadatas:
+                # mọi chunk đã được index dần trong lúc phiên âm
+                mark_complete(video_name)
+                reporter.indexed(live.total_sec, live.total_sec)
+            else:
+                with span("index", video=video_name, chunks=len(chunks)) as s:
+                    ok = create_and_save_vector_store(documents, vectors=vectors)
+                    s.add_bytes(_dir_bytes(VECTOR_STORE_DIR))
+                if not ok:
+                    reporter.error("Lỗi: Không thể tạo vector store.")
+                    return None
+
+        progress.done("index")
+        reporter.progress(100, "✅ Hoàn tất")
+        completed = True
+        return {
+            "video_name": video_name,
+            "chunks": len(chunks),
+            "cached": cached,
+            "skipped_sec": skipped_sec,
+            "elapsed_sec": time.perf_counter() - t0,
+        }
+    finally:
+        # lỗi / exception sau khi đã index dần: không để lại bài giảng thiếu nội dung
+        if live is not None and not completed:
+            live.discard()
+        # Giải phóng audio tạm (xoá file PCM nếu có) kể cả khi lỗi giữa chừng
+        if audio is not None:
+            try:
+                release_audio(audio)
+            except Exception as e:
+                reporter.warning(f"Không thể xoá file audio tạm: {e}")
@@ -0,0 +1,724 @@
+import atexit
+import json
+import multiprocessing as mp
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from contextlib import closing
+
+from src.reporter import Reporter
+
+try:
+    import fcntl
+except ImportError:   # Windows: không khoá được giữa các process
+    fcntl = None
+
+# ====== HÀNG ĐỢI JOB XỬ LÝ VIDEO (SQLITE + POOL PROCESS WORKER) ======
+# App chỉ lưu video rồi thêm một job vào cache/jobs.sqlite. Một pool process worker
+# sống lâu (khởi động bởi scheduler: thread nền trong process app, hoặc
+# `python -m src.job_queue`) tự lấy job từ SQLite theo thứ tự. Mỗi worker load sẵn
+# model Whisper + embedding một lần lúc khởi động rồi giữ lại (whisper_registry /
+# resource_cache) cho mọi job sau, không load lại theo từng video.
+# Job chạy tiếp dù tab trình duyệt bị đóng hay script rerun; tiến độ, trạng thái từng
+# stage và thông báo được ghi vào SQLite nên phiên nào cũng đọc lại được (attach lại
+# job đang chạy).
+# Số job chạy cùng lúc giới hạn theo ngân sách CPU: worker chỉ nhận job khi tổng
+# `cpus` của các job đang chạy cộng job mới không vượt JOB_CPU_BUDGET (kiểm tra ngay
+# trong transaction nhận job) — không phụ thuộc số tab đang mở.
+# Scheduler giữ đủ số worker (worker chết thì job của nó được chạy lại / báo lỗi và
+# worker mới được khởi động) và xử lý yêu cầu huỷ.
+# Chạy scheduler riêng (không cần app): python -m src.job_queue
+
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", os.path.join("cache", "jobs.sqlite"))
+JOB_CPU_BUDGET = int(os.getenv("JOB_CPU_BUDGET", "0")) or (os.cpu_count() or 1)
+# số core cho mỗi job (0 = một nửa ngân sách -> 2 job cùng lúc)
+JOB_CPUS_PER_JOB = int(os.getenv("JOB_CPUS_PER_JOB", "0")) or max(1, JOB_CPU_BUDGET // 2)
+# số process worker trong pool (0 = đủ để dùng hết ngân sách CPU)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "0")) or max(1, JOB_CPU_BUDGET // JOB_CPUS_PER_JOB)
+# model Whisper mỗi worker load sẵn khi khởi động (rỗng = WHISPER_WARMUP, nếu cũng rỗng thì model mặc định)
+JOB_WARMUP_MODELS = os.getenv("JOB_WARMUP_MODELS", "")
+# job bị huỷ phải tự dừng trong chừng này giây, quá hạn thì worker bị dừng hẳn (và thay worker mới)
+JOB_CANCEL_GRACE_SEC = float(os.getenv("JOB_CANCEL_GRACE_SEC", "30"))
+# worker chết bất thường (vd. bị OOM kill) -> job được chạy lại tối đa chừng này lần,
+# tiếp tục từ checkpoint phiên âm / các stage đã cache
+JOB_MAX_RETRIES = int(os.getenv("JOB_MAX_RETRIES", "2"))
+POLL_INTERVAL_SEC = 1.0
+# số lần ghi tiến độ tối đa mỗi giây từ một worker
+_PROGRESS_WRITES_PER_SEC = 4
+# worker kiểm tra yêu cầu huỷ job tối đa mỗi chừng này giây (khi báo tiến độ)
+_CANCEL_CHECK_SEC = 1.0
+
+ACTIVE_STATUSES = ("queued", "running")
+FINAL_STATUSES = ("done", "failed", "cancelled")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    video_path TEXT NOT NULL,
+    video_name TEXT NOT NULL,
+    model_size TEXT NOT NULL,
+    cpus INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    percent INTEGER NOT NULL DEFAULT 0,
+    indexed_sec REAL NOT NULL DEFAULT 0,
+    total_sec REAL,
+    message TEXT,
+    result TEXT,
+    error TEXT,
+    pid INTEGER,
+    pid_started REAL,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    retries INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_stages (
+    job_id TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    status TEXT NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    PRIMARY KEY (job_id, stage)
+);
+CREATE TABLE IF NOT EXISTS job_events (
+    job_id TEXT NOT NULL,
+    ts REAL NOT NULL,
+    level TEXT NOT NULL,
+    message TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS job_events_job ON job_events (job_id, ts);
+"""
+
+# cột thêm sau khi bảng jobs đã có (DB tạo bởi bản cũ được ALTER TABLE)
+_ADDED_COLUMNS = {
+    "indexed_sec": "REAL NOT NULL DEFAULT 0",
+    "total_sec": "REAL",
+    "retries": "INTEGER NOT NULL DEFAULT 0",
+    "pid_started": "REAL",
+}
+
+_schema_ready: set = set()
+_schema_lock = threading.Lock()
+
+
+def _connect(db_path: str = JOB_DB_PATH):
+    """Connection mới tới DB job (mỗi thao tác một connection: dùng được từ mọi thread / process)."""
+    if db_path not in _schema_ready:
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    if db_path not in _schema_ready:
+        with _schema_lock:
+            if db_path not in _schema_ready:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(_SCHEMA)
+                columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+                for name, decl in _ADDED_COLUMNS.items():
+                    if name not in columns:
+                        conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {decl}")
+                conn.commit()
+                _schema_ready.add(db_path)
+    return conn
+
+
+def _job_dict(row) -> dict:
+    job = dict(row)
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    job["cancel_requested"] = bool(job["cancel_requested"])
+    return job
+
+
+# ====== API CHO APP / CLI ======
+
+def submit_job(
+    video_path: str,
+    video_name: str,
+    model_size: str,
+    cpus: int | None = None,
+    db_path: str = JOB_DB_PATH,
+) -> str:
+    """
+    Thêm job xử lý video vào hàng đợi, trả về id job.
+    Cùng video + model đang chờ/chạy rồi (vd. bấm xử lý ở hai tab) -> trả về job đó.
+    """
+    cpus = max(1, min(cpus or JOB_CPUS_PER_JOB, JOB_CPU_BUDGET))
+    now = time.time()
+    with closing(_connect(db_path)) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "SELECT id FROM jobs WHERE video_name = ? AND model_size = ? AND status IN (?, ?)",
+            (video_name, model_size, *ACTIVE_STATUSES),
+        ).fetchone()
+        if row is not None:
+            conn.rollback()
+            return row["id"]
+        job_id = uuid.uuid4().hex[:12]
+        conn.execute(
+            "INSERT INTO jobs (id, video_path, video_name, model_size, cpus, status, message, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, 'queued', ?, ?, ?)",
+            (job_id, os.path.abspath(video_path), video_name, model_size, cpus, "⏳ Đang chờ tới lượt xử lý...", now, now),
+        )
+        conn.commit()
+    return job_id
+
+
+def get_job(job_id: str, events: int = 20, db_path: str = JOB_DB_PATH) -> dict | None:
+    """
+    Trạng thái job: các cột của bảng jobs + "stages" (list {stage, status, started_at, finished_at})
+    + "events" (`events` thông báo gần nhất, cũ trước) + "queue_position" (job đang chờ).
+    None nếu không có job.
+    """
+    with closing(_connect(db_path)) as conn:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = _job_dict(row)
+        job["stages"] = [dict(r) for r in conn.execute(
+            "SELECT stage, status, started_at, finished_at FROM job_stages WHERE job_id = ? ORDER BY rowid",
+            (job_id,),
+        )]
+        job["events"] = [dict(r) for r in conn.execute(
+            "SELECT ts, level, message FROM job_events WHERE job_id = ? ORDER BY ts DESC LIMIT ?",
+            (job_id, events),
+        )][::-1]
+        job["queue_position"] = None
+        if job["status"] == "queued":
+            job["queue_position"] = 1 + conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created_at < ?",
+                (job["created_at"],),
+            ).fetchone()[0]
+    return job
+
+
+def list_jobs(statuses=ACTIVE_STATUSES, limit: int = 20, db_path: str = JOB_DB_PATH) -> list:
+    """Các job có trạng thái trong `statuses` (None = tất cả), mới nhất trước."""
+    with closing(_connect(db_path)) as conn:
+        if statuses:
+            placeholders = ",".join("?" * len(statuses))
+            rows = conn.execute(
+                f"SELECT * FROM jobs WHERE status IN ({placeholders}) ORDER BY created_at DESC LIMIT ?",
+                (*statuses, limit),
+            )
+        else:
+            rows = conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,))
+        return [_job_dict(r) for r in rows]
+
+
+def cancel_job(job_id: str, db_path: str = JOB_DB_PATH) -> bool:
+    """Huỷ job: đang chờ thì huỷ ngay, đang chạy thì scheduler dừng process worker. False nếu job đã xong."""
+    now = time.time()
+    with closing(_connect(db_path)) as conn:
+        cur = conn.execute(
+            "UPDATE jobs SET status = 'cancelled', message = 'Đã huỷ', finished_at = ?, updated_at = ? "
+            "WHERE id = ? AND status = 'queued'",
+            (now, now, job_id),
+        )
+        if not cur.rowcount:
+            cur = conn.execute(
+                "UPDATE jobs SET cancel_requested = 1, updated_at = ? WHERE id = ? AND status = 'running'",
+                (now, job_id),
+            )
+        conn.commit()
+        return bool(cur.rowcount)
+
+
+# ====== PHÍA WORKER ======
+
+class JobCancelled(BaseException):
+    """
+    Job bị huỷ trong lúc đang chạy (kế thừa BaseException như KeyboardInterrupt để
+    các chỗ `except Exception` trong pipeline không nuốt mất).
+    """
+
+
+class JobReporter(Reporter):
+    """
+    Reporter của process worker: ghi tiến độ / stage / thông báo của job vào SQLite.
+    Mỗi lần báo tiến độ / stage cũng kiểm tra job có bị huỷ không (raise JobCancelled).
+    """
+
+    def __init__(self, job_id: str, db_path: str = JOB_DB_PATH):
+        self.job_id = job_id
+        self.db_path = db_path
+        self._conn = _connect(db_path)
+        self._last_write = 0.0
+        self._last_cancel_check = 0.0
+        self._percent = -1
+
+    def check_cancelled(self):
+        now = time.monotonic()
+        if now - self._last_cancel_check < _CANCEL_CHECK_SEC:
+            return
+        self._last_cancel_check = now
+        row = self._conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (self.job_id,)).fetchone()
+        if row is not None and row["cancel_requested"]:
+            raise JobCancelled(self.job_id)
+
+    def _event(self, level: str, message: str):
+        self._conn.execute(
+            "INSERT INTO job_events (job_id, ts, level, message) VALUES (?, ?, ?, ?)",
+            (self.job_id, time.time(), level, message),
+        )
+        self._conn.commit()
+
+    def info(self, message: str):
+        self._event("info", message)
+
+    def success(self, message: str):
+        self._event("success", message)
+
+    def warning(self, message: str):
+        self._event("warning", message)
+
+    def error(self, message: str):
+        self._event("error", message)
+
+    def progress(self, percent: int, text: str | None = None):
+        self.check_cancelled()
+        now = time.monotonic()
+        # chỉ ghi khi có text mới hoặc đã đủ lâu từ lần ghi trước
+        if text is None and (percent == self._percent or now - self._last_write < 1.0 / _PROGRESS_WRITES_PER_SEC):
+            return
+        self._percent = percent
+        self._last_write = now
+        if text is None:
+            self._conn.execute(
+                "UPDATE jobs SET percent = ?, updated_at = ? WHERE id = ?",
+                (int(percent), time.time(), self.job_id),
+            )
+        else:
+            self._conn.execute(
+                "UPDATE jobs SET percent = ?, message = ?, updated_at = ? WHERE id = ?",
+                (int(percent), text, time.time(), self.job_id),
+            )
+        self._conn.commit()
+
+    def stage(self, name: str, status: str):
+        self.check_cancelled()
+        now = time.time()
+        if status == "running":
+            self._conn.execute(
+                "INSERT INTO job_stages (job_id, stage, status, started_at) VALUES (?, ?, 'running', ?) "
+                "ON CONFLICT (job_id, stage) DO UPDATE SET status = 'running', started_at = excluded.started_at",
+                (self.job_id, name, now),
+            )
+        else:
+            self._conn.execute(
+                "INSERT INTO job_stages (job_id, stage, status, finished_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (job_id, stage) DO UPDATE SET status = excluded.status, finished_at = excluded.finished_at",
+                (self.job_id, name, status, now),
+            )
+        self._conn.commit()
+
+    def indexed(self, indexed_sec: float, total_sec: float):
+        self._conn.execute(
+            "UPDATE jobs SET indexed_sec = ?, total_sec = ?, updated_at = ? WHERE id = ?",
+            (float(indexed_sec), float(total_sec), time.time(), self.job_id),
+        )
+        self._conn.commit()
+
+    def finish(self, status: str, result=None, error: str | None = None, message: str | None = None):
+        now = time.time()
+        self._conn.execute(
+            "UPDATE jobs SET status = ?, percent = CASE WHEN ? = 'done' THEN 100 ELSE percent END, "
+            "result = ?, error = ?, message = COALESCE(?, message), finished_at = ?, updated_at = ? "
+            "WHERE id = ? AND status = 'running'",
+            (status, status, json.dumps(result) if result is not None else None, error, message, now, now, self.job_id),
+        )
+        self._conn.commit()
+
+
+def _claim_job(db_path: str, cpu_budget: int, pid: int, pid_started: float | None = None):
+    """
+    Nhận job đang chờ lâu nhất nếu còn đủ CPU trong ngân sách (giữ thứ tự FIFO:
+    không cho job nhỏ chen lên trước). Trả về (job_id, cpus) hoặc None.
+    pid_started: thời điểm khởi động của process worker (xem _process_start_time).
+    """
+    with closing(_connect(db_path)) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "SELECT id, cpus FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+        ).fetchone()
+        if row is None:
+            conn.rollback()
+            return None
+        used = conn.execute("SELECT COALESCE(SUM(cpus), 0) FROM jobs WHERE status = 'running'").fetchone()[0]
+        cpus = min(row["cpus"], cpu_budget)
+        if used + cpus > cpu_budget:
+            conn.rollback()
+            return None
+        now = time.time()
+        conn.execute(
+            "UPDATE jobs SET status = 'running', pid = ?, pid_started = ?, message = ?, started_at = ?, updated_at = ? "
+            "WHERE id = ?",
+            (pid, pid_started, "🚀 Bắt đầu xử lý...", now, now, row["id"]),
+        )
+        conn.commit()
+        return row["id"], cpus
+
+
+def _run_job(job_id: str, db_path: str, cpus: int):
+    """Xử lý một video trong process worker, reporter ghi tiến độ / kết quả vào DB."""
+    from src.reporter import use_reporter
+    from src.ingest_pipeline import ingest_video
+
+    reporter = JobReporter(job_id, db_path)
+    job = get_job(job_id, events=0, db_path=db_path)
+    try:
+        import torch
+        torch.set_num_threads(cpus)
+    except ImportError:
+        pass
+
+    try:
+        with use_reporter(reporter):
+            result = ingest_video(job["video_path"], video_name=job["video_name"], model_size=job["model_size"])
+    except JobCancelled:
+        reporter.finish("cancelled", message="Đã huỷ")
+        return
+    except Exception as e:
+        reporter.error(f"Lỗi khi xử lý video: {e}")
+        reporter.finish("failed", error=str(e))
+        return
+    if result is None:
+        last_error = next((ev["message"] for ev in reversed(get_job(job_id, db_path=db_path)["events"])
+                           if ev["level"] == "error"), "Xử lý video thất bại")
+        reporter.finish("failed", error=last_error)
+    else:
+        reporter.finish("done", result=result)
+
+
+def _warm_up_worker():
+    """Load sẵn model embedding và model Whisper cho các job sắp tới của worker."""
+    from src.resource_cache import get_embeddings
+    from src.whisper_registry import warm_up, DEFAULT_WHISPER_MODEL
+
+    sizes = JOB_WARMUP_MODELS or os.getenv("WHISPER_WARMUP", "") or DEFAULT_WHISPER_MODEL
+    try:
+        get_embeddings().model
+        warm_up([s.strip() for s in sizes.split(",") if s.strip()], background=False)
+    except Exception as e:
+        # không load sẵn được thì job đầu tiên sẽ load (và báo lỗi qua reporter nếu có)
+        print(f"[job_queue] Worker {os.getpid()} không load sẵn được model: {e}", file=sys.stderr, flush=True)
+
+
+def _worker_main(db_path: str, cpu_budget: int, threads: int, stop_event, parent_pid: int):
+    """
+    Vòng lặp của một process worker trong pool: load model một lần, rồi lần lượt
+    nhận job từ DB và xử lý. Dừng khi scheduler yêu cầu hoặc process scheduler đã chết.
+    """
+    # giới hạn số thread của torch / BLAS theo số core của mỗi job, trước khi import torch
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    from src.telemetry import flush_metrics
+
+    _warm_up_worker()
+    pid = os.getpid()
+    pid_started = _process_start_time(pid)
+    while not stop_event.is_set() and os.getppid() == parent_pid:
+        claimed = _claim_job(db_path, cpu_budget, pid, pid_started)
+        if claimed is None:
+            stop_event.wait(POLL_INTERVAL_SEC)
+            continue
+        job_id, cpus = claimed
+        try:
+            _run_job(job_id, db_path, cpus)
+        except Exception as e:
+            # lỗi ngoài pipeline (vd. DB): job được scheduler xử lý như worker chết
+            print(f"[job_queue] Worker {pid} lỗi khi chạy job {job_id}: {e}", file=sys.stderr, flush=True)
+            return
+        finally:
+            # metrics của job cho /metrics của app (xem telemetry.METRICS_DIR)
+            flush_metrics()
+
+
+# ====== SCHEDULER ======
+
+def _discard_partial(video_name: str):
+    """
+    Xoá phần bài giảng đã index dần khi worker bị huỷ / chết (không kịp tự dọn),
+    để index không giữ một bài giảng thiếu nội dung.
+    """
+    from src.vector_store_builder import partial_videos, delete_video
+
+    try:
+        if video_name in partial_videos():
+            delete_video(video_name)
+    except Exception as e:
+        print(f"[job_queue] Không xoá được phần đã index của {video_name}: {e}", file=sys.stderr, flush=True)
+
+
+def _process_start_time(pid) -> float | None:
+    """
+    Thời điểm khởi động của process `pid` (Linux: trường starttime trong /proc/<pid>/stat,
+    tính bằng clock tick từ lúc boot), None nếu không đọc được.
+    """
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # tên process (trường 2) nằm trong ngoặc và có thể chứa dấu cách -> tách sau ")" cuối
+    fields = stat[stat.rfind(b")") + 2:].split()
+    try:
+        return float(fields[19])
+    except (IndexError, ValueError):
+        return None
+
+
+def _pid_alive(pid, started: float | None = None) -> bool:
+    """
+    Process `pid` còn sống. started (thời điểm khởi động đã lưu khi process nhận job):
+    pid đã bị hệ điều hành cấp lại cho process khác thì coi như đã chết.
+    """
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    if started is not None:
+        current = _process_start_time(pid)
+        if current is not None and current != started:
+            return False
+    return True
+
+
+class JobScheduler:
+    """
+    Giữ pool JOB_WORKERS process worker sống lâu (worker tự nhận job từ DB trong ngân
+    sách CPU), thay worker chết, xử lý job của worker chết và yêu cầu huỷ job.
+    Mỗi DB chỉ có một scheduler hoạt động (khoá file <db>.lock); scheduler khác
+    (vd. process Streamlit thứ hai) chỉ đứng chờ tới khi lấy được khoá.
+    """
+
+    def __init__(self, db_path: str = JOB_DB_PATH, cpu_budget: int = JOB_CPU_BUDGET, workers: int = JOB_WORKERS):
+        self.db_path = db_path
+        self.cpu_budget = cpu_budget
+        self.workers = max(1, workers)
+        self._ctx = mp.get_context("spawn")
+        self._worker_stop = self._ctx.Event()
+        self._pool: list = []       # process worker của pool
+        self._external: dict = {}   # job_id -> (pid, pid_started): job của worker thuộc scheduler trước (còn sống)
+        self._cancel_seen: dict = {}   # job_id -> thời điểm thấy yêu cầu huỷ (monotonic)
+        self._stop = threading.Event()
+        self._lock_file = None
+        self._thread = None
+
+    # ---------- khoá: một scheduler cho mỗi DB ----------
+
+    def _try_lock(self) -> bool:
+        if self._lock_file is not None:
+            return True
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        lock_file = open(self.db_path + ".lock", "a+")
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+        self._lock_file = lock_file
+        return True
+
+    # ---------- pool worker ----------
+
+    def _spawn_worker(self):
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(self.db_path, self.cpu_budget, min(JOB_CPUS_PER_JOB, self.cpu_budget), self._worker_stop, os.getpid()),
+            name=f"ingest-worker-{len(self._pool)}",
+        )
+        process.start()
+        self._pool.append(process)
+
+    def _maintain_pool(self):
+        while len(self._pool) < self.workers:
+            self._spawn_worker()
+
+    def _worker_ids(self) -> set:
+        """(pid, thời điểm khởi động) của các worker trong pool."""
+        return {(process.pid, _process_start_time(process.pid)) for process in self._pool}
+
+    # ---------- vòng lặp ----------
+
+    def _recover(self, conn):
+        """
+        Job 'running' không thuộc worker nào đang sống của pool (vd. của scheduler trước):
+        worker còn sống thì theo dõi tiếp tới khi nó kết thúc, chết rồi thì chạy lại.
+        Worker được nhận diện bằng pid + thời điểm khởi động: pid bị cấp lại cho process
+        khác (kể cả một worker mới của pool) không làm job bị treo ở 'running'.
+        """
+        workers = self._worker_ids()
+        for row in conn.execute("SELECT id, pid, pid_started FROM jobs WHERE status = 'running'").fetchall():
+            if row["id"] in self._external:
+                continue
+            if (row["pid"], row["pid_started"]) in workers:
+                continue
+            if row["pid_started"] is None and row["pid"] in {pid for pid, _ in workers}:
+                continue   # job nhận trước khi có cột pid_started
+            if _pid_alive(row["pid"], row["pid_started"]):
+                self._external[row["id"]] = (row["pid"], row["pid_started"])
+            else:
+                # các stage đã xong nằm trong ingest_cache -> chạy lại chỉ làm phần còn thiếu
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', pid = NULL, pid_started = NULL, message = ?, updated_at = ? "
+                    "WHERE id = ? AND status = 'running'",
+                    ("⏳ Worker bị dừng giữa chừng, đang chờ chạy lại...", time.time(), row["id"]),
+                )
+        conn.commit()
+
+    def _requeue_or_fail(self, conn, job_id: str, exitcode):
+        """
+        Job của worker đã chết mà chưa ghi kết quả (vd. bị OOM kill) -> xếp hàng chạy
+        lại (tối đa JOB_MAX_RETRIES lần), quá số lần thì failed.
+        """
+        row = conn.execute(
+            "SELECT video_name, retries, cancel_requested FROM jobs WHERE id = ? AND status = 'running'",
+            (job_id,),
+        ).fetchone()
+        if row is None or row["cancel_requested"]:
+            return   # đã ghi kết quả, hoặc _cancel_requested() sẽ xử lý
+        now = time.time()
+        if row["retries"] < JOB_MAX_RETRIES:
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', pid = NULL, pid_started = NULL, retries = retries + 1, "
+                "message = ?, updated_at = ? "
+                "WHERE id = ? AND status = 'running'",
+                (f"⏳ Worker dừng bất thường (exit code {exitcode}), đang chờ chạy lại "
+                 f"(lần {row['retries'] + 1}/{JOB_MAX_RETRIES})...", now, job_id),
+            )
+            conn.commit()
+            return
+        cur = conn.execute(
+            "UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, updated_at = ? "
+            "WHERE id = ? AND status = 'running'",
+            (f"Worker kết thúc bất thường (exit code {exitcode}) sau {row['retries']} lần chạy lại", now, now, job_id),
+        )
+        conn.commit()
+        if cur.rowcount:
+            _discard_partial(row["video_name"])
+
+    def _reap(self, conn):
+        """Bỏ worker đã chết khỏi pool (_maintain_pool() thay worker mới) và xử lý job nó đang chạy."""
+        for process in [p for p in self._pool if not p.is_alive()]:
+            self._pool.remove(process)
+            process.join()
+            for row in conn.execute(
+                "SELECT id FROM jobs WHERE status = 'running' AND pid = ?", (process.pid,)
+            ).fetchall():
+                self._requeue_or_fail(conn, row["id"], process.exitcode)
+        for job_id, (pid, started) in list(self._external.items()):
+            if not _pid_alive(pid, started):
+                del self._external[job_id]
+                self._requeue_or_fail(conn, job_id, None)
+
+    def _cancel_requested(self, conn):
+        """
+        Job bị huỷ tự dừng ở lần báo tiến độ kế tiếp (JobCancelled, worker vẫn sống);
+        quá JOB_CANCEL_GRACE_SEC mà chưa dừng thì dừng hẳn worker đang chạy job.
+        """
+        rows = conn.execute(
+            "SELECT id, video_name, pid, pid_started FROM jobs WHERE status = 'running' AND cancel_requested = 1"
+        ).fetchall()
+        active = {row["id"] for row in rows}
+        for job_id in list(self._cancel_seen):
+            if job_id not in active:
+                del self._cancel_seen[job_id]
+        now_mono = time.monotonic()
+        for row in rows:
+            seen = self._cancel_seen.setdefault(row["id"], now_mono)
+            if now_mono - seen < JOB_CANCEL_GRACE_SEC:
+                continue
+            del self._cancel_seen[row["id"]]
+            process = next((p for p in self._pool if p.pid == row["pid"]), None)
+            if process is not None:
+                process.terminate()
+                process.join(5)
+                self._pool.remove(process)
+            else:
+                self._external.pop(row["id"], None)
+                if _pid_alive(row["pid"], row["pid_started"]):
+                    os.kill(row["pid"], 15)
+            now = time.time()
+            # worker có thể vừa ghi xong kết quả trước khi bị dừng -> giữ kết quả đó
+            cur = conn.execute(
+                "UPDATE jobs SET status = 'cancelled', message = 'Đã huỷ', finished_at = ?, updated_at = ? "
+                "WHERE id = ? AND status = 'running'",
+                (now, now, row["id"]),
+            )
+            conn.commit()
+            if cur.rowcount:
+                _discard_partial(row["video_name"])
+
+    def step(self) -> bool:
+        """Một vòng lập lịch. False nếu scheduler khác đang giữ DB."""
+        if not self._try_lock():
+            return False
+        with closing(_connect(self.db_path)) as conn:
+            self._reap(conn)
+            self._recover(conn)
+            self._cancel_requested(conn)
+        self._maintain_pool()
+        return True
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                self.step()
+            except Exception as e:
+                print(f"[job_queue] Lỗi scheduler: {e}", file=sys.stderr, flush=True)
+            self._stop.wait(POLL_INTERVAL_SEC)
+
+    def start(self):
+        """Chạy scheduler ở thread nền."""
+        self._thread = threading.Thread(target=self.run, name="job-scheduler", daemon=True)
+        self._thread.start()
+        # worker không phải daemon (được tạo process con khi phiên âm song song):
+        # báo dừng trước khi multiprocessing chờ chúng lúc thoát process
+        atexit.register(self.stop)
+        return self
+
+    def stop(self):
+        """Dừng scheduler; worker dừng sau job đang chạy (nếu có)."""
+        self._stop.set()
+        self._worker_stop.set()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_job_scheduler() -> JobScheduler:
+    """Scheduler dùng chung của process (khởi động ở lần gọi đầu tiên)."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = JobScheduler().start()
+    return _scheduler
+
+
+def main():
+    scheduler = JobScheduler()
+    print(
+        f"Scheduler job: {JOB_DB_PATH}, ngân sách {scheduler.cpu_budget} CPU, {JOB_CPUS_PER_JOB} CPU/job, "
+        f"{scheduler.workers} worker",
+        flush=True,
+    )
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        scheduler.stop()
+
+
+if __name__ == "__main__":
+    main()
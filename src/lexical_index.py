@@ -0,0 +1,160 @@
+import json
+import math
+import os
+import re
+import unicodedata
+from collections import Counter
+
+# ====== INVERTED INDEX BM25 CHO TRANSCRIPT ======
+# Embedding all-MiniLM-L6-v2 được train chủ yếu trên tiếng Anh nên hay bỏ lỡ
+# các thuật ngữ chính xác ("cross entropy", "gradient descent") trong transcript
+# tiếng Việt. Index từ vựng này được build song song với FAISS và lưu cạnh nó:
+# - bỏ dấu tiếng Việt (đạo hàm -> dao ham) để không lệ thuộc Whisper bỏ dấu đúng/sai
+# - index cả từng âm tiết lẫn cặp âm tiết liền nhau (từ ghép tiếng Việt phần lớn
+#   gồm 2 âm tiết, nên "dao_ham" phân biệt được với "dao" / "ham" đứng riêng)
+# Nối thêm chunk (index dần) chỉ ghi thêm dòng vào LEXICAL_DELTA_FILE; save() ghi lại
+# toàn bộ vào LEXICAL_INDEX_FILE và xoá file delta.
+
+LEXICAL_INDEX_FILE = "lexical_index.json"
+LEXICAL_DELTA_FILE = "lexical_index.delta.jsonl"
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def normalize_text(text: str) -> str:
+    """Chữ thường, bỏ dấu tiếng Việt (kể cả đ -> d), chỉ giữ chữ và số."""
+    text = text.lower().replace("đ", "d")
+    text = unicodedata.normalize("NFD", text)
+    text = "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+    return re.sub(r"[^a-z0-9]+", " ", text).strip()
+
+
+def tokenize(text: str):
+    """Âm tiết + cặp âm tiết liền nhau (bigram) của text đã chuẩn hoá."""
+    syllables = normalize_text(text).split()
+    bigrams = [f"{a}_{b}" for a, b in zip(syllables, syllables[1:])]
+    return syllables + bigrams
+
+
+class LexicalIndex:
+    """Inverted index BM25 hỗ trợ thêm / xoá document theo id."""
+
+    def __init__(self):
+        self.doc_terms: dict = {}   # doc_id -> {term: tf}
+        self.doc_len: dict = {}     # doc_id -> số token
+        self.doc_video: dict = {}   # doc_id -> video_name (để lọc theo bài giảng)
+        self.postings: dict = {}    # term -> {doc_id: tf}
+        self.total_len = 0
+
+    def __len__(self):
+        return len(self.doc_terms)
+
+    def add(self, doc_id: str, text: str, video_name: str = ""):
+        self._add_terms(doc_id, dict(Counter(tokenize(text))), video_name)
+
+    def _add_terms(self, doc_id: str, terms: dict, video_name: str):
+        if doc_id in self.doc_terms:
+            self.remove(doc_id)
+        self.doc_terms[doc_id] = terms
+        self.doc_len[doc_id] = sum(terms.values())
+        self.doc_video[doc_id] = video_name
+        self.total_len += self.doc_len[doc_id]
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+
+    def remove(self, doc_id: str):
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        self.total_len -= self.doc_len.pop(doc_id, 0)
+        self.doc_video.pop(doc_id, None)
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(doc_id, None)
+                if not posting:
+                    del self.postings[term]
+
+    def remove_video(self, video_name: str):
+        for doc_id in [d for d, v in self.doc_video.items() if v == video_name]:
+            self.remove(doc_id)
+
+    def search(self, query: str, k: int = 20, video_names=None):
+        """
+        Top-k document theo điểm BM25. video_names: chỉ lấy document thuộc các bài giảng này.
+        Trả về list (doc_id, score) giảm dần theo score.
+        """
+        n_docs = len(self.doc_terms)
+        if n_docs == 0:
+            return []
+        allowed = set(video_names) if video_names else None
+        avg_len = self.total_len / n_docs
+
+        scores: dict = {}
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            df = len(posting)
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            for doc_id, tf in posting.items():
+                if allowed is not None and self.doc_video.get(doc_id) not in allowed:
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len[doc_id] / avg_len)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    # ----- lưu / đọc file -----
+    def save(self, index_dir: str):
+        path = os.path.join(index_dir, LEXICAL_INDEX_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"doc_terms": self.doc_terms, "doc_video": self.doc_video}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        # delta đã nằm trong file chính (load lại delta cũ cũng không sai: add() thay document cùng id)
+        try:
+            os.remove(os.path.join(index_dir, LEXICAL_DELTA_FILE))
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def append(index_dir: str, docs):
+        """Ghi thêm document (doc_id, text, video_name) vào file delta, không ghi lại cả index."""
+        with open(os.path.join(index_dir, LEXICAL_DELTA_FILE), "a", encoding="utf-8") as f:
+            for doc_id, text, video_name in docs:
+                f.write(json.dumps(
+                    {"id": doc_id, "terms": dict(Counter(tokenize(text))), "video": video_name},
+                    ensure_ascii=False,
+                ) + "\n")
+
+    @classmethod
+    def load(cls, index_dir: str):
+        """Đọc index (file chính + delta) từ `index_dir`; trả về None nếu chưa có file chính."""
+        path = os.path.join(index_dir, LEXICAL_INDEX_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        index = cls()
+        for doc_id, terms in data["doc_terms"].items():
+            index.doc_terms[doc_id] = terms
+            index.doc_len[doc_id] = sum(terms.values())
+            index.doc_video[doc_id] = data["doc_video"].get(doc_id, "")
+            index.total_len += index.doc_len[doc_id]
+            for term, tf in terms.items():
+                index.postings.setdefault(term, {})[doc_id] = tf
+
+        try:
+            with open(os.path.join(index_dir, LEXICAL_DELTA_FILE), "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue   # dòng cuối ghi dở (process bị dừng giữa chừng)
+                    index._add_terms(entry["id"], entry["terms"], entry.get("video", ""))
+        except FileNotFoundError:
+            pass
+        return index
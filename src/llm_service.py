@@ -0,0 +1,352 @@
+import asyncio
+import os
+import queue
+import random
+import threading
+import time
+from typing import Iterator
+
+import groq
+from langchain_groq import ChatGroq
+
+from src.telemetry import inc, observe, set_gauge
+
+# ====== DỊCH VỤ GỌI LLM DÙNG CHUNG (POOL CLIENT + GIỚI HẠN TỐC ĐỘ + RETRY) ======
+# Mọi phiên Streamlit gọi LLM qua một service duy nhất của process:
+# - mỗi model một client ChatGroq dùng chung (pool kết nối HTTP của groq SDK)
+# - token bucket theo requests/phút và tokens/phút của từng model: yêu cầu vượt
+#   hạn mức phải chờ trong hàng đợi thay vì bị Groq trả 429
+# - lỗi 429 / 5xx / mất kết nối được thử lại với backoff ngẫu nhiên (full jitter),
+#   tôn trọng header Retry-After; 429 còn tạm dừng bucket của model đó
+# - hàng đợi có giới hạn: quá LLM_QUEUE_MAX yêu cầu đang chờ thì từ chối ngay
+#   (QueueFullError) để UI báo "đang quá tải" thay vì treo
+# Các coroutine chạy trên một event loop riêng (thread nền); code đồng bộ
+# (Streamlit, CLI) gọi complete() / stream(), code async gọi acomplete() / astream().
+#
+# GROQ_BASE_URL trỏ tới server khác (vd. benchmarks/mock_groq.py) để thử tải.
+
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL", "")
+LLM_TEMPERATURE = 0.2
+
+# (requests/phút, tokens/phút) theo hạn mức gói free của Groq
+MODEL_RATE_LIMITS = {
+    "llama-3.1-8b-instant": (30, 6000),
+    "llama-3.3-70b-versatile": (30, 12000),
+    "openai/gpt-oss-20b": (30, 8000),
+}
+DEFAULT_RATE_LIMIT = (30, 6000)
+# đặt thì ghi đè hạn mức của mọi model (vd. tài khoản trả phí)
+GROQ_RPM = int(os.getenv("GROQ_RPM", "0"))
+GROQ_TPM = int(os.getenv("GROQ_TPM", "0"))
+
+# số token câu trả lời ước tính khi xin quota (trả lại phần thừa sau khi biết usage thật)
+COMPLETION_TOKENS_ESTIMATE = int(os.getenv("LLM_COMPLETION_TOKENS", "512"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_QUEUE_MAX = int(os.getenv("LLM_QUEUE_MAX", "64"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE_SEC = 0.5
+LLM_BACKOFF_MAX_SEC = 20.0
+LLM_REQUEST_TIMEOUT_SEC = float(os.getenv("LLM_REQUEST_TIMEOUT_SEC", "60"))
+
+
+class LLMServiceError(Exception):
+    """Gọi LLM thất bại sau khi đã thử lại (thông báo dùng được cho người dùng)."""
+
+
+class QueueFullError(LLMServiceError):
+    """Hàng đợi đã đầy, yêu cầu bị từ chối ngay."""
+
+
+class TokenBucket:
+    """
+    Token bucket async: nạp `per_minute` đơn vị mỗi phút, chứa tối đa `per_minute`.
+    acquire() chờ theo thứ tự đến (FIFO); pause() chặn cả bucket (sau khi bị 429).
+    """
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1.0) -> float:
+        """Lấy `amount` đơn vị (tối đa bằng capacity), trả về số giây đã chờ."""
+        amount = min(float(amount), self.capacity)
+        t0 = time.monotonic()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return time.monotonic() - t0
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def refund(self, amount: float):
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + max(float(amount), 0.0))
+
+    def pause(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+def _rate_limit(model_id: str):
+    rpm, tpm = MODEL_RATE_LIMITS.get(model_id, DEFAULT_RATE_LIMIT)
+    return GROQ_RPM or rpm, GROQ_TPM or tpm
+
+
+def _retry_after(error) -> float | None:
+    """Giây cần chờ theo header retry-after(-ms) của response lỗi (nếu có)."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is None:
+        return None
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        try:
+            return float(headers.get(name)) * scale
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def _classify(error) -> str | None:
+    """Lý do có thể thử lại ("rate_limit" / "server" / "connection"), None = lỗi không thử lại."""
+    if isinstance(error, groq.RateLimitError):
+        return "rate_limit"
+    if isinstance(error, (groq.APIConnectionError, asyncio.TimeoutError)):
+        return "connection"
+    if isinstance(error, groq.APIStatusError) and error.status_code >= 500:
+        return "server"
+    return None
+
+
+def _backoff(attempt: int, retry_after: float | None) -> float:
+    """Full jitter: ngẫu nhiên trong [0, base * 2^attempt], không ít hơn Retry-After."""
+    delay = random.uniform(0, min(LLM_BACKOFF_MAX_SEC, LLM_BACKOFF_BASE_SEC * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def _usage_tokens(message) -> int | None:
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return int(usage.get("total_tokens") or 0) or None
+    return None
+
+
+class LLMService:
+    """Xem chú thích đầu file. Dùng get_llm_service() thay vì tạo trực tiếp."""
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, max_queue: int = LLM_QUEUE_MAX):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._clients: dict = {}    # model_id -> ChatGroq
+        self._buckets: dict = {}    # model_id -> (bucket requests, bucket tokens)
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._in_flight = 0
+
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="llm-service", daemon=True)
+        self._thread.start()
+        self._slots = asyncio.run_coroutine_threadsafe(self._make_semaphore(), self.loop).result()
+
+    async def _make_semaphore(self):
+        return asyncio.Semaphore(self.max_concurrency)
+
+    # ---------- client + hạn mức theo model ----------
+
+    def client(self, model_id: str):
+        """ChatGroq dùng chung của `model_id` (retry do service tự làm nên max_retries=0)."""
+        with self._lock:
+            llm = self._clients.get(model_id)
+            if llm is None:
+                kwargs = {"base_url": GROQ_BASE_URL} if GROQ_BASE_URL else {}
+                llm = ChatGroq(
+                    model=model_id,
+                    temperature=LLM_TEMPERATURE,
+                    groq_api_key=os.getenv("GROQ_API_KEY"),
+                    max_retries=0,
+                    request_timeout=LLM_REQUEST_TIMEOUT_SEC,
+                    **kwargs,
+                )
+                self._clients[model_id] = llm
+            return llm
+
+    def _buckets_of(self, model_id: str):
+        # chỉ gọi trong event loop của service
+        buckets = self._buckets.get(model_id)
+        if buckets is None:
+            rpm, tpm = _rate_limit(model_id)
+            buckets = (TokenBucket(rpm), TokenBucket(tpm))
+            self._buckets[model_id] = buckets
+        return buckets
+
+    # ---------- hàng đợi ----------
+
+    def _admit(self):
+        with self._lock:
+            if self._waiting >= self.max_queue:
+                inc("llm_rejected_total")
+                raise QueueFullError("Hệ thống đang quá tải, vui lòng thử lại sau ít phút.")
+            self._waiting += 1
+            set_gauge("llm_queue_depth", self._waiting)
+
+    def _change(self, waiting: int = 0, in_flight: int = 0):
+        with self._lock:
+            self._waiting += waiting
+            self._in_flight += in_flight
+            set_gauge("llm_queue_depth", self._waiting)
+            set_gauge("llm_in_flight", self._in_flight)
+
+    def queue_depth(self) -> int:
+        """Số yêu cầu đang chờ (chưa được gửi tới LLM)."""
+        return self._waiting
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"queue_depth": self._waiting, "in_flight": self._in_flight, "max_queue": self.max_queue}
+
+    async def _wait_turn(self, model_id: str, prompt_tokens: int):
+        """Chờ slot + quota của model. Trả về số token đã xin."""
+        requests_bucket, tokens_bucket = self._buckets_of(model_id)
+        t0 = time.monotonic()
+        await self._slots.acquire()
+        try:
+            await requests_bucket.acquire(1)
+            reserved = prompt_tokens + COMPLETION_TOKENS_ESTIMATE
+            await tokens_bucket.acquire(reserved)
+        except BaseException:
+            self._slots.release()
+            raise
+        observe("llm_queue_wait_seconds", time.monotonic() - t0, model=model_id)
+        return reserved
+
+    async def _call(self, model_id: str, prompt_tokens: int, attempt_fn):
+        """
+        Chạy attempt_fn() (một lần gọi LLM) với hàng đợi, quota và retry.
+        attempt_fn trả về (kết quả, số token thật hoặc None); raise lỗi của groq.
+        """
+        started = False   # stream đã trả token cho người dùng -> không thử lại được
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            reserved = await self._wait_turn(model_id, prompt_tokens)
+            self._change(waiting=-1, in_flight=1)
+            try:
+                result, used = await attempt_fn()
+                if used is not None:
+                    self._buckets_of(model_id)[1].refund(reserved - used)
+                return result
+            except Exception as e:
+                reason = _classify(e)
+                started = started or getattr(e, "_llm_started", False)
+                if reason is None or started or attempt == LLM_MAX_RETRIES:
+                    inc("llm_failures_total", model=model_id, reason=reason or type(e).__name__)
+                    raise LLMServiceError(_user_message(reason)) from e
+                retry_after = _retry_after(e)
+                if reason == "rate_limit":
+                    self._buckets_of(model_id)[0].pause(retry_after or LLM_BACKOFF_BASE_SEC)
+                inc("llm_retries_total", model=model_id, reason=reason)
+                delay = _backoff(attempt, retry_after)
+            finally:
+                self._change(waiting=1, in_flight=-1)
+                self._slots.release()
+            await asyncio.sleep(delay)
+
+    # ---------- API async ----------
+
+    async def acomplete(self, model_id: str, prompt: str, prompt_tokens: int = 0) -> str:
+        llm = self.client(model_id)
+
+        async def attempt():
+            message = await llm.ainvoke(prompt)
+            return message.content, _usage_tokens(message)
+
+        self._admit()
+        try:
+            return await self._call(model_id, prompt_tokens, attempt)
+        finally:
+            self._change(waiting=-1)
+
+    async def astream(self, model_id: str, prompt: str, prompt_tokens: int = 0, on_text=None) -> str:
+        """Stream câu trả lời, gọi on_text(text) cho từng đoạn; trả về câu trả lời đầy đủ."""
+        llm = self.client(model_id)
+
+        async def attempt():
+            parts = []
+            used = None
+            try:
+                async for chunk in llm.astream(prompt):
+                    used = _usage_tokens(chunk) or used
+                    if chunk.content:
+                        parts.append(chunk.content)
+                        if on_text is not None:
+                            on_text(chunk.content)
+            except Exception as e:
+                e._llm_started = bool(parts)
+                raise
+            return "".join(parts), used
+
+        self._admit()
+        try:
+            return await self._call(model_id, prompt_tokens, attempt)
+        finally:
+            self._change(waiting=-1)
+
+    # ---------- API đồng bộ (Streamlit / CLI) ----------
+
+    def submit(self, coro):
+        """Chạy coroutine trên event loop của service, trả về concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def complete(self, model_id: str, prompt: str, prompt_tokens: int = 0) -> str:
+        return self.submit(self.acomplete(model_id, prompt, prompt_tokens)).result()
+
+    def stream(self, model_id: str, prompt: str, prompt_tokens: int = 0) -> Iterator[str]:
+        """Iterator đồng bộ trên astream(); dừng đọc giữa chừng thì huỷ luôn yêu cầu."""
+        parts: queue.Queue = queue.Queue()
+        done = object()
+        future = self.submit(self.astream(model_id, prompt, prompt_tokens, on_text=parts.put))
+        future.add_done_callback(lambda _: parts.put(done))
+        try:
+            while True:
+                item = parts.get()
+                if item is done:
+                    break
+                yield item
+            future.result()   # raise LLMServiceError nếu thất bại
+        finally:
+            if not future.done():
+                future.cancel()
+
+
+def _user_message(reason: str | None) -> str:
+    if reason == "rate_limit":
+        return "Groq đang giới hạn tốc độ (quá nhiều câu hỏi cùng lúc), vui lòng thử lại sau ít phút."
+    if reason in ("server", "connection"):
+        return "Không kết nối được tới Groq, vui lòng thử lại sau."
+    return "Gọi LLM thất bại, vui lòng thử lại."
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_llm_service() -> LLMService:
+    """Service dùng chung của process (tạo ở lần gọi đầu tiên)."""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = LLMService()
+    return _service
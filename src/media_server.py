@@ -0,0 +1,197 @@
+import json
+import mimetypes
+import os
+import re
+import secrets
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote
+
+# ====== SERVER PHÁT VIDEO HỖ TRỢ HTTP RANGE REQUEST ======
+# Thay vì đọc cả file MP4 và nhúng base64 vào HTML ở mỗi lần rerun, video được
+# phục vụ qua một HTTP server nhỏ chạy nền trong process. Trình duyệt tự gửi
+# Range request nên chỉ tải phần cần phát / phần được tua tới (seekTo).
+# Chỉ các file đã đăng ký (qua token ngẫu nhiên) mới được phục vụ.
+# Mặc định chỉ nghe trên 127.0.0.1; truy cập từ máy khác thì đặt MEDIA_SERVER_HOST
+# và / hoặc MEDIA_SERVER_PUBLIC_URL (reverse proxy).
+# Metrics của pipeline (/metrics dạng Prometheus, /metrics.json) KHÔNG nằm trên cổng
+# media: chỉ bật khi đặt METRICS_PORT, server riêng, mặc định cũng chỉ nghe 127.0.0.1.
+
+MEDIA_SERVER_HOST = os.getenv("MEDIA_SERVER_HOST", "127.0.0.1")
+# 0 = để hệ điều hành chọn cổng trống
+MEDIA_SERVER_PORT = int(os.getenv("MEDIA_SERVER_PORT", "8765"))
+# URL trình duyệt dùng để truy cập server (vd. khi chạy sau reverse proxy)
+MEDIA_SERVER_PUBLIC_URL = os.getenv("MEDIA_SERVER_PUBLIC_URL", "")
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+# rỗng = không bật server metrics
+METRICS_PORT = os.getenv("METRICS_PORT", "")
+
+_COPY_BLOCK_BYTES = 1 << 16
+
+_lock = threading.Lock()
+_server = None
+_metrics_server = None
+_tokens: dict = {}   # token -> đường dẫn file
+_paths: dict = {}    # đường dẫn file -> token
+
+
+class _MediaHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        # không in log mỗi request ra console của Streamlit
+        pass
+
+    def _resolve(self):
+        m = re.fullmatch(r"/media/([A-Za-z0-9_-]+)(?:/[^/]*)?", self.path.split("?", 1)[0])
+        if not m:
+            return None
+        path = _tokens.get(m.group(1))
+        if not path or not os.path.isfile(path):
+            return None
+        return path
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def _serve(self, send_body: bool):
+        path = self._resolve()
+        if path is None:
+            self.send_error(404)
+            return
+
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        status = 200
+
+        range_header = self.headers.get("Range")
+        if range_header:
+            m = re.fullmatch(r"bytes=(\d*)-(\d*)", range_header.strip())
+            if not m or (not m.group(1) and not m.group(2)):
+                self.send_error(416)
+                return
+            if m.group(1):
+                start = int(m.group(1))
+                if m.group(2):
+                    end = min(int(m.group(2)), size - 1)
+            else:
+                # "bytes=-N": N byte cuối
+                start = max(size - int(m.group(2)), 0)
+            if start > end or start >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.end_headers()
+                return
+            status = 206
+
+        length = end - start + 1
+        self.send_response(status)
+        self.send_header("Content-Type", mimetypes.guess_type(path)[0] or "application/octet-stream")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(length))
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+
+        if not send_body:
+            return
+        try:
+            with open(path, "rb") as f:
+                f.seek(start)
+                remaining = length
+                while remaining > 0:
+                    block = f.read(min(_COPY_BLOCK_BYTES, remaining))
+                    if not block:
+                        break
+                    self.wfile.write(block)
+                    remaining -= len(block)
+        except (BrokenPipeError, ConnectionResetError):
+            # trình duyệt huỷ request khi tua video -> bình thường
+            pass
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """Metrics của pipeline (src.telemetry, mọi process) cho Prometheus scrape / xem nhanh."""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        from src.telemetry import render_prometheus, snapshot
+
+        route = self.path.split("?", 1)[0]
+        if route not in ("/metrics", "/metrics.json"):
+            self.send_error(404)
+            return
+        if route.endswith(".json"):
+            body = json.dumps(snapshot(), ensure_ascii=False).encode("utf-8")
+            content_type = "application/json"
+        else:
+            body = render_prometheus().encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _start_server(host: str, port: int, handler, name: str):
+    try:
+        server = ThreadingHTTPServer((host, port), handler)
+    except OSError as e:
+        # không tự chuyển sang cổng khác: URL / cấu hình scrape trỏ tới cổng cũ sẽ sai mà không ai biết
+        raise RuntimeError(f"Không mở được {name} tại {host}:{port} ({e}). Cổng đang bị chiếm?") from e
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name=name, daemon=True)
+    thread.start()
+    return server
+
+
+def _ensure_server():
+    global _server
+    if _server is not None:
+        return _server
+    _server = _start_server(MEDIA_SERVER_HOST, MEDIA_SERVER_PORT, _MediaHandler, "media-server")
+    return _server
+
+
+def get_media_url(path: str) -> str:
+    """
+    Đăng ký file `path` với media server (khởi động server nếu chưa chạy)
+    và trả về URL để thẻ <video> phát trực tiếp bằng Range request.
+    """
+    path = os.path.abspath(path)
+    with _lock:
+        server = _ensure_server()
+        token = _paths.get(path)
+        if token is None:
+            token = secrets.token_urlsafe(16)
+            _paths[path] = token
+            _tokens[token] = path
+
+    filename = quote(os.path.basename(path))
+    return f"{_base_url(server)}/media/{token}/{filename}"
+
+
+def _base_url(server) -> str:
+    base = MEDIA_SERVER_PUBLIC_URL.rstrip("/")
+    if not base:
+        base = f"http://localhost:{server.server_address[1]}"
+    return base
+
+
+def get_metrics_url() -> str | None:
+    """
+    Khởi động server metrics (nếu đặt METRICS_PORT và chưa chạy) và trả về URL /metrics
+    (định dạng Prometheus). None nếu không bật metrics.
+    """
+    global _metrics_server
+    if not METRICS_PORT:
+        return None
+    with _lock:
+        if _metrics_server is None:
+            _metrics_server = _start_server(METRICS_HOST, int(METRICS_PORT), _MetricsHandler, "metrics-server")
+        host, port = _metrics_server.server_address[:2]
+    return f"http://{host}:{port}/metrics"
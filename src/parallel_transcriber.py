@@ -0,0 +1,208 @@
+import os
+import re
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from src.audio_windows import split_at_silence
+from src.video_processor import SAMPLE_RATE
+from src.transcript_checkpoint import TranscriptCheckpoint
+from src.transcription_engine import TRANSCRIBE_ENGINE
+from src.reporter import get_reporter
+
+# ====== PHIÊN ÂM SONG SONG THEO CỬA SỔ ======
+# Audio được cắt tại chỗ im lặng thành các cửa sổ, mỗi process worker giữ
+# một engine phiên âm riêng (src.transcription_engine) và phiên âm từng cửa sổ; kết quả được ghép lại
+# với start/end tính theo thời gian gốc của cả file.
+# checkpoint=<đường dẫn>: mỗi cửa sổ xong được ghi vào checkpoint (src.transcript_checkpoint),
+# chạy lại thì bỏ qua các cửa sổ đã có.
+
+DEFAULT_WINDOW_SEC = float(os.getenv("WHISPER_WINDOW_SEC", "300"))
+
+# engine của process worker hiện tại (mỗi worker load model đúng một lần)
+_worker_engine = None
+
+
+def default_workers() -> int:
+    """Số worker mặc định: WHISPER_PARALLEL_WORKERS, nếu không đặt thì 0 (chạy tuần tự)."""
+    return int(os.getenv("WHISPER_PARALLEL_WORKERS", "0"))
+
+
+def _init_worker(engine: str, model_size: str, threads: int):
+    global _worker_engine
+    from src.transcription_engine import get_engine
+
+    # chia đều số core cho các worker, tránh mỗi worker giành hết core
+    _worker_engine = get_engine(engine, model_size, device="cpu", threads=max(threads, 1))
+
+
+def _load_window(source, start: int, end: int) -> np.ndarray:
+    """source là mảng audio hoặc đường dẫn file PCM float32 (memmap, không copy cả file)."""
+    if isinstance(source, str):
+        source = np.memmap(source, dtype=np.float32, mode="r")
+    return np.array(source[start:end], dtype=np.float32)
+
+
+def _transcribe_window(source, start: int, end: int, offset: float, language: str, engine=None):
+    """Phiên âm một cửa sổ, cộng `offset` (giây) để ra thời gian gốc."""
+    audio = _load_window(source, start, end)
+    segments = (engine or _worker_engine).transcribe(audio, language=language)
+    return [dict(seg, start=seg["start"] + offset, end=seg["end"] + offset) for seg in segments]
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"[^\w]+", " ", text.lower()).strip()
+
+
+def _dedupe_boundary(prev_segments, next_segments, tail: int = 2, max_gap_sec: float = 2.0):
+    """
+    Bỏ các segment ở đầu cửa sổ sau bị lặp lại với cuối cửa sổ trước
+    (Whisper hay lặp lại câu ở sát điểm cắt).
+    """
+    if not prev_segments:
+        return next_segments
+
+    prev_tail = prev_segments[-tail:]
+    prev_texts = [_normalize(s["text"]) for s in prev_tail]
+    prev_end = prev_tail[-1]["end"]
+
+    kept_from = 0
+    for seg in next_segments[:tail]:
+        text = _normalize(seg["text"])
+        if seg["start"] - prev_end > max_gap_sec or not text:
+            break
+        if any(text == p or (len(text) > 10 and (text in p or p.endswith(text))) for p in prev_texts):
+            kept_from += 1
+        else:
+            break
+    return next_segments[kept_from:]
+
+
+def transcribe_parallel(
+    audio: np.ndarray,
+    model_size: str,
+    workers: int,
+    window_sec: float = DEFAULT_WINDOW_SEC,
+    language: str = "vi",
+    progress=None,
+    checkpoint: str | None = None,
+    on_segments=None,
+    engine: str | None = None,
+):
+    """
+    Phiên âm `audio` (float32 16 kHz) bằng `workers` process song song.
+    engine: tên engine phiên âm (None = theo TRANSCRIBE_ENGINE).
+    progress(fraction): gọi mỗi khi xong một cửa sổ (tỉ lệ audio đã phiên âm).
+    checkpoint: file checkpoint để ghi / tiếp tục từ các cửa sổ đã xong (None = không dùng).
+    on_segments(segments): nhận segment (đã bỏ lặp ở ranh giới) của từng cửa sổ theo đúng
+    thứ tự thời gian, ngay khi cửa sổ đó và mọi cửa sổ trước nó đã xong.
+    Trả về list segment thô {"start", "end", "text"} theo thời gian gốc, đã sắp xếp
+    và bỏ phần lặp ở ranh giới cửa sổ.
+    """
+    windows = split_at_silence(audio, window_sec=window_sec)
+    results, saver = _resume(checkpoint, windows, len(audio))
+    todo = [i for i in range(len(windows)) if results[i] is None]
+    workers = max(1, min(workers, len(todo) or 1))
+    threads = max((os.cpu_count() or 1) // workers, 1)
+
+    # memmap -> chỉ gửi đường dẫn file cho worker; mảng thường -> gửi từng đoạn
+    pcm_path = getattr(audio, "filename", None)
+
+    segments = []
+    emitted = 0   # số cửa sổ đầu tiên đã ghép vào `segments`
+
+    def emit_ready():
+        nonlocal emitted
+        while emitted < len(windows) and results[emitted] is not None:
+            new_segments = _dedupe_boundary(segments, results[emitted])
+            segments.extend(new_segments)
+            if on_segments is not None:
+                on_segments(new_segments)
+            emitted += 1
+
+    emit_ready()
+    done_samples = sum(end - start for (start, end), r in zip(windows, results) if r is not None)
+    if todo:
+        # "spawn" để mỗi worker khởi tạo torch sạch (fork sau khi torch đã chạy dễ treo)
+        ctx = mp.get_context("spawn")
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=ctx,
+            initializer=_init_worker,
+            initargs=(engine or TRANSCRIBE_ENGINE, model_size, threads),
+        ) as pool:
+            futures = {}
+            for i in todo:
+                start, end = windows[i]
+                offset = start / SAMPLE_RATE
+                if pcm_path:
+                    future = pool.submit(_transcribe_window, pcm_path, start, end, offset, language)
+                else:
+                    window_audio = np.asarray(audio[start:end])
+                    future = pool.submit(_transcribe_window, window_audio, 0, end - start, offset, language)
+                futures[future] = i
+
+            try:
+                for future in as_completed(futures):
+                    i = futures[future]
+                    results[i] = future.result()
+                    if saver is not None:
+                        saver.append(i, results[i])
+                    emit_ready()
+                    done_samples += windows[i][1] - windows[i][0]
+                    if progress is not None:
+                        progress(done_samples / max(len(audio), 1))
+            except BaseException:
+                # lỗi / job bị huỷ: không chờ phiên âm nốt các cửa sổ còn trong hàng đợi
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+
+    return segments
+
+
+def transcribe_windows(
+    engine,
+    audio: np.ndarray,
+    window_sec: float = DEFAULT_WINDOW_SEC,
+    language: str = "vi",
+    progress=None,
+    checkpoint: str | None = None,
+    on_segments=None,
+):
+    """
+    Phiên âm tuần tự bằng `engine` (TranscriptionEngine) theo từng cửa sổ (cắt tại chỗ im lặng như
+    transcribe_parallel), để báo được tiến độ progress(fraction) sau mỗi cửa sổ.
+    checkpoint, on_segments: như transcribe_parallel.
+    """
+    windows = split_at_silence(audio, window_sec=window_sec)
+    results, saver = _resume(checkpoint, windows, len(audio))
+    segments = []
+    for i, (start, end) in enumerate(windows):
+        window_segments = results[i]
+        if window_segments is None:
+            window_segments = _transcribe_window(audio, start, end, start / SAMPLE_RATE, language, engine=engine)
+            if saver is not None:
+                saver.append(i, window_segments)
+        new_segments = _dedupe_boundary(segments, window_segments)
+        segments.extend(new_segments)
+        if on_segments is not None:
+            on_segments(new_segments)
+        if progress is not None:
+            progress(end / max(len(audio), 1))
+    return segments
+
+
+def _resume(checkpoint: str | None, windows, total_samples: int):
+    """(list segment của từng cửa sổ — None nếu chưa xong, TranscriptCheckpoint hoặc None)."""
+    results = [None] * len(windows)
+    if not checkpoint:
+        return results, None
+    saver = TranscriptCheckpoint(checkpoint, windows, total_samples)
+    for i, window_segments in saver.load().items():
+        if 0 <= i < len(windows):
+            results[i] = window_segments
+    done = sum(r is not None for r in results)
+    if done:
+        get_reporter().info(f"Tiếp tục phiên âm từ checkpoint: {done}/{len(windows)} cửa sổ đã xong.")
+    return results, saver
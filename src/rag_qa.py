@@ -1,17 +1,27 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Iterator, Tuple
+import asyncio
 import os
+import time
 
 from dotenv import load_dotenv
-import streamlit as st
 
-from langchain_groq import ChatGroq
 from langchain_core.documents import Document
 
-from src.vector_store_builder import load_vector_store
+from src.reporter import get_reporter
+from src.vector_store_builder import load_vector_store, VECTOR_STORE_DIR
+from src.resource_cache import get_vector_store, get_index_version, get_lexical_index
+from src.retriever import hybrid_search, hybrid_search_batch, RETRIEVAL_TOP_K
+from src.answer_cache import embed_query, embed_queries, make_scope, get_answer_cache
+from src.context_packer import pack_context, count_tokens
+from src.telemetry import span, inc, observe
+from src.llm_service import get_llm_service, LLMServiceError
 
 # đọc .env (GROQ_API_KEY)
 load_dotenv()
 
+# số câu hỏi gọi LLM cùng lúc khi hỏi hàng loạt (ask_questions)
+BATCH_QA_CONCURRENCY = int(os.getenv("BATCH_QA_CONCURRENCY", "8"))
+
 # ====== DANH SÁCH MODEL CHO UI ======
 MODEL_OPTIONS: Dict[str, str] = {
     "Llama 3.1 8B (instant - nhanh, rẻ)": "llama-3.1-8b-instant",
@@ -23,33 +33,32 @@ MODEL_OPTIONS: Dict[str, str] = {
 def build_rag_pipeline(model_id: str) -> Dict[str, Any] | None:
     """
     Tạo pipeline RAG đơn giản:
-    - Load vector store (FAISS)
-    - Tạo LLM dùng Groq (mixtral hoặc llama)
-    Trả về dict: {"vector_store": ..., "llm": ...}
+    - Lấy vector store (FAISS) dùng chung từ cache của process
+    - LLM Groq gọi qua service dùng chung (pool client, hàng đợi, retry)
+    Trả về dict: {"vector_store": ..., "llm_service": ..., "model_id": ...}
     """
     vector_store = load_vector_store()
     if vector_store is None:
-        st.error("Không load được vector store. Hãy chạy app.py để tạo vector store trước.")
+        get_reporter().error("Không load được vector store. Hãy chạy app.py để tạo vector store trước.")
         return None
 
     api_key = os.getenv("GROQ_API_KEY")
     if not api_key:
-        st.error("Thiếu GROQ_API_KEY trong file .env")
+        get_reporter().error("Thiếu GROQ_API_KEY trong file .env")
         return None
 
-    llm = ChatGroq(
-        model=model_id,
-        temperature=0.2,
-        groq_api_key=api_key,
-    )
-
-    return {"vector_store": vector_store, "llm": llm}
+    return {"vector_store": vector_store, "llm_service": get_llm_service(), "model_id": model_id}
 
 
-def _build_prompt(question: str, docs: List[Document]) -> str:
+def _build_prompt(question: str, scored_docs, model_id: str | None = None):
     """
     Ghép context từ các đoạn transcript + câu hỏi thành prompt cho LLM.
+    scored_docs: list (Document, score, relevance) từ _retrieve(); các đoạn được lọc theo điểm,
+    gộp chunk liền kề và cắt cho vừa ngân sách token của `model_id`.
+    Trả về (prompt, docs thực sự nằm trong prompt, stats đóng gói).
     """
+    docs, stats = pack_context(scored_docs, model_id)
+
     context_blocks = []
     for i, doc in enumerate(docs, start=1):
         context_blocks.append(f"[Đoạn {i}]\n{doc.page_content}")
@@ -69,31 +78,318 @@ CÂU HỎI:
 
 HÃY TRẢ LỜI NGẮN GỌN, RÕ RÀNG, BẰNG TIẾNG VIỆT:
 """
-    return prompt.strip()
+    prompt = prompt.strip()
+    stats["prompt_tokens"] = count_tokens(prompt)
+    return prompt, docs, stats
 
 
-def ask_question(pipeline: Dict[str, Any], question: str) -> Dict[str, Any]:
+def _retrieve(
+    vector_store,
+    question: str,
+    query_vec,
+    k: int = RETRIEVAL_TOP_K,
+    video_names: List[str] | None = None,
+) -> List[Tuple[Document, float, float]]:
+    """
+    Lấy top-k đoạn liên quan: FAISS theo embedding câu hỏi `query_vec`
+    + BM25 theo từ khoá, trộn bằng reciprocal-rank fusion.
+    video_names: chỉ tìm trong các bài giảng này
+    (None hoặc rỗng = tìm trên tất cả bài giảng trong index).
+    Trả về list (Document, điểm RRF, relevance), điểm cao trước.
+    """
+    lexical_index = get_lexical_index(VECTOR_STORE_DIR)
+    return hybrid_search(vector_store, lexical_index, question, query_vec, k=k, video_names=video_names)
+
+
+def _lookup(pipeline: Dict[str, Any], question: str, video_names: List[str] | None):
+    """Embed câu hỏi + tra cache câu trả lời. Trả về (query_vec, scope, cached hoặc None)."""
+    with span("embed_query") as s:
+        query_vec = embed_query(question)
+        s.add_bytes(len(question.encode("utf-8")))
+    with span("cache_lookup"):
+        scope = _cache_scope(pipeline, video_names)
+        cached = get_answer_cache().lookup(scope, query_vec)
+    inc("qa_requests_total", cache_hit=cached is not None)
+    return query_vec, scope, cached
+
+
+def _prepare_prompt(pipeline: Dict[str, Any], question: str, query_vec, video_names: List[str] | None):
+    """Tìm các đoạn liên quan rồi đóng gói prompt. Trả về (prompt, docs, pack_stats)."""
+    vector_store = _current_vector_store(pipeline)
+    with span("retrieve") as s:
+        hits = _retrieve(vector_store, question, query_vec, video_names=video_names)
+        s.set(hits=len(hits))
+    with span("prompt_build", model=pipeline.get("model_id")) as s:
+        prompt, docs, pack_stats = _build_prompt(question, hits, pipeline.get("model_id"))
+        s.add_bytes(len(prompt.encode("utf-8")))
+        s.set(**pack_stats)
+    observe("prompt_tokens", pack_stats["prompt_tokens"])
+    return prompt, docs, pack_stats
+
+
+def _current_vector_store(pipeline: Dict[str, Any]):
+    # luôn lấy index mới nhất trong cache (rẻ: chỉ stat file index),
+    # phòng khi index trên đĩa đã được build lại sau khi tạo pipeline
+    return get_vector_store(VECTOR_STORE_DIR) or pipeline["vector_store"]
+
+
+def _cache_scope(pipeline: Dict[str, Any], video_names: List[str] | None) -> str:
+    return make_scope(get_index_version(VECTOR_STORE_DIR), pipeline.get("model_id", ""), video_names)
+
+
+def ask_question(pipeline: Dict[str, Any], question: str, video_names: List[str] | None = None) -> Dict[str, Any]:
     """
     Thực hiện:
+    0. Tra cache câu trả lời (câu hỏi gần giống đã được hỏi -> trả lời ngay)
     1. similarity_search trên vector store để lấy các đoạn liên quan
+       (trong các bài giảng `video_names`, mặc định là tất cả)
     2. Build prompt từ context + câu hỏi
     3. Gọi Groq để sinh câu trả lời
 
     Trả về:
-    - answer: str
+    - answer: str (gọi LLM thất bại -> thông báo lỗi cho người dùng)
     - sources: list[Document]
+    - metrics: {"retrieval_sec", "generation_sec", "total_sec", "cache_hit", "prompt_tokens"}
+      (+ "error" nếu gọi LLM thất bại)
     """
-    vector_store = pipeline["vector_store"]
-    llm: ChatGroq = pipeline["llm"]
+    llm_service = pipeline["llm_service"]
+    answer_cache = get_answer_cache()
+
+    t0 = time.perf_counter()
+    query_vec, scope, cached = _lookup(pipeline, question, video_names)
+    if cached is not None:
+        t_done = time.perf_counter()
+        return {
+            "answer": cached["answer"],
+            "sources": cached["sources"],
+            "metrics": {"retrieval_sec": t_done - t0, "generation_sec": 0.0, "total_sec": t_done - t0, "cache_hit": True},
+        }
 
     # Lấy top-k đoạn liên quan dựa trên vector store
-    docs: List[Document] = vector_store.similarity_search(question, k=5)
+    prompt, docs, pack_stats = _prepare_prompt(pipeline, question, query_vec, video_names)
+    t_retrieved = time.perf_counter()
+
+    error = None
+    with span("llm", model=pipeline.get("model_id")) as s:
+        try:
+            answer = llm_service.complete(pipeline["model_id"], prompt, pack_stats["prompt_tokens"])
+            s.add_bytes(len(answer.encode("utf-8")))
+        except LLMServiceError as e:
+            answer = error = str(e)
+            s.set(error=error)
+    t_done = time.perf_counter()
 
-    prompt = _build_prompt(question, docs)
-    response = llm.invoke(prompt)   # AIMessage
-    answer = response.content
+    if error is None:
+        answer_cache.put(scope, question, query_vec, answer, docs)
 
-    return {
-        "answer": answer,
+    metrics = {
+        "retrieval_sec": t_retrieved - t0,
+        "generation_sec": t_done - t_retrieved,
+        "total_sec": t_done - t0,
+        "cache_hit": False,
+        "prompt_tokens": pack_stats["prompt_tokens"],
+    }
+    if error is not None:
+        metrics["error"] = error
+    return {"answer": answer, "sources": docs, "metrics": metrics}
+
+
+def stream_question(
+    pipeline: Dict[str, Any],
+    question: str,
+    video_names: List[str] | None = None,
+) -> Tuple[Iterator[str], Dict[str, Any]]:
+    """
+    Giống ask_question() nhưng trả lời dạng stream.
+
+    Trả về (token_stream, result):
+    - token_stream: iterator yield từng đoạn text ngay khi LLM sinh ra
+      (dùng trực tiếp với st.write_stream)
+    - result: dict được điền khi stream kết thúc:
+        answer, sources (có ngay sau bước tìm kiếm) và
+        metrics = {"retrieval_sec", "ttft_sec", "generation_sec", "total_sec", "cache_hit", "prompt_tokens"}
+        (+ "error" nếu gọi LLM thất bại; thông báo lỗi được stream thay cho câu trả lời)
+    """
+    llm_service = pipeline["llm_service"]
+    answer_cache = get_answer_cache()
+
+    t0 = time.perf_counter()
+    query_vec, scope, cached = _lookup(pipeline, question, video_names)
+    if cached is not None:
+        t_done = time.perf_counter()
+        result = {
+            "answer": cached["answer"],
+            "sources": cached["sources"],
+            "metrics": {
+                "retrieval_sec": t_done - t0,
+                "ttft_sec": t_done - t0,
+                "generation_sec": 0.0,
+                "total_sec": t_done - t0,
+                "cache_hit": True,
+            },
+        }
+        return iter([cached["answer"]]), result
+
+    prompt, docs, pack_stats = _prepare_prompt(pipeline, question, query_vec, video_names)
+    t_retrieved = time.perf_counter()
+
+    result: Dict[str, Any] = {
+        "answer": "",
         "sources": docs,
+        "metrics": {
+            "retrieval_sec": t_retrieved - t0,
+            "cache_hit": False,
+            "prompt_tokens": pack_stats["prompt_tokens"],
+        },
     }
+
+    def token_stream():
+        parts = []
+        t_first = None
+        with span("llm", model=pipeline.get("model_id"), stream=True) as s:
+            try:
+                for text in llm_service.stream(pipeline["model_id"], prompt, pack_stats["prompt_tokens"]):
+                    if t_first is None:
+                        t_first = time.perf_counter()
+                        s.set(ttft_sec=t_first - t0)
+                    parts.append(text)
+                    s.add_bytes(len(text.encode("utf-8")))
+                    yield text
+            except LLMServiceError as e:
+                result["metrics"]["error"] = str(e)
+                s.set(error=str(e))
+                message = ("\n\n" if parts else "") + f"⚠️ {e}"
+                parts.append(message)
+                yield message
+
+        t_done = time.perf_counter()
+        result["answer"] = "".join(parts)
+        result["metrics"].update({
+            # thời gian tới token đầu tiên, tính từ lúc gửi câu hỏi (gồm cả tìm kiếm)
+            "ttft_sec": (t_first or t_done) - t0,
+            "generation_sec": t_done - t_retrieved,
+            "total_sec": t_done - t0,
+        })
+        # chỉ lưu cache khi stream chạy hết (câu trả lời đầy đủ)
+        if "error" not in result["metrics"]:
+            answer_cache.put(scope, question, query_vec, result["answer"], docs)
+
+    return token_stream(), result
+
+
+# ====== HỎI HÀNG LOẠT (BỘ CÂU HỎI ÔN TẬP, ĐÁP ÁN) ======
+
+def ask_questions(
+    pipeline: Dict[str, Any],
+    questions: List[str],
+    video_names: List[str] | None = None,
+    concurrency: int = BATCH_QA_CONCURRENCY,
+    on_result=None,
+) -> List[Dict[str, Any]]:
+    """
+    Như ask_question() cho cả một danh sách câu hỏi:
+    1. Embed tất cả câu hỏi trong một lần gọi model
+    2. Tra cache câu trả lời từng câu
+    3. Tìm top-k cho các câu còn lại bằng MỘT lần FAISS search trên cả ma trận
+    4. Gọi LLM song song (tối đa `concurrency` câu cùng lúc) qua llm_service
+
+    on_result(i, result): gọi ngay khi câu thứ i xong (thứ tự xong bất kỳ; gọi từ
+    thread của llm_service nên cần nhanh).
+    Trả về list result theo đúng thứ tự `questions`; mỗi result giống ask_question()
+    và có thêm "question", "started_at", "finished_at" (epoch giây).
+    """
+    llm_service = pipeline["llm_service"]
+    model_id = pipeline["model_id"]
+    answer_cache = get_answer_cache()
+    results: List[Dict[str, Any] | None] = [None] * len(questions)
+
+    def finish(i: int, result: Dict[str, Any]):
+        result["question"] = questions[i]
+        result["finished_at"] = time.time()
+        results[i] = result
+        if on_result is not None:
+            on_result(i, result)
+
+    started_at = time.time()
+    t0 = time.perf_counter()
+    with span("embed_query", batch=len(questions)) as s:
+        query_vecs = embed_queries(questions)
+        s.add_bytes(sum(len(q.encode("utf-8")) for q in questions))
+    with span("cache_lookup", batch=len(questions)):
+        scope = _cache_scope(pipeline, video_names)
+        cached = [answer_cache.lookup(scope, vec) for vec in query_vecs]
+
+    todo = []
+    for i, hit in enumerate(cached):
+        inc("qa_requests_total", cache_hit=hit is not None, batch=True)
+        if hit is None:
+            todo.append(i)
+            continue
+        elapsed = time.perf_counter() - t0
+        finish(i, {
+            "answer": hit["answer"],
+            "sources": hit["sources"],
+            "started_at": started_at,
+            "metrics": {"retrieval_sec": elapsed, "generation_sec": 0.0, "total_sec": elapsed, "cache_hit": True},
+        })
+    if not todo:
+        return results
+
+    vector_store = _current_vector_store(pipeline)
+    with span("retrieve", batch=len(todo)) as s:
+        hits = hybrid_search_batch(
+            vector_store,
+            get_lexical_index(VECTOR_STORE_DIR),
+            [questions[i] for i in todo],
+            [query_vecs[i] for i in todo],
+            k=RETRIEVAL_TOP_K,
+            video_names=video_names,
+        )
+        s.set(hits=sum(len(h) for h in hits))
+    prompts = {}
+    with span("prompt_build", model=model_id, batch=len(todo)):
+        for i, scored_docs in zip(todo, hits):
+            prompts[i] = _build_prompt(questions[i], scored_docs, model_id)
+            observe("prompt_tokens", prompts[i][2]["prompt_tokens"])
+    retrieval_sec = time.perf_counter() - t0
+
+    # không xếp quá hàng đợi của service (tránh QueueFullError do chính batch này)
+    limit = max(1, min(concurrency, llm_service.max_queue))
+
+    async def run_all():
+        slots = asyncio.Semaphore(limit)
+
+        async def one(i: int):
+            prompt, docs, pack_stats = prompts[i]
+            async with slots:
+                t_start = time.perf_counter()
+                result = {"answer": "", "sources": docs, "started_at": time.time()}
+                error = None
+                with span("llm", model=model_id, batch=True) as s:
+                    try:
+                        answer = await llm_service.acomplete(model_id, prompt, pack_stats["prompt_tokens"])
+                        s.add_bytes(len(answer.encode("utf-8")))
+                    except LLMServiceError as e:
+                        answer = error = str(e)
+                        s.set(error=error)
+                generation_sec = time.perf_counter() - t_start
+
+            if error is None:
+                answer_cache.put(scope, questions[i], query_vecs[i], answer, docs)
+            result["answer"] = answer
+            result["metrics"] = {
+                "retrieval_sec": retrieval_sec,
+                "generation_sec": generation_sec,
+                # tính từ lúc bắt đầu batch (gồm cả thời gian chờ tới lượt)
+                "total_sec": time.perf_counter() - t0,
+                "cache_hit": False,
+                "prompt_tokens": pack_stats["prompt_tokens"],
+            }
+            if error is not None:
+                result["metrics"]["error"] = error
+            finish(i, result)
+
+        await asyncio.gather(*(one(i) for i in todo))
+
+    llm_service.submit(run_all()).result()
+    return results
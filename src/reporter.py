@@ -0,0 +1,219 @@
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# ====== BÁO CÁO TIẾN ĐỘ (STREAMLIT / CONSOLE / JSON LINES) ======
+# Các module xử lý không gọi st.* trực tiếp mà báo qua reporter hiện hành,
+# nhờ vậy cùng một pipeline chạy được trong app Streamlit lẫn CLI (ingest.py).
+# Reporter hiện hành gắn theo thread: mỗi video xử lý song song trong CLI
+# có reporter riêng (kèm tên video) mà không cần truyền tham số qua mọi hàm.
+
+
+class Reporter:
+    """Reporter gốc: bỏ qua mọi thông báo."""
+
+    def info(self, message: str):
+        pass
+
+    def success(self, message: str):
+        pass
+
+    def warning(self, message: str):
+        pass
+
+    def error(self, message: str):
+        pass
+
+    def progress(self, percent: int, text: str | None = None):
+        """percent: 0–100; text: mô tả bước đang chạy (None = giữ nguyên)."""
+        pass
+
+    def stage(self, name: str, status: str):
+        """Stage `name` chuyển sang trạng thái `status` ("running" / "done")."""
+        pass
+
+    def indexed(self, indexed_sec: float, total_sec: float):
+        """Index dần khi đang phiên âm: `indexed_sec` giây đầu bài giảng (trên `total_sec`) đã hỏi đáp được."""
+        pass
+
+
+class StreamlitReporter(Reporter):
+    """Hiển thị bằng st.info / st.error ... và (tuỳ chọn) một progress bar + dòng trạng thái."""
+
+    def __init__(self, progress_bar=None, status_text=None):
+        import streamlit as st
+        self.st = st
+        self.progress_bar = progress_bar
+        self.status_text = status_text
+
+    def info(self, message: str):
+        self.st.info(message)
+
+    def success(self, message: str):
+        self.st.success(message)
+
+    def warning(self, message: str):
+        self.st.warning(message)
+
+    def error(self, message: str):
+        self.st.error(message)
+
+    def progress(self, percent: int, text: str | None = None):
+        if text is not None and self.status_text is not None:
+            self.status_text.text(text)
+        if self.progress_bar is not None:
+            self.progress_bar.progress(int(percent))
+
+
+_print_lock = threading.Lock()
+
+
+class ConsoleReporter(Reporter):
+    """In ra terminal (stderr), mỗi dòng có tên video nếu có."""
+
+    _PREFIX = {"info": "", "success": "OK ", "warning": "WARN ", "error": "ERROR "}
+
+    def __init__(self, video_name: str | None = None, stream=None):
+        self.video_name = video_name
+        self.stream = stream or sys.stderr
+
+    def _emit(self, level: str, message: str):
+        # bỏ định dạng markdown của UI (**...**)
+        message = message.replace("**", "")
+        name = f"[{self.video_name}] " if self.video_name else ""
+        with _print_lock:
+            print(f"{time.strftime('%H:%M:%S')} {name}{self._PREFIX.get(level, '')}{message}", file=self.stream, flush=True)
+
+    def info(self, message: str):
+        self._emit("info", message)
+
+    def success(self, message: str):
+        self._emit("success", message)
+
+    def warning(self, message: str):
+        self._emit("warning", message)
+
+    def error(self, message: str):
+        self._emit("error", message)
+
+    def progress(self, percent: int, text: str | None = None):
+        self._emit("info", f"{int(percent):3d}% {text or ''}".rstrip())
+
+    def indexed(self, indexed_sec: float, total_sec: float):
+        self._emit("info", f"Đã index {indexed_sec / 60:.1f}/{total_sec / 60:.1f} phút bài giảng")
+
+
+class JsonLinesReporter(Reporter):
+    """Mỗi sự kiện là một dòng JSON (để máy khác đọc / ghi log)."""
+
+    def __init__(self, video_name: str | None = None, stream=None):
+        self.video_name = video_name
+        self.stream = stream or sys.stdout
+
+    def _emit(self, event: dict):
+        event = {"ts": round(time.time(), 3), "video": self.video_name, **event}
+        with _print_lock:
+            self.stream.write(json.dumps(event, ensure_ascii=False) + "\n")
+            self.stream.flush()
+
+    def info(self, message: str):
+        self._emit({"level": "info", "message": message})
+
+    def success(self, message: str):
+        self._emit({"level": "success", "message": message})
+
+    def warning(self, message: str):
+        self._emit({"level": "warning", "message": message})
+
+    def error(self, message: str):
+        self._emit({"level": "error", "message": message})
+
+    def progress(self, percent: int, text: str | None = None):
+        self._emit({"level": "progress", "percent": int(percent), "message": text})
+
+    def indexed(self, indexed_sec: float, total_sec: float):
+        self._emit({"level": "indexed", "indexed_sec": round(indexed_sec, 1), "total_sec": round(total_sec, 1)})
+
+
+class StageProgress:
+    """
+    Đổi tiến độ của từng stage thành % tổng thể theo trọng số của stage
+    (stage phiên âm chiếm phần lớn thời gian nên chiếm phần lớn thanh tiến độ).
+        progress = StageProgress(reporter, {"extract": 10, "transcribe": 70, ...})
+        progress.start("transcribe", "📝 Đang phiên âm...")
+        progress.update("transcribe", 0.5)   # xong một nửa stage
+        progress.done("transcribe")
+    Stage được bỏ qua (vd. lấy từ cache) chỉ cần gọi done().
+    start()/done() cũng báo trạng thái stage qua reporter.stage().
+    """
+
+    def __init__(self, reporter: Reporter, weights: dict):
+        self.reporter = reporter
+        total = float(sum(weights.values())) or 1.0
+        self.offsets = {}
+        acc = 0.0
+        for stage, weight in weights.items():
+            self.offsets[stage] = (acc / total, weight / total)
+            acc += weight
+        self.percent = 0
+
+    def _report(self, stage: str, fraction: float, text: str | None = None):
+        offset, width = self.offsets[stage]
+        percent = int(100 * (offset + width * min(max(fraction, 0.0), 1.0)))
+        # không cho thanh tiến độ chạy lùi
+        if percent > self.percent or text is not None:
+            self.percent = max(percent, self.percent)
+            self.reporter.progress(self.percent, text)
+
+    def start(self, stage: str, text: str | None = None):
+        self.reporter.stage(stage, "running")
+        self._report(stage, 0.0, text)
+
+    def update(self, stage: str, fraction: float):
+        self._report(stage, fraction)
+
+    def done(self, stage: str):
+        self.reporter.stage(stage, "done")
+        self._report(stage, 1.0)
+
+
+REPORTERS = {
+    "streamlit": StreamlitReporter,
+    "console": ConsoleReporter,
+    "jsonl": JsonLinesReporter,
+}
+
+_local = threading.local()
+
+
+def _default_reporter() -> Reporter:
+    # chạy trong `streamlit run` -> hiển thị lên UI, còn lại in ra terminal
+    try:
+        from streamlit import runtime
+        if runtime.exists():
+            return StreamlitReporter()
+    except Exception:
+        pass
+    return ConsoleReporter()
+
+
+def get_reporter() -> Reporter:
+    """Reporter hiện hành của thread đang chạy."""
+    reporter = getattr(_local, "reporter", None)
+    if reporter is None:
+        reporter = _default_reporter()
+        _local.reporter = reporter
+    return reporter
+
+
+@contextmanager
+def use_reporter(reporter: Reporter):
+    """Đặt reporter cho thread hiện tại trong phạm vi `with`."""
+    previous = getattr(_local, "reporter", None)
+    _local.reporter = reporter
+    try:
+        yield reporter
+    finally:
+        _local.reporter = previous
@@ -0,0 +1,139 @@
+import os
+import threading
+
+from src.lexical_index import LexicalIndex, LEXICAL_INDEX_FILE, LEXICAL_DELTA_FILE
+from src.index_factory import apply_search_params
+from src.disk_store import INDEX_FILE, DOCSTORE_FILE, load_store, migrate_legacy
+from src.embedding_engine import EmbeddingEngine
+
+# ====== CACHE TÀI NGUYÊN DÙNG CHUNG TOÀN PROCESS ======
+# Streamlit chạy mọi phiên (session) trong cùng một process, nên model
+# embedding và FAISS index chỉ cần load một lần rồi chia sẻ cho tất cả
+# các phiên. Các object trả về được coi là CHỈ ĐỌC.
+# FAISS index được mmap (xem disk_store), nên nhiều process (worker) mở cùng
+# một index chỉ tốn một bản trong page cache.
+
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+
+# các file tạo nên một "phiên bản" index trên đĩa
+INDEX_FILES = (INDEX_FILE, DOCSTORE_FILE)
+
+_lock = threading.Lock()
+_embeddings: dict = {}        # model_name -> EmbeddingEngine
+_vector_stores: dict = {}     # thư mục index -> (version, FAISS)
+_lexical_indexes: dict = {}   # thư mục index -> (version, LexicalIndex)
+
+
+def get_embeddings(model_name: str = EMBEDDING_MODEL_NAME) -> EmbeddingEngine:
+    """
+    Trả về engine embedding dùng chung (backend / batch / thread theo
+    biến môi trường EMBEDDING_*), sentence-transformer chỉ được load
+    một lần trong process.
+    """
+    embeddings = _embeddings.get(model_name)
+    if embeddings is not None:
+        return embeddings
+
+    with _lock:
+        # kiểm tra lại sau khi lấy lock (có thể thread khác vừa load xong)
+        if model_name not in _embeddings:
+            _embeddings[model_name] = EmbeddingEngine(model_name)
+        return _embeddings[model_name]
+
+
+def get_index_version(index_dir: str):
+    """
+    Phiên bản của index trên đĩa = (mtime_ns, size) của từng file.
+    Trả về None nếu index chưa tồn tại hoặc thiếu file.
+    """
+    version = []
+    for name in INDEX_FILES:
+        path = os.path.join(index_dir, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        version.append((name, stat.st_mtime_ns, stat.st_size))
+    return tuple(version)
+
+
+def get_vector_store(index_dir: str, model_name: str = EMBEDDING_MODEL_NAME):
+    """
+    Trả về FAISS index dùng chung cho `index_dir`.
+    Index chỉ được load lại khi file trên đĩa thay đổi (phiên bản khác).
+    Trả về None nếu index chưa tồn tại.
+    """
+    key = os.path.abspath(index_dir)
+    version = get_index_version(index_dir)
+    if version is None:
+        # index định dạng cũ (index.pkl) -> chuyển đổi một lần
+        with _lock:
+            if get_index_version(index_dir) is None and not migrate_legacy(index_dir, get_embeddings(model_name)):
+                return None
+        version = get_index_version(index_dir)
+        if version is None:
+            return None
+
+    cached = _vector_stores.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    with _lock:
+        cached = _vector_stores.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        # index có thể bị ghi đè ngay lúc đang mở: đọc lại nếu phiên bản đổi
+        for _ in range(3):
+            vector_store = load_store(index_dir, get_embeddings(model_name))
+            loaded_version = get_index_version(index_dir)
+            if vector_store is None or loaded_version == version:
+                break
+            version = loaded_version
+        if vector_store is None:
+            return None
+        apply_search_params(vector_store.index)
+        _vector_stores[key] = (version, vector_store)
+        return vector_store
+
+
+def get_lexical_index(index_dir: str):
+    """
+    Trả về inverted index BM25 dùng chung cho `index_dir` (lưu cạnh FAISS index),
+    chỉ đọc lại khi file thay đổi. Trả về None nếu chưa có.
+    """
+    key = os.path.abspath(index_dir)
+    path = os.path.join(index_dir, LEXICAL_INDEX_FILE)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    version = (stat.st_mtime_ns, stat.st_size)
+    try:
+        delta = os.stat(os.path.join(index_dir, LEXICAL_DELTA_FILE))
+        version += (delta.st_mtime_ns, delta.st_size)
+    except OSError:
+        pass
+
+    cached = _lexical_indexes.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    with _lock:
+        cached = _lexical_indexes.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        index = LexicalIndex.load(index_dir)
+        _lexical_indexes[key] = (version, index)
+        return index
+
+
+def invalidate_vector_store(index_dir: str | None = None):
+    """Bỏ index đã cache (của một thư mục, hoặc tất cả nếu index_dir=None)."""
+    with _lock:
+        if index_dir is None:
+            _vector_stores.clear()
+            _lexical_indexes.clear()
+        else:
+            _vector_stores.pop(os.path.abspath(index_dir), None)
+            _lexical_indexes.pop(os.path.abspath(index_dir), None)
@@ -0,0 +1,141 @@
+import os
+
+import numpy as np
+from langchain_core.documents import Document
+
+from src.index_factory import filtered_search_params
+
+# ====== TÌM KIẾM LAI: FAISS (NGỮ NGHĨA) + BM25 (TỪ VỰNG) ======
+# Hai danh sách kết quả được trộn bằng reciprocal-rank fusion (RRF):
+#   score(d) = sum_i 1 / (RRF_K + rank_i(d))
+# RRF chỉ dùng thứ hạng nên không cần chuẩn hoá điểm L2 của FAISS với điểm BM25.
+# Điểm RRF chỉ nằm trong khoảng hẹp 1/80..2/61 nên không dùng để lọc đoạn kém liên quan;
+# mỗi kết quả kèm "relevance" = điểm gốc (similarity FAISS / BM25) chia cho điểm của kết
+# quả tốt nhất của cùng nguồn (lấy nguồn cao nhất nếu cả hai cùng tìm thấy), trong [0, 1].
+
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "4"))
+RRF_K = 60
+# số ứng viên lấy từ mỗi nguồn trước khi trộn
+CANDIDATES_PER_SOURCE = 20
+
+
+def _similarity(distance: float) -> float:
+    """Khoảng cách L2 bình phương của FAISS -> cosine (vector đã chuẩn hoá độ dài 1)."""
+    return 1.0 - float(distance) / 2.0
+
+
+def vector_search_ids(vector_store, query_vec, n: int, video_names=None):
+    """Top-n id trong docstore theo FAISS (gần nhất trước) cho một câu hỏi."""
+    return vector_search_ids_batch(vector_store, [query_vec], n, video_names)[0]
+
+
+def vector_search_ids_batch(vector_store, query_vecs, n: int, video_names=None):
+    """Như vector_search_batch() nhưng chỉ lấy id."""
+    return [[doc_id for doc_id, _ in row] for row in vector_search_batch(vector_store, query_vecs, n, video_names)]
+
+
+def vector_search_batch(vector_store, query_vecs, n: int, video_names=None):
+    """
+    Top-n id theo FAISS cho nhiều câu hỏi, trong MỘT lần index.search trên cả ma trận.
+    Có lọc bài giảng: docstore SQLite cho biết vị trí các chunk của bài giảng nên
+    FAISS chỉ tìm trong các vị trí đó; docstore khác thì tìm trên toàn bộ index
+    rồi lọc, để vẫn đủ n kết quả.
+    Trả về list (một list (id, similarity) cho mỗi câu hỏi, gần nhất trước).
+    """
+    index = vector_store.index
+    ntotal = index.ntotal
+    queries = np.asarray(query_vecs, dtype=np.float32).reshape(len(query_vecs), -1)
+    if ntotal == 0 or len(queries) == 0:
+        return [[] for _ in range(len(queries))]
+    allowed = set(video_names) if video_names else None
+    to_id = vector_store.index_to_docstore_id
+
+    if allowed is not None and hasattr(vector_store.docstore, "positions_of_videos"):
+        positions = vector_store.docstore.positions_of_videos(allowed)
+        if len(positions) == 0:
+            return [[] for _ in range(len(queries))]
+        params = filtered_search_params(index, positions)
+        distances, found = index.search(queries, min(n, len(positions)), params=params)
+        return [
+            [(to_id[int(pos)], _similarity(dist)) for pos, dist in zip(row, dists) if pos != -1]
+            for row, dists in zip(found, distances)
+        ]
+
+    fetch = ntotal if allowed else min(n, ntotal)
+    distances, found = index.search(queries, fetch)
+
+    video_of = {}   # doc_id -> video_name (mỗi chunk chỉ đọc docstore một lần)
+    results = []
+    for row, dists in zip(found, distances):
+        ids = []
+        for pos, dist in zip(row, dists):
+            if pos == -1:
+                continue
+            doc_id = to_id[int(pos)]
+            if allowed is not None:
+                if doc_id not in video_of:
+                    doc = vector_store.docstore.search(doc_id)
+                    video_of[doc_id] = doc.metadata.get("video_name") if isinstance(doc, Document) else None
+                if video_of[doc_id] not in allowed:
+                    continue
+            ids.append((doc_id, _similarity(dist)))
+            if len(ids) >= n:
+                break
+        results.append(ids)
+    return results
+
+
+def rrf_merge(ranked_lists, k: int):
+    """Trộn nhiều danh sách id đã xếp hạng bằng RRF. Trả về list (id, score)."""
+    scores = {}
+    for ranked in ranked_lists:
+        for rank, doc_id in enumerate(ranked, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (RRF_K + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+def _relative_scores(hits, relevance: dict):
+    """Ghi điểm (id, score) của một nguồn, chia cho điểm tốt nhất, vào relevance (giữ giá trị lớn hơn)."""
+    if not hits:
+        return
+    top = max(score for _, score in hits)
+    for doc_id, score in hits:
+        value = score / top if top > 0 else 1.0
+        relevance[doc_id] = max(relevance.get(doc_id, 0.0), value)
+
+
+def hybrid_search(vector_store, lexical_index, question: str, query_vec, k: int = RETRIEVAL_TOP_K, video_names=None):
+    """
+    Top-k Document theo FAISS + BM25 trộn bằng RRF.
+    lexical_index=None -> chỉ dùng FAISS.
+    Trả về list (Document, rrf_score, relevance).
+    """
+    return hybrid_search_batch(vector_store, lexical_index, [question], [query_vec], k, video_names)[0]
+
+
+def hybrid_search_batch(vector_store, lexical_index, questions, query_vecs, k: int = RETRIEVAL_TOP_K, video_names=None):
+    """
+    Như hybrid_search() cho nhiều câu hỏi: phần FAISS chạy một lần cho cả ma trận
+    query_vecs, BM25 vẫn tính từng câu (rẻ).
+    Trả về list (một list (Document, rrf_score, relevance) cho mỗi câu hỏi).
+    """
+    vector_hits = vector_search_batch(vector_store, query_vecs, CANDIDATES_PER_SOURCE, video_names)
+    docs = {}
+    results = []
+    for question, hits in zip(questions, vector_hits):
+        ranked_lists = [[doc_id for doc_id, _ in hits]]
+        relevance = {}
+        _relative_scores(hits, relevance)
+        if lexical_index is not None:
+            lexical_hits = lexical_index.search(question, k=CANDIDATES_PER_SOURCE, video_names=video_names)
+            ranked_lists.append([doc_id for doc_id, _ in lexical_hits])
+            _relative_scores(lexical_hits, relevance)
+
+        scored = []
+        for doc_id, score in rrf_merge(ranked_lists, k):
+            if doc_id not in docs:
+                docs[doc_id] = vector_store.docstore.search(doc_id)
+            if isinstance(docs[doc_id], Document):
+                scored.append((docs[doc_id], score, relevance[doc_id]))
+        results.append(scored)
+    return results
@@ -0,0 +1,330 @@
+import atexit
+import glob
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+try:
+    import resource
+except ImportError:   # Windows
+    resource = None
+
+# ====== ĐO THỜI GIAN / BỘ NHỚ THEO STAGE (SPAN + METRICS) ======
+# Mỗi stage của pipeline (tách âm thanh, phiên âm, embedding, tìm kiếm, gọi LLM, ...)
+# được bọc trong span(): đo thời gian, số byte xử lý, peak RSS của process.
+# Kết quả được:
+# - cộng dồn vào metrics trong process -> xuất dạng Prometheus text (/metrics
+#   trên media server) hoặc JSON (snapshot())
+# - ghi một dòng JSON cho mỗi span vào TELEMETRY_LOG (rỗng = không ghi file)
+# Ingest chạy trong process worker của job_queue, không phải process của app: mỗi
+# process ghi metrics của mình ra METRICS_DIR/<pid>-<thời điểm khởi động>.json (tối đa
+# METRICS_FLUSH_SEC giây một lần + khi xong job / thoát), render_prometheus() và
+# snapshot() cộng dồn mọi file đó (counter / histogram cộng lại, gauge gắn nhãn pid và
+# chỉ lấy của process còn sống). METRICS_DIR rỗng = chỉ metrics của process hiện tại.
+
+TELEMETRY_LOG = os.getenv("TELEMETRY_LOG", "logs/telemetry.jsonl")
+METRICS_DIR = os.getenv("METRICS_DIR", "logs/metrics")
+METRICS_FLUSH_SEC = float(os.getenv("METRICS_FLUSH_SEC", "2"))
+METRIC_PREFIX = "cs431"
+
+# bucket (giây) cho histogram thời gian
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+# bucket riêng cho một số histogram không tính bằng giây
+_BUCKETS = {
+    "prompt_tokens": (250, 500, 1000, 1500, 2000, 3000, 4000, 8000),
+}
+
+_lock = threading.Lock()
+_counters: dict = {}     # (name, labels) -> float
+_gauges: dict = {}       # (name, labels) -> float
+_histograms: dict = {}   # (name, labels) -> {"buckets", "counts", "sum", "count"}
+# span đang chạy: ContextVar thay vì threading.local để các coroutine chạy xen kẽ
+# trên cùng một thread (llm_service) không lẫn span cha của nhau
+_current_span: ContextVar = ContextVar("current_span", default=None)
+
+_logger = logging.getLogger("cs431.telemetry")
+_logger_ready = False
+
+_metrics_file = None   # file metrics của process này trong METRICS_DIR
+_last_flush = 0.0
+
+
+def _labels_key(labels: dict):
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def inc(name: str, value: float = 1.0, **labels):
+    """Tăng counter `name`."""
+    key = (name, _labels_key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0.0) + value
+
+
+def set_gauge(name: str, value: float, **labels):
+    with _lock:
+        _gauges[(name, _labels_key(labels))] = float(value)
+
+
+def observe(name: str, value: float, **labels):
+    """Thêm một giá trị vào histogram `name`."""
+    key = (name, _labels_key(labels))
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            buckets = _BUCKETS.get(name, DURATION_BUCKETS)
+            hist = {"buckets": buckets, "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+            _histograms[key] = hist
+        for i, bound in enumerate(hist["buckets"]):
+            if value <= bound:
+                hist["counts"][i] += 1
+        hist["sum"] += value
+        hist["count"] += 1
+
+
+def peak_rss_bytes() -> int | None:
+    """Peak RSS của process từ lúc khởi động (byte), None nếu không đo được."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux trả về KB, macOS trả về byte
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _log(event: dict):
+    global _logger_ready
+    if not TELEMETRY_LOG:
+        return
+    if not _logger_ready:
+        with _lock:
+            if not _logger_ready:
+                os.makedirs(os.path.dirname(TELEMETRY_LOG) or ".", exist_ok=True)
+                handler = logging.FileHandler(TELEMETRY_LOG, encoding="utf-8")
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                _logger.addHandler(handler)
+                _logger.setLevel(logging.INFO)
+                _logger.propagate = False
+                _logger_ready = True
+    _logger.info(json.dumps(event, ensure_ascii=False, default=str))
+
+
+class Span:
+    """Một stage đang được đo. set() gắn thêm thuộc tính, add_bytes() cộng số byte đã xử lý."""
+
+    def __init__(self, name: str, parent: str | None, attrs: dict):
+        self.name = name
+        self.parent = parent
+        self.attrs = attrs
+        self.bytes = 0
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def add_bytes(self, n: int):
+        self.bytes += int(n)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    Đo một stage:
+        with span("transcribe", video=name) as s:
+            ...
+            s.add_bytes(audio.nbytes)
+    Thời gian -> histogram stage_duration_seconds{stage}, byte -> counter stage_bytes_total{stage},
+    lỗi -> counter stage_errors_total{stage}; mỗi span ghi một dòng JSON log.
+    """
+    parent = _current_span.get()
+    current = Span(name, parent.name if parent is not None else None, dict(attrs))
+    token = _current_span.set(current)
+
+    started = time.time()
+    t0 = time.perf_counter()
+    error = None
+    try:
+        yield current
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        duration = time.perf_counter() - t0
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # generator được chạy tiếp ở context khác (vd. stream đọc từ thread khác)
+            _current_span.set(parent)
+        peak = peak_rss_bytes()
+
+        observe("stage_duration_seconds", duration, stage=name)
+        if current.bytes:
+            inc("stage_bytes_total", current.bytes, stage=name)
+        if error is not None:
+            inc("stage_errors_total", stage=name)
+        if peak is not None:
+            set_gauge("process_peak_rss_bytes", peak)
+        flush_metrics(force=False)
+
+        _log({
+            "ts": round(started, 3),
+            "span": name,
+            "parent": current.parent,
+            "duration_sec": round(duration, 6),
+            "bytes": current.bytes,
+            "peak_rss_bytes": peak,
+            "error": error,
+            **current.attrs,
+        })
+
+
+def _pid_alive(pid: int) -> bool:
+    if os.name == "nt":   # os.kill(pid, 0) trên Windows sẽ dừng process
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+def flush_metrics(force: bool = True, final: bool = False):
+    """
+    Ghi metrics của process này ra METRICS_DIR (qua file tạm, thay thế nguyên tử).
+    force=False: bỏ qua nếu vừa ghi chưa tới METRICS_FLUSH_SEC giây.
+    final=True: process sắp thoát -> không ghi gauge (giá trị không còn đúng).
+    """
+    global _metrics_file, _last_flush
+    if not METRICS_DIR:
+        return
+    now = time.monotonic()
+    if not force and now - _last_flush < METRICS_FLUSH_SEC:
+        return
+    with _lock:
+        _last_flush = now
+        data = {
+            "pid": os.getpid(),
+            "counters": [[n, l, v] for (n, l), v in _counters.items()],
+            "gauges": [] if final else [[n, l, v] for (n, l), v in _gauges.items()],
+            "histograms": [[n, l, h] for (n, l), h in _histograms.items()],
+        }
+        if _metrics_file is None:
+            os.makedirs(METRICS_DIR, exist_ok=True)
+            # thêm thời điểm khởi động: pid bị dùng lại không ghi đè metrics của process cũ
+            _metrics_file = os.path.join(METRICS_DIR, f"{os.getpid()}-{int(time.time() * 1000)}.json")
+            atexit.register(flush_metrics, final=True)
+    try:
+        tmp_path = f"{_metrics_file}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, _metrics_file)
+    except OSError:
+        pass
+
+
+def _collect():
+    """
+    Metrics của process này + của các process khác trong METRICS_DIR.
+    Trả về (counters, gauges, histograms) cùng dạng với _counters / _gauges / _histograms.
+    """
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        histograms = {key: dict(h, counts=list(h["counts"])) for key, h in _histograms.items()}
+        own_file = _metrics_file
+    if not METRICS_DIR:
+        return counters, gauges, histograms
+
+    pid_label = ("pid", str(os.getpid()))
+    gauges = {(n, tuple(sorted(l + (pid_label,)))): v for (n, l), v in gauges.items()}
+    for path in glob.glob(os.path.join(METRICS_DIR, "*.json")):
+        if own_file is not None and os.path.abspath(path) == os.path.abspath(own_file):
+            continue
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for n, l, v in data.get("counters", []):
+            key = (n, tuple(map(tuple, l)))
+            counters[key] = counters.get(key, 0.0) + v
+        for n, l, h in data.get("histograms", []):
+            key = (n, tuple(map(tuple, l)))
+            hist = histograms.get(key)
+            if hist is None:
+                histograms[key] = dict(h, buckets=tuple(h["buckets"]))
+            elif tuple(hist["buckets"]) == tuple(h["buckets"]):
+                hist["counts"] = [a + b for a, b in zip(hist["counts"], h["counts"])]
+                hist["sum"] += h["sum"]
+                hist["count"] += h["count"]
+        if data.get("gauges") and _pid_alive(data.get("pid")):
+            label = ("pid", str(data["pid"]))
+            for n, l, v in data["gauges"]:
+                gauges[(n, tuple(sorted(tuple(map(tuple, l)) + (label,))))] = v
+    return counters, gauges, histograms
+
+
+def _format_labels(labels, extra=None) -> str:
+    items = list(labels) + (list(extra) if extra else [])
+    if not items:
+        return ""
+    parts = []
+    for k, v in items:
+        v = str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render_prometheus() -> str:
+    """Toàn bộ metrics (mọi process, xem METRICS_DIR) ở định dạng text của Prometheus."""
+    peak = peak_rss_bytes()
+    if peak is not None:
+        set_gauge("process_peak_rss_bytes", peak)
+    counters, gauges, histograms = _collect()
+
+    lines = []
+    for kind, store in (("counter", counters), ("gauge", gauges)):
+        for name in sorted({n for n, _ in store}):
+            full = f"{METRIC_PREFIX}_{name}"
+            lines.append(f"# TYPE {full} {kind}")
+            for (n, labels), value in sorted(store.items()):
+                if n == name:
+                    lines.append(f"{full}{_format_labels(labels)} {_format_value(value)}")
+
+    for name in sorted({n for n, _ in histograms}):
+        full = f"{METRIC_PREFIX}_{name}"
+        lines.append(f"# TYPE {full} histogram")
+        for (n, labels), hist in sorted(histograms.items(), key=lambda item: item[0]):
+            if n != name:
+                continue
+            for bound, count in zip(hist["buckets"], hist["counts"]):
+                lines.append(f"{full}_bucket{_format_labels(labels, [('le', f'{bound:g}')])} {count}")
+            lines.append(f"{full}_bucket{_format_labels(labels, [('le', '+Inf')])} {hist['count']}")
+            lines.append(f"{full}_sum{_format_labels(labels)} {_format_value(hist['sum'])}")
+            lines.append(f"{full}_count{_format_labels(labels)} {hist['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def snapshot() -> dict:
+    """Metrics (mọi process) dạng JSON: counters, gauges và tóm tắt histogram (count/sum/avg)."""
+    def fmt(name, labels):
+        return name + _format_labels(labels)
+
+    counters, gauges, histograms = _collect()
+    return {
+        "counters": {fmt(n, l): v for (n, l), v in counters.items()},
+        "gauges": {fmt(n, l): v for (n, l), v in gauges.items()},
+        "histograms": {
+            fmt(n, l): {"count": h["count"], "sum": h["sum"], "avg": h["sum"] / h["count"] if h["count"] else 0.0}
+            for (n, l), h in histograms.items()
+        },
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
@@ -1,8 +1,27 @@
 import re
-import whisper
-from moviepy import AudioFileClip  # dùng để lấy độ dài audio
+import hashlib
+import inspect
+import numpy as np
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-import streamlit as st
+
+from src.reporter import get_reporter
+from src.whisper_registry import DEFAULT_WHISPER_MODEL
+from src.transcription_engine import TRANSCRIBE_ENGINE, get_engine, estimated_speedup
+from src.video_processor import SAMPLE_RATE, get_media_duration
+from src.parallel_transcriber import transcribe_parallel, transcribe_windows, default_workers
+from src.vad import USE_VAD, detect_speech, compact_speech, remap_segments
+
+# tham số mặc định khi gộp segment thành chunk
+CHUNK_MAX_CHARS = 2000
+CHUNK_OVERLAP_SEC = 2.0
+
+# hệ số (thời gian phiên âm / độ dài audio) ước tính trên CPU theo cỡ model
+_SPEED_FACTOR = {
+    "tiny": 0.3,
+    "base": 0.6,
+    "small": 1.5,
+    "medium": 3.5,
+}
 
 
 def clean_transcript(text: str) -> str:
@@ -51,137 +70,258 @@ def clean_transcript(text: str) -> str:
     return text
 
 
-def transcribe_audio(audio_path: str):
+def clean_rules_version() -> str:
+    """
+    Phiên bản của bộ rule làm sạch = hash mã nguồn clean_transcript()
+    (đổi REPLACEMENTS hay regex chuẩn hoá -> phiên bản mới, cache transcript cũ bị bỏ).
+    """
+    source = inspect.getsource(clean_transcript)
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()[:16]
+
+
+def clean_segments(raw_segments):
+    """
+    Làm sạch text của các segment Whisper, bỏ segment rỗng.
+    Trả về list {"start", "end", "text"}.
     """
-    Phiên âm audio bằng Whisper và trả về:
+    segments = []
+    for seg in raw_segments:
+        seg_text = clean_transcript(seg.get("text", ""))
+        if not seg_text:
+            continue
+
+        start = float(seg.get("start", 0.0))
+        end = float(seg.get("end", 0.0))
+
+        segments.append(
+            {
+                "start": start,
+                "end": end,
+                "text": seg_text,
+            }
+        )
+    return segments
+
+
+def _to_original_time(raw_segments, time_map):
+    """Segment Whisper -> {"start", "end", "text"} theo thời gian video gốc."""
+    if time_map is not None:
+        # đưa timestamp trên audio đã ghép về vị trí trong video gốc (cho seekTo)
+        raw_segments = remap_segments(raw_segments, time_map)
+    return [
+        {"start": float(seg.get("start", 0.0)), "end": float(seg.get("end", 0.0)), "text": seg.get("text", "")}
+        for seg in raw_segments
+    ]
+
+
+def transcribe_audio(
+    audio,
+    model_size: str = DEFAULT_WHISPER_MODEL,
+    workers: int | None = None,
+    use_vad: bool | None = None,
+    progress=None,
+    checkpoint: str | None = None,
+    on_segments=None,
+    engine: str | None = None,
+):
+    """
+    Phiên âm audio bằng Whisper (model_size: tiny/base/small/medium).
+    engine: engine phiên âm "whisper" / "faster-whisper" (None = theo TRANSCRIBE_ENGINE),
+    engine nào cũng trả về cùng dạng segment.
+    `audio` là mảng float32 16 kHz mono từ extract_audio() hoặc đường dẫn file.
+    workers > 1: cắt audio tại chỗ im lặng và phiên âm các cửa sổ song song
+    trên nhiều process (mặc định theo WHISPER_PARALLEL_WORKERS).
+    use_vad: chỉ phiên âm các vùng có tiếng nói (mặc định theo WHISPER_VAD),
+    start/end vẫn tính theo thời gian video gốc.
+    progress(fraction): nếu có, được gọi sau mỗi cửa sổ audio phiên âm xong
+    (audio được phiên âm theo cửa sổ cắt tại chỗ im lặng).
+    checkpoint: file checkpoint (src.transcript_checkpoint); mỗi cửa sổ xong được ghi vào đó,
+    gọi lại với cùng audio thì chỉ phiên âm các cửa sổ còn thiếu.
+    on_segments(segments): nhận dần segment đã clean (thời gian video gốc) theo thứ tự,
+    mỗi lần một cửa sổ audio xong — để chia chunk / index khi đang phiên âm.
+    Trả về:
     {
         "segments": [
             {"text": "...", "start": float, "end": float},
             ...
         ],
-        "full_text": "toàn bộ transcript đã clean"
+        "full_text": "toàn bộ transcript đã clean",
+        "raw_segments": [...],   # segment của engine chưa clean (đã đổi về thời gian gốc)
+        "vad": {"total_sec": ..., "speech_sec": ..., "skipped_sec": ...}
     }
     """
     try:
-        # Lấy độ dài audio để ước lượng
-        clip = AudioFileClip(audio_path)
-        duration = clip.duration  # giây
-        clip.close()
+        # Lấy độ dài audio để ước lượng (mảng PCM: tính từ số mẫu, file: đọc metadata)
+        if isinstance(audio, np.ndarray):
+            duration = len(audio) / SAMPLE_RATE
+        else:
+            duration = get_media_duration(audio) or 0.0  # giây
+
+        # ----- 1'. VAD: bỏ các đoạn im lặng trước khi phiên âm -----
+        if use_vad is None:
+            use_vad = USE_VAD
+        time_map = None
+        speech_sec = duration
+        if use_vad and isinstance(audio, np.ndarray):
+            spans = detect_speech(audio)
+            audio, time_map = compact_speech(audio, spans)
+            speech_sec = sum(e - s for s, e in spans) / SAMPLE_RATE
+            if len(audio) == 0:
+                get_reporter().error("Không phát hiện tiếng nói trong âm thanh.")
+                return None
+            get_reporter().info(
+                f"VAD: bỏ qua **{duration - speech_sec:.0f} giây** im lặng "
+                f"({(duration - speech_sec) / max(duration, 1e-9):.0%} thời lượng)."
+            )
+
+        engine = engine or TRANSCRIBE_ENGINE
+        if workers is None:
+            workers = default_workers()
+        parallel = workers > 1 and isinstance(audio, np.ndarray)
 
         minutes = duration / 60
+        speech_minutes = speech_sec / 60
         # tuỳ máy, Whisper small trên CPU thường chậm hơn thời gian thực ~1–2 lần
-        est_minutes = minutes * 1.5
+        est_minutes = speech_minutes * _SPEED_FACTOR.get(model_size, 1.5) / estimated_speedup(engine)
+        if parallel:
+            est_minutes /= workers
 
-        st.info(
+        get_reporter().info(
             f"Âm thanh dài khoảng **{minutes:.1f} phút**. "
             f"Thời gian phiên âm ước tính khoảng **{est_minutes:.1f} phút** (tuỳ cấu hình máy)."
         )
         
-        # ----- 2. Load model -----
-        model = whisper.load_model("small")
-
-        # ----- 3. Chạy phiên âm -----
-        result = model.transcribe(
-            audio_path,
-            fp16=False,
-            language="vi",   # ưu tiên tiếng Việt, vẫn giữ thuật ngữ tiếng Anh
-        )
-
-        raw_segments = result.get("segments", [])
-        segments = []
-        all_texts = []
-
-        for seg in raw_segments:
-            seg_text = clean_transcript(seg.get("text", ""))
-            if not seg_text:
-                continue
-
-            start = float(seg.get("start", 0.0))
-            end = float(seg.get("end", 0.0))
+        window_callback = None
+        if on_segments is not None:
+            window_callback = lambda window_segments: on_segments(
+                clean_segments(_to_original_time(window_segments, time_map))
+            )
 
-            segments.append(
-                {
-                    "start": start,
-                    "end": end,
-                    "text": seg_text,
-                }
+        if parallel:
+            # ----- 2'. Phiên âm song song, mỗi worker giữ model riêng -----
+            raw_segments = transcribe_parallel(
+                audio, model_size, workers, progress=progress, checkpoint=checkpoint,
+                on_segments=window_callback, engine=engine,
             )
-            all_texts.append(seg_text)
+        elif (progress is not None or checkpoint or on_segments is not None) and isinstance(audio, np.ndarray):
+            # tuần tự theo từng cửa sổ để báo được tiến độ thật / ghi checkpoint sau mỗi cửa sổ
+            raw_segments = transcribe_windows(
+                get_engine(engine, model_size), audio, language="vi",
+                progress=progress, checkpoint=checkpoint, on_segments=window_callback,
+            )
+        else:
+            # ----- 2. Lấy engine (model đã cache trong registry, chỉ load lần đầu) -----
+            transcriber = get_engine(engine, model_size)
+
+            # ----- 3. Chạy phiên âm -----
+            # ưu tiên tiếng Việt, vẫn giữ thuật ngữ tiếng Anh
+            raw_segments = transcriber.transcribe(audio, language="vi")
 
-        full_text = " ".join(all_texts).strip()
+        raw_segments = _to_original_time(raw_segments, time_map)
+        segments = clean_segments(raw_segments)
+        full_text = " ".join(seg["text"] for seg in segments).strip()
 
         if not segments:
-            st.error("Whisper không trả về segment nào.")
+            get_reporter().error("Whisper không trả về segment nào.")
             return None
 
         return {
             "segments": segments,
             "full_text": full_text,
+            "raw_segments": raw_segments,
+            "vad": {
+                "total_sec": duration,
+                "speech_sec": speech_sec,
+                "skipped_sec": duration - speech_sec,
+            },
         }
 
     except Exception as e:
-        st.error(f"Lỗi khi phiên âm âm thanh: {e}")
+        get_reporter().error(f"Lỗi khi phiên âm âm thanh: {e}")
         return None
 
-def chunk_text(segments, max_chars: int = 2000, overlap_sec: float = 2.0):
+class IncrementalChunker:
     """
-    Nhận vào list `segments` (có start/end/text) và gộp thành các chunk lớn hơn,
-    mỗi chunk kèm metadata start/end (để nhảy video).
-
-    Trả về:
-        chunks: List[str]
-        metadatas: List[dict]  (mỗi dict có start/end/chunk_index)
+    Gộp segment thành chunk khi segment tới dần (phiên âm đang chạy):
+        chunker = IncrementalChunker()
+        for seg in segments:
+            for chunk, meta in chunker.add(seg):   # các chunk vừa đóng
+                ...
+        closed = chunker.flush()                   # chunk cuối
+    Kết quả giống hệt chunk_text() trên toàn bộ segments.
     """
-    if not segments:
-        st.error("Không có segment để chia nhỏ.")
-        return [], []
 
-    chunks = []
-    metadatas = []
+    def __init__(self, max_chars: int = CHUNK_MAX_CHARS, overlap_sec: float = CHUNK_OVERLAP_SEC):
+        self.max_chars = max_chars
+        self.overlap_sec = overlap_sec
+        self.chunk_index = 0
+        self.cur_text = ""
+        self.cur_start = None
+        self.cur_end = None
 
-    cur_text = ""
-    cur_start = None
-    cur_end = None
-    chunk_index = 0
+    def _close(self):
+        chunk = (
+            self.cur_text.strip(),
+            {
+                "chunk_index": self.chunk_index,
+                "start": max(self.cur_start - self.overlap_sec, 0.0),
+                "end": self.cur_end,
+            },
+        )
+        self.chunk_index += 1
+        return chunk
 
-    for seg in segments:
+    def add(self, seg):
+        """Thêm một segment (start/end/text). Trả về list (chunk, metadata) vừa đóng (0 hoặc 1 phần tử)."""
         seg_text = seg["text"]
         seg_start = float(seg["start"])
         seg_end = float(seg["end"])
 
+        closed = []
         # nếu thêm đoạn này vào thì vượt max_chars -> đóng chunk hiện tại
-        if cur_text and len(cur_text) + 1 + len(seg_text) > max_chars:
-            # đóng chunk
-            chunks.append(cur_text.strip())
-            metadatas.append(
-                {
-                    "chunk_index": chunk_index,
-                    "start": max(cur_start - overlap_sec, 0.0),
-                    "end": cur_end,
-                }
-            )
-            chunk_index += 1
+        if self.cur_text and len(self.cur_text) + 1 + len(seg_text) > self.max_chars:
+            closed.append(self._close())
             # mở chunk mới
-            cur_text = seg_text
-            cur_start = seg_start
-            cur_end = seg_end
+            self.cur_text = seg_text
+            self.cur_start = seg_start
+            self.cur_end = seg_end
         else:
-            if not cur_text:
-                cur_start = seg_start
+            if not self.cur_text:
+                self.cur_start = seg_start
             else:
-                cur_text += " "
-            cur_text += seg_text
-            cur_end = seg_end
-
-    # chunk cuối
-    if cur_text:
-        chunks.append(cur_text.strip())
-        metadatas.append(
-            {
-                "chunk_index": chunk_index,
-                "start": max(cur_start - overlap_sec, 0.0),
-                "end": cur_end,
-            }
-        )
+                self.cur_text += " "
+            self.cur_text += seg_text
+            self.cur_end = seg_end
+        return closed
+
+    def flush(self):
+        """Đóng chunk đang gộp dở (hết segment). Trả về list (chunk, metadata)."""
+        if not self.cur_text:
+            return []
+        closed = [self._close()]
+        self.cur_text = ""
+        return closed
+
+
+def chunk_text(segments, max_chars: int = CHUNK_MAX_CHARS, overlap_sec: float = CHUNK_OVERLAP_SEC):
+    """
+    Nhận vào list `segments` (có start/end/text) và gộp thành các chunk lớn hơn,
+    mỗi chunk kèm metadata start/end (để nhảy video).
+
+    Trả về:
+        chunks: List[str]
+        metadatas: List[dict]  (mỗi dict có start/end/chunk_index)
+    """
+    if not segments:
+        get_reporter().error("Không có segment để chia nhỏ.")
+        return [], []
+
+    chunker = IncrementalChunker(max_chars, overlap_sec)
+    closed = []
+    for seg in segments:
+        closed.extend(chunker.add(seg))
+    closed.extend(chunker.flush())
 
+    chunks = [chunk for chunk, _ in closed]
+    metadatas = [meta for _, meta in closed]
     return chunks, metadatas
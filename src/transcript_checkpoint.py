@@ -0,0 +1,75 @@
+import json
+import os
+
+# ====== CHECKPOINT PHIÊN ÂM THEO CỬA SỔ ======
+# Phiên âm bài giảng dài mất cả giờ trên CPU; process bị kill (OOM, restart)
+# thì mọi segment trong bộ nhớ mất hết. Mỗi cửa sổ audio phiên âm xong được
+# ghi nối đuôi một dòng JSON vào file checkpoint (append-only, fsync), chạy lại
+# cùng video thì chỉ phiên âm các cửa sổ còn thiếu.
+#
+# Dòng đầu: {"samples": số mẫu audio, "windows": [[start, end], ...]} — cách chia
+# cửa sổ phải khớp thì checkpoint mới được dùng lại.
+# Các dòng sau: {"window": i, "segments": [...]} — segment thô của cửa sổ i
+# (thời gian trên audio đưa vào Whisper, chưa bỏ lặp ở ranh giới cửa sổ).
+# Dòng ghi dở (bị kill giữa chừng) được bỏ qua.
+
+
+class TranscriptCheckpoint:
+    """Checkpoint của một lần phiên âm `total_samples` mẫu audio chia thành `windows`."""
+
+    def __init__(self, path: str, windows, total_samples: int):
+        self.path = path
+        self.header = {"samples": int(total_samples), "windows": [[int(s), int(e)] for s, e in windows]}
+
+    def load(self) -> dict:
+        """Segment của các cửa sổ đã xong: {chỉ số cửa sổ: segments}. Checkpoint không khớp -> xoá, trả về {}."""
+        done = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                lines = f.read().split("\n")
+        except OSError:
+            return done
+
+        try:
+            header = json.loads(lines[0])
+        except ValueError:
+            header = None
+        if header != self.header:
+            self.discard()
+            return done
+
+        for line in lines[1:]:
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue   # dòng ghi dở
+            done[int(entry["window"])] = entry["segments"]
+        return done
+
+    def append(self, window: int, segments):
+        """Ghi kết quả của một cửa sổ (tạo file + dòng đầu nếu chưa có)."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        lines = []
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            lines.append(json.dumps(self.header))
+        lines.append(json.dumps({"window": int(window), "segments": segments}, ensure_ascii=False))
+        with open(self.path, "a", encoding="utf-8") as f:
+            # dòng trước bị ghi dở -> xuống dòng để dòng mới vẫn đọc được
+            if f.tell() > 0 and not self._ends_with_newline():
+                f.write("\n")
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def discard(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,136 @@
+import os
+import threading
+import weakref
+
+from src.whisper_registry import (
+    DEFAULT_WHISPER_MODEL,
+    get_whisper_model,
+    get_faster_whisper_model,
+    is_fp16,
+)
+
+# ====== ENGINE PHIÊN ÂM ======
+# Mọi chỗ phiên âm (tuần tự, theo cửa sổ, worker song song) gọi qua một engine:
+#     engine.transcribe(audio, language) -> [{"start", "end", "text"}, ...]
+# start/end tính bằng giây từ đầu `audio`; text giữ nguyên như model trả về
+# (clean_segments() / chunk_text() xử lý tiếp, không phụ thuộc engine).
+# - whisper       : openai-whisper trên torch (fp32 trên CPU, fp16 trên GPU) — engine tham chiếu
+# - faster-whisper: CTranslate2 (cần `faster-whisper`), mặc định lượng tử hoá int8 trên CPU,
+#                   cùng weight Whisper nên cùng cỡ model (tiny/base/small/medium)
+# Đổi engine làm transcript thay đổi chút ít -> key cache transcript của ingest_cache
+# gồm engine_fingerprint() (engine whisper giữ nguyên key cũ).
+
+TRANSCRIBE_ENGINES = ("whisper", "faster-whisper")
+TRANSCRIBE_ENGINE = os.getenv("TRANSCRIBE_ENGINE", "whisper").lower()
+# int8 / int8_float16 / float16 / float32
+FASTER_WHISPER_COMPUTE_TYPE = os.getenv("FASTER_WHISPER_COMPUTE_TYPE", "int8")
+# 0 = để CTranslate2 tự chọn (worker song song tự chia đều số core)
+FASTER_WHISPER_THREADS = int(os.getenv("FASTER_WHISPER_THREADS", "0"))
+# 1 = greedy như openai-whisper mặc định; tăng lên (vd. 5) chính xác hơn nhưng chậm hơn
+FASTER_WHISPER_BEAM_SIZE = int(os.getenv("FASTER_WHISPER_BEAM_SIZE", "1"))
+
+# openai-whisper gắn hook kv-cache lên chính model mỗi lần decode -> hai thread dùng chung
+# một model cùng lúc sẽ làm hỏng transcript của nhau; mỗi model chỉ phiên âm một lần một lúc
+_whisper_locks: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_whisper_locks_guard = threading.Lock()
+
+# tốc độ ước tính so với openai-whisper fp32 trên CPU (để ước lượng thời gian phiên âm)
+_ESTIMATED_SPEEDUP = {
+    "whisper": 1.0,
+    "faster-whisper": 3.0,
+}
+
+
+def _check_engine(name: str):
+    if name not in TRANSCRIBE_ENGINES:
+        raise ValueError(f"TRANSCRIBE_ENGINE phải là một trong {TRANSCRIBE_ENGINES}")
+
+
+def engine_fingerprint(name: str = TRANSCRIBE_ENGINE) -> str:
+    """Định danh của engine + tham số ảnh hưởng tới transcript, cho key cache."""
+    _check_engine(name)
+    if name == "whisper":
+        return name
+    return f"{name}:{FASTER_WHISPER_COMPUTE_TYPE}:beam{FASTER_WHISPER_BEAM_SIZE}"
+
+
+def estimated_speedup(name: str = TRANSCRIBE_ENGINE) -> float:
+    return _ESTIMATED_SPEEDUP.get(name, 1.0)
+
+
+class TranscriptionEngine:
+    """Interface chung của các engine phiên âm."""
+
+    name = ""
+
+    def transcribe(self, audio, language: str = "vi") -> list:
+        """`audio`: mảng float32 16 kHz mono hoặc đường dẫn file -> list segment thô."""
+        raise NotImplementedError
+
+
+class WhisperEngine(TranscriptionEngine):
+    """openai-whisper, model lấy từ registry (dùng chung giữa các thread, phiên âm tuần tự)."""
+
+    name = "whisper"
+
+    def __init__(self, model_size: str = DEFAULT_WHISPER_MODEL, device: str | None = None, threads: int = 0):
+        if threads > 0:
+            import torch
+            # torch chỉ có một thread pool cho cả process
+            torch.set_num_threads(threads)
+        self.model = get_whisper_model(model_size, device=device)
+        with _whisper_locks_guard:
+            self._lock = _whisper_locks.setdefault(self.model, threading.Lock())
+
+    def transcribe(self, audio, language: str = "vi") -> list:
+        with self._lock:
+            result = self.model.transcribe(audio, fp16=is_fp16(self.model), language=language)
+        return [
+            {"start": float(seg.get("start", 0.0)), "end": float(seg.get("end", 0.0)), "text": seg.get("text", "")}
+            for seg in result.get("segments", [])
+        ]
+
+
+class FasterWhisperEngine(TranscriptionEngine):
+    """faster-whisper (CTranslate2), lượng tử hoá theo FASTER_WHISPER_COMPUTE_TYPE."""
+
+    name = "faster-whisper"
+
+    def __init__(
+        self,
+        model_size: str = DEFAULT_WHISPER_MODEL,
+        device: str | None = None,
+        threads: int = FASTER_WHISPER_THREADS,
+        compute_type: str = FASTER_WHISPER_COMPUTE_TYPE,
+        beam_size: int = FASTER_WHISPER_BEAM_SIZE,
+    ):
+        self.beam_size = max(1, beam_size)
+        self.model = get_faster_whisper_model(model_size, device=device, compute_type=compute_type, threads=threads)
+
+    def transcribe(self, audio, language: str = "vi") -> list:
+        # segments là generator: phiên âm thật sự chạy khi duyệt
+        segments, _ = self.model.transcribe(audio, language=language, beam_size=self.beam_size)
+        return [{"start": float(seg.start), "end": float(seg.end), "text": seg.text} for seg in segments]
+
+
+_ENGINE_CLASSES = {
+    "whisper": WhisperEngine,
+    "faster-whisper": FasterWhisperEngine,
+}
+
+
+def get_engine(
+    name: str | None = None,
+    model_size: str = DEFAULT_WHISPER_MODEL,
+    device: str | None = None,
+    threads: int | None = None,
+) -> TranscriptionEngine:
+    """
+    Engine phiên âm `name` (mặc định theo TRANSCRIBE_ENGINE) với model `model_size`.
+    threads: số thread CPU (None = mặc định của engine); model được giữ trong registry
+    nên gọi lại nhiều lần không load lại.
+    """
+    name = name or TRANSCRIBE_ENGINE
+    _check_engine(name)
+    kwargs = {} if threads is None else {"threads": threads}
+    return _ENGINE_CLASSES[name](model_size, device=device, **kwargs)
@@ -0,0 +1,137 @@
+import bisect
+import os
+
+import numpy as np
+
+from src.audio_windows import frame_energy_db, FRAME_SEC
+from src.video_processor import SAMPLE_RATE
+
+# ====== VAD (VOICE ACTIVITY DETECTION) THEO NĂNG LƯỢNG ======
+# Bài giảng có nhiều đoạn im lặng (viết bảng, giải lao). Trước khi phiên âm,
+# tìm các vùng có tiếng nói, ghép chúng lại thành một audio ngắn hơn và giữ
+# bảng ánh xạ thời gian để đưa start/end của segment về đúng vị trí trong video gốc.
+
+USE_VAD = os.getenv("WHISPER_VAD", "1") == "1"
+
+# khoảng lặng chèn giữa 2 vùng tiếng nói khi ghép, để Whisper không nối câu
+JOIN_GAP_SEC = 0.3
+
+
+def detect_speech(
+    audio: np.ndarray,
+    margin_db: float = 12.0,
+    min_speech_sec: float = 0.25,
+    min_silence_sec: float = 1.0,
+    pad_sec: float = 0.2,
+):
+    """
+    Tìm các vùng có tiếng nói. Ngưỡng được tính thích nghi theo nền nhiễu
+    của chính file (phân vị 10% năng lượng frame + `margin_db`).
+
+    Trả về list (start_sample, end_sample), đã nới thêm `pad_sec` mỗi đầu.
+    """
+    energy = frame_energy_db(audio)
+    if len(energy) == 0:
+        return []
+
+    noise_floor = float(np.percentile(energy, 10))
+    loud = float(np.percentile(energy, 90))
+    if loud - noise_floor < margin_db:
+        # không phân biệt được nói / im lặng -> giữ nguyên cả file
+        return [(0, len(audio))]
+
+    threshold = noise_floor + margin_db
+    is_speech = energy > threshold
+
+    # gom các frame liên tiếp thành vùng
+    regions = []
+    start = None
+    for i, flag in enumerate(is_speech):
+        if flag and start is None:
+            start = i
+        elif not flag and start is not None:
+            regions.append([start, i])
+            start = None
+    if start is not None:
+        regions.append([start, len(is_speech)])
+
+    # nối các vùng cách nhau bởi khoảng lặng ngắn, bỏ vùng quá ngắn (tiếng động)
+    min_silence = int(min_silence_sec / FRAME_SEC)
+    merged = []
+    for region in regions:
+        if merged and region[0] - merged[-1][1] < min_silence:
+            merged[-1][1] = region[1]
+        else:
+            merged.append(region)
+    min_speech = int(min_speech_sec / FRAME_SEC)
+    merged = [r for r in merged if r[1] - r[0] >= min_speech]
+
+    frame_len = int(FRAME_SEC * SAMPLE_RATE)
+    pad = int(pad_sec * SAMPLE_RATE)
+    spans = []
+    for s, e in merged:
+        s = max(s * frame_len - pad, 0)
+        e = min(e * frame_len + pad, len(audio))
+        if spans and s <= spans[-1][1]:
+            spans[-1] = (spans[-1][0], e)
+        else:
+            spans.append((s, e))
+    return spans
+
+
+class TimeMap:
+    """Ánh xạ thời gian trên audio đã ghép (chỉ có tiếng nói) về thời gian video gốc."""
+
+    def __init__(self):
+        self.compact_starts = []   # giây, trên audio đã ghép
+        self.original_starts = []  # giây, trên audio gốc
+        self.lengths = []          # độ dài vùng (giây)
+
+    def add(self, compact_start: float, original_start: float, length: float):
+        self.compact_starts.append(compact_start)
+        self.original_starts.append(original_start)
+        self.lengths.append(length)
+
+    def to_original(self, t: float, is_start: bool = False) -> float:
+        if not self.compact_starts:
+            return t
+        i = max(bisect.bisect_right(self.compact_starts, t) - 1, 0)
+        # thời điểm rơi vào khoảng lặng chèn thêm: start -> đầu vùng kế tiếp,
+        # end -> cuối vùng hiện tại
+        if is_start and t - self.compact_starts[i] > self.lengths[i] and i + 1 < len(self.compact_starts):
+            return self.original_starts[i + 1]
+        offset = min(max(t - self.compact_starts[i], 0.0), self.lengths[i])
+        return self.original_starts[i] + offset
+
+
+def compact_speech(audio: np.ndarray, spans):
+    """
+    Ghép các vùng tiếng nói thành một mảng audio (chèn JOIN_GAP_SEC im lặng giữa các vùng).
+    Trả về (compact_audio, TimeMap).
+    """
+    gap = np.zeros(int(JOIN_GAP_SEC * SAMPLE_RATE), dtype=np.float32)
+    parts = []
+    time_map = TimeMap()
+    pos = 0
+    for s, e in spans:
+        if parts:
+            parts.append(gap)
+            pos += len(gap)
+        parts.append(np.asarray(audio[s:e], dtype=np.float32))
+        time_map.add(pos / SAMPLE_RATE, s / SAMPLE_RATE, (e - s) / SAMPLE_RATE)
+        pos += e - s
+
+    if not parts:
+        return np.zeros(0, dtype=np.float32), time_map
+    return np.concatenate(parts), time_map
+
+
+def remap_segments(raw_segments, time_map: TimeMap):
+    """Đưa start/end của segment (tính trên audio đã ghép) về thời gian video gốc."""
+    remapped = []
+    for seg in raw_segments:
+        seg = dict(seg)
+        seg["start"] = time_map.to_original(float(seg.get("start", 0.0)), is_start=True)
+        seg["end"] = time_map.to_original(float(seg.get("end", 0.0)))
+        remapped.append(seg)
+    return remapped
@@ -1,53 +1,347 @@
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain_core.documents import Document
-import streamlit as st
+from contextlib import contextmanager
+import json
 import os
+import threading
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:   # Windows: chỉ khoá được giữa các thread
+    fcntl = None
+
+from src.resource_cache import get_embeddings, get_vector_store, invalidate_vector_store
+from src.lexical_index import LexicalIndex
+from src.reporter import get_reporter
+from src.index_factory import (
+    resolve_index_type, convert_index, supports_remove, remove_positions, apply_search_params, save_config,
+)
+from src.embedding_cache import embed_texts
+from src.disk_store import (
+    load_store_for_write, save_store, migrate_legacy, read_index_for_write, write_index, video_row_count, append_rows,
+)
 
 VECTOR_STORE_DIR = "vector_store_db"
 
+# chỉ một luồng được sửa index trên đĩa tại một thời điểm
+_write_lock = threading.Lock()
+# khoá file: các process worker của job_queue cũng ghi vào cùng index
+WRITE_LOCK_FILE = ".write.lock"
+# bài giảng mới được index một phần (index dần khi đang phiên âm): không hiện trong
+# list_videos() cho tới khi index xong; process bị kill giữa chừng thì tên vẫn nằm lại
+# đây -> bài giảng bị ẩn, lần xử lý sau ghi đè
+PARTIAL_FILE = "partial_videos.json"
+
+
+@contextmanager
+def _index_write_lock():
+    """Khoá ghi index: giữa các thread (threading.Lock) và giữa các process (flock)."""
+    with _write_lock:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(VECTOR_STORE_DIR, exist_ok=True)
+        with open(os.path.join(VECTOR_STORE_DIR, WRITE_LOCK_FILE), "a+") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _doc_id(video_name: str, chunk_index) -> str:
+    """Id cố định của một chunk: "<tên video>::<chunk_index>"."""
+    return f"{video_name}::{chunk_index}"
+
+
+def _load_index_for_write():
+    """
+    Load một bản RIÊNG của index để sửa (không đụng vào bản dùng chung
+    đang phục vụ các phiên hỏi đáp). Trả về None nếu chưa có index.
+    """
+    migrate_legacy(VECTOR_STORE_DIR, get_embeddings())
+    vector_store = load_store_for_write(VECTOR_STORE_DIR, get_embeddings())
+    if vector_store is None:
+        return None
+    apply_search_params(vector_store.index)
+    return vector_store
+
+
+def _delete_ids(vector_store, ids):
+    """
+    Xoá vector theo docstore id, vị trí các vector còn lại dồn về 0..n-1.
+    HNSW / IVF-PQ không xoá tại chỗ được như vậy -> dựng index mới qua remove_positions().
+    """
+    if supports_remove(vector_store.index):
+        vector_store.delete(ids)
+        return
+    id_set = set(ids)
+    positions = [pos for pos, doc_id in vector_store.index_to_docstore_id.items() if doc_id in id_set]
+    vector_store.index = remove_positions(vector_store.index, positions)
+    vector_store.docstore.delete(ids)
+    remaining = [doc_id for _, doc_id in sorted(vector_store.index_to_docstore_id.items()) if doc_id not in id_set]
+    vector_store.index_to_docstore_id = dict(enumerate(remaining))
+
 
-def create_and_save_vector_store(documents):
+def _load_lexical_for_write(vector_store):
     """
+    Load inverted index BM25 đi kèm FAISS index; index cũ (tạo trước khi có
+    BM25) thì build lại từ docstore.
+    """
+    lexical = LexicalIndex.load(VECTOR_STORE_DIR) if vector_store is not None else None
+    if lexical is not None:
+        return lexical
+    lexical = LexicalIndex()
+    if vector_store is not None:
+        for doc_id in vector_store.index_to_docstore_id.values():
+            doc = vector_store.docstore.search(doc_id)
+            if isinstance(doc, Document):
+                lexical.add(doc_id, doc.page_content, doc.metadata.get("video_name", ""))
+    return lexical
+
+
+def _ids_of_video(vector_store, video_name: str):
+    ids = []
+    for doc_id in vector_store.index_to_docstore_id.values():
+        doc = vector_store.docstore.search(doc_id)
+        if isinstance(doc, Document) and doc.metadata.get("video_name") == video_name:
+            ids.append(doc_id)
+    return ids
+
+
+def partial_videos() -> list:
+    """Các bài giảng đang có trong index nhưng chưa index xong."""
+    try:
+        with open(os.path.join(VECTOR_STORE_DIR, PARTIAL_FILE), "r", encoding="utf-8") as f:
+            return sorted(json.load(f))
+    except (OSError, ValueError):
+        return []
+
+
+def _set_partial_locked(video_name: str, partial: bool):
+    names = set(partial_videos())
+    if (video_name in names) == partial:
+        return
+    if partial:
+        names.add(video_name)
+    else:
+        names.discard(video_name)
+    os.makedirs(VECTOR_STORE_DIR, exist_ok=True)
+    path = os.path.join(VECTOR_STORE_DIR, PARTIAL_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(sorted(names), f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def mark_complete(video_name: str):
+    """Đánh dấu bài giảng đã index đủ (các chunk đã được nối vào index từ trước)."""
+    with _index_write_lock():
+        _set_partial_locked(video_name, False)
+
+
+def _save(vector_store, lexical):
+    if not os.path.exists(VECTOR_STORE_DIR):
+        os.makedirs(VECTOR_STORE_DIR)
+    # đưa index về loại đã cấu hình (flat / hnsw / ivfpq) trước khi ghi
+    index_type = resolve_index_type(VECTOR_STORE_DIR)
+    vector_store.index = convert_index(vector_store.index, index_type)
+    # config trước: process khác load index mới sẽ đọc đúng loại index để mmap
+    save_config(VECTOR_STORE_DIR, vector_store.index, index_type)
+    lexical.save(VECTOR_STORE_DIR)
+    save_store(vector_store, VECTOR_STORE_DIR)
+    # file trên đĩa đã đổi -> bỏ bản cache cũ
+    invalidate_vector_store(VECTOR_STORE_DIR)
+
+
+def add_video_documents(video_name: str, documents, vectors=None, replace: bool = True, partial: bool = False):
+    """
+    Thêm các chunk của một video vào index chung (không embed lại các video khác).
+    replace=True: xoá vector cũ của video này trước khi thêm (xử lý lại cùng video).
+    vectors: embedding đã tính sẵn cho từng document, None thì embed bằng model.
+    partial=True: video mới có một phần (xem PARTIAL_FILE); False = video đã đủ.
+    """
+    embeddings = get_embeddings()
+    texts = [doc.page_content for doc in documents]
+    metadatas = [dict(doc.metadata, video_name=video_name) for doc in documents]
+    ids = [_doc_id(video_name, md.get("chunk_index", i)) for i, md in enumerate(metadatas)]
+    if vectors is None:
+        vectors, _ = embed_texts(texts)
+    text_embeddings = [(text, list(map(float, vec))) for text, vec in zip(texts, vectors)]
+
+    with _index_write_lock():
+        if partial:
+            # ghi dấu trước khi ghi index: bị kill ở giữa thì video vẫn bị ẩn
+            _set_partial_locked(video_name, True)
+        vector_store = _load_index_for_write()
+        lexical = _load_lexical_for_write(vector_store)
+        if vector_store is None:
+            vector_store = FAISS.from_embeddings(text_embeddings, embedding=embeddings, metadatas=metadatas, ids=ids)
+        else:
+            if replace:
+                old_ids = _ids_of_video(vector_store, video_name)
+                if old_ids:
+                    _delete_ids(vector_store, old_ids)
+                lexical.remove_video(video_name)
+            vector_store.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+
+        for doc_id, text in zip(ids, texts):
+            lexical.add(doc_id, text, video_name)
+        _save(vector_store, lexical)
+        if not partial:
+            _set_partial_locked(video_name, False)
+    return ids
+
+
+def append_video_documents(video_name: str, documents, vectors, replace: bool = False):
+    """
+    Nối thêm chunk của một bài giảng đang index dần (luôn là partial, xem PARTIAL_FILE)
+    mà không ghi lại cả index: chỉ INSERT dòng mới vào docstore.sqlite, index.add đúng
+    các vector mới và ghi thêm vào file delta của BM25. index.faiss vẫn được ghi lại
+    (FAISS không có định dạng nối thêm trên file) nên nên gọi theo lô.
+    replace=True: bỏ chunk cũ của bài giảng (lần chạy trước bị dừng giữa chừng) -> đi
+    đường ghi lại đầy đủ của add_video_documents() nếu thật sự còn chunk cũ.
+    """
+    texts = [doc.page_content for doc in documents]
+    metadatas = [dict(doc.metadata, video_name=video_name) for doc in documents]
+    ids = [_doc_id(video_name, md.get("chunk_index", i)) for i, md in enumerate(metadatas)]
+
+    with _index_write_lock():
+        _set_partial_locked(video_name, True)
+        index = read_index_for_write(VECTOR_STORE_DIR)
+        lexical = LexicalIndex.load(VECTOR_STORE_DIR) if index is not None else None
+        full_rewrite = (
+            index is None
+            or lexical is None   # index cũ chưa có BM25: cần build lại từ docstore
+            or (replace and video_row_count(VECTOR_STORE_DIR, video_name) > 0)
+        )
+        if not full_rewrite:
+            start = int(index.ntotal)
+            index.add(np.ascontiguousarray(vectors, dtype=np.float32))
+            # ivfpq đủ vector để train thì đổi loại; thứ tự vector giữ nguyên nên vị trí không đổi
+            index_type = resolve_index_type(VECTOR_STORE_DIR)
+            index = convert_index(index, index_type)
+            # docstore trước, index sau: process đọc index cũ không thấy dòng mới (pos >= ntotal)
+            append_rows(VECTOR_STORE_DIR, start, ids, texts, metadatas)
+            save_config(VECTOR_STORE_DIR, index, index_type)
+            write_index(index, VECTOR_STORE_DIR)
+            LexicalIndex.append(VECTOR_STORE_DIR, zip(ids, texts, [video_name] * len(ids)))
+            invalidate_vector_store(VECTOR_STORE_DIR)
+            return ids
+
+    return add_video_documents(video_name, documents, vectors=vectors, replace=replace, partial=True)
+
+
+def delete_video(video_name: str) -> int:
+    """Xoá toàn bộ vector của một video khỏi index. Trả về số chunk đã xoá."""
+    with _index_write_lock():
+        vector_store = _load_index_for_write()
+        ids = _ids_of_video(vector_store, video_name) if vector_store is not None else []
+        if ids:
+            lexical = _load_lexical_for_write(vector_store)
+            _delete_ids(vector_store, ids)
+            lexical.remove_video(video_name)
+            _save(vector_store, lexical)
+        _set_partial_locked(video_name, False)
+        return len(ids)
+
+
+def delete_chunks(video_name: str, ids) -> int:
+    """
+    Xoá đúng các chunk `ids` của bài giảng `video_name` (vd. các chunk một lần xử lý
+    đã nối vào index), các chunk khác giữ nguyên. Trả về số chunk đã xoá.
+    """
+    with _index_write_lock():
+        vector_store = _load_index_for_write()
+        if vector_store is None:
+            _set_partial_locked(video_name, False)
+            return 0
+        present = set(vector_store.index_to_docstore_id.values())
+        ids = [doc_id for doc_id in ids if doc_id in present]
+        if ids:
+            lexical = _load_lexical_for_write(vector_store)
+            _delete_ids(vector_store, ids)
+            for doc_id in ids:
+                lexical.remove(doc_id)
+            _save(vector_store, lexical)
+        _set_partial_locked(video_name, False)
+        return len(ids)
+
+
+def list_videos(vector_store=None, include_partial: bool = False):
+    """Danh sách tên các video đang có trong index (mặc định bỏ video chưa index xong)."""
+    if vector_store is None:
+        vector_store = get_vector_store(VECTOR_STORE_DIR)
+    if vector_store is None:
+        return []
+    if hasattr(vector_store.docstore, "video_names"):
+        names = set(vector_store.docstore.video_names())
+    else:
+        names = set()
+        for doc_id in vector_store.index_to_docstore_id.values():
+            doc = vector_store.docstore.search(doc_id)
+            if isinstance(doc, Document) and doc.metadata.get("video_name"):
+                names.add(doc.metadata["video_name"])
+    if not include_partial:
+        names -= set(partial_videos())
+    return sorted(names)
+
+
+def create_and_save_vector_store(documents, vectors=None):
+    """
+    Thêm documents vào vector store chung (nhiều bài giảng trong một index).
+    Các chunk cũ của cùng video (theo metadata "video_name") được thay thế,
+    các video khác giữ nguyên.
+
     documents: List[Document]
         Document.page_content = text
-        Document.metadata = {"start_time": ..., "end_time": ...}
+        Document.metadata = {"start": ..., "end": ..., "video_name": ..., "chunk_index": ...}
+    vectors: embedding đã tính sẵn cho từng document (vd. lấy từ cache),
+        None thì embed lại bằng model embedding.
     """
     if not documents:
-        st.error("Không có Document nào để tạo vector store.")
+        get_reporter().error("Không có Document nào để tạo vector store.")
         return False
     try:
-        embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-
-        st.info("Đang tạo vector store...")
-        vector_store = FAISS.from_documents(documents, embedding=embeddings)
+        get_reporter().info("Đang cập nhật vector store...")
 
-        if not os.path.exists(VECTOR_STORE_DIR):
-            os.makedirs(VECTOR_STORE_DIR)
+        # gom theo video để thay thế đúng phần của từng video
+        groups = {}
+        for i, doc in enumerate(documents):
+            name = doc.metadata.get("video_name", "")
+            groups.setdefault(name, []).append(i)
 
-        vector_store.save_local(VECTOR_STORE_DIR)
+        for name, idxs in groups.items():
+            add_video_documents(
+                name,
+                [documents[i] for i in idxs],
+                vectors=None if vectors is None else [vectors[i] for i in idxs],
+            )
         return True
 
     except Exception as e:
-        st.error(f"Lỗi khi tạo hoặc lưu vector store: {e}")
+        get_reporter().error(f"Lỗi khi tạo hoặc lưu vector store: {e}")
         return False
 
 
 def load_vector_store():
-    """Load lại vector store đã lưu"""
+    """
+    Load vector store đã lưu.
+    Index được cache dùng chung cho mọi phiên, chỉ đọc lại từ đĩa
+    khi file index thay đổi.
+    """
     if not os.path.exists(VECTOR_STORE_DIR):
-        st.error("Chưa tìm thấy vector store.")
+        get_reporter().error("Chưa tìm thấy vector store.")
         return None
 
     try:
-        embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-        vector_store = FAISS.load_local(
-            VECTOR_STORE_DIR,
-            embeddings,
-            allow_dangerous_deserialization=True,
-        )
+        vector_store = get_vector_store(VECTOR_STORE_DIR)
+        if vector_store is None:
+            get_reporter().error("Chưa tìm thấy vector store.")
         return vector_store
 
     except Exception as e:
-        st.error(f"Lỗi khi load vector store: {e}")
+        get_reporter().error(f"Lỗi khi load vector store: {e}")
         return None
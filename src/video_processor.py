@@ -1,6 +1,22 @@
 import os
-from moviepy import VideoFileClip
-import streamlit as st
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+
+import numpy as np
+from src.reporter import get_reporter
+
+# Whisper làm việc với audio mono 16 kHz float32
+SAMPLE_RATE = 16000
+
+# audio dài hơn ngưỡng này (giây) sẽ được ghi ra file PCM và memory-map
+# thay vì giữ toàn bộ trong RAM
+MEMMAP_THRESHOLD_SEC = float(os.getenv("AUDIO_MEMMAP_THRESHOLD_SEC", "3600"))
+
+_READ_BLOCK_BYTES = 1 << 20
+
 
 def save_uploaded_file(uploaded_file):
     #lưu tệp vào thư mục temp
@@ -12,15 +28,140 @@ def save_uploaded_file(uploaded_file):
     with open(file_path, "wb") as f:
         f.write(uploaded_file.getbuffer())
     return file_path
-    
-def extract_audio(video_path):
-    "tách âm thanh và lưu vào tệp .mp3"
+
+
+def _ffmpeg_exe() -> str:
+    """ffmpeg của hệ thống, nếu không có thì dùng bản đi kèm imageio-ffmpeg (cài cùng moviepy)."""
+    exe = shutil.which("ffmpeg")
+    if exe:
+        return exe
+    import imageio_ffmpeg
+    return imageio_ffmpeg.get_ffmpeg_exe()
+
+
+def get_media_duration(path: str) -> float | None:
+    """
+    Đọc độ dài (giây) từ metadata của container, không cần decode audio.
+    Dùng ffprobe nếu có, nếu không thì đọc dòng "Duration:" của `ffmpeg -i`.
+    """
     try:
-        video_clip = VideoFileClip(video_path)
-        audio_path = os.path.join("temp", os.path.basename(video_path).replace(".mp4", ".mp3"))
-        video_clip.audio.write_audiofile(audio_path)
-        video_clip.close()
-        return audio_path
+        ffprobe = shutil.which("ffprobe")
+        if ffprobe:
+            out = subprocess.run(
+                [ffprobe, "-v", "error", "-show_entries", "format=duration",
+                 "-of", "default=noprint_wrappers=1:nokey=1", path],
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+            return float(out)
+
+        # `ffmpeg -i` không có output -> luôn trả mã lỗi, metadata nằm ở stderr
+        err = subprocess.run(
+            [_ffmpeg_exe(), "-hide_banner", "-i", path],
+            capture_output=True, text=True,
+        ).stderr
+        m = re.search(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)", err)
+        if not m:
+            return None
+        h, mnt, sec = m.groups()
+        return int(h) * 3600 + int(mnt) * 60 + float(sec)
+    except Exception:
+        return None
+
+
+def _decode_to_buffer(stream, expected_samples: int):
+    """Đọc PCM float32 từ stdout của ffmpeg vào 1 buffer cấp phát sẵn (tránh copy 2 lần)."""
+    buf = np.empty(max(expected_samples, SAMPLE_RATE), dtype=np.float32)
+    view = memoryview(buf).cast("B")
+    n_bytes = 0
+    while True:
+        if n_bytes == len(view):
+            # metadata báo thiếu -> nới buffer thêm 50%
+            new_buf = np.empty(len(buf) + len(buf) // 2, dtype=np.float32)
+            new_buf[: len(buf)] = buf
+            buf = new_buf
+            view = memoryview(buf).cast("B")
+        n = stream.readinto(view[n_bytes:n_bytes + _READ_BLOCK_BYTES])
+        if not n:
+            break
+        n_bytes += n
+    return buf[: n_bytes // 4]
+
+
+def _decode_to_memmap(stream, fd: int, pcm_path: str):
+    """Ghi PCM float32 từ ffmpeg thẳng ra file (đã mở, fd) rồi memory-map lại."""
+    try:
+        with os.fdopen(fd, "wb") as f:
+            shutil.copyfileobj(stream, f, _READ_BLOCK_BYTES)
+    except BaseException:
+        os.remove(pcm_path)
+        raise
+    if os.path.getsize(pcm_path) == 0:
+        os.remove(pcm_path)
+        return np.zeros(0, dtype=np.float32)
+    # mode "c" (copy-on-write) để torch.from_numpy nhận mảng ghi được
+    return np.memmap(pcm_path, dtype=np.float32, mode="c")
+
+
+def _drain_stderr(stream, chunks: list):
+    """Đọc hết stderr của ffmpeg song song với stdout (pipe stderr đầy thì ffmpeg bị treo)."""
+    for line in iter(stream.readline, b""):
+        chunks.append(line)
+    stream.close()
+
+
+def extract_audio(video_path, use_memmap: bool | None = None):
+    """
+    Tách audio của video bằng một lần decode duy nhất (ffmpeg -> PCM 16 kHz mono float32),
+    không qua bước encode MP3 trung gian.
+
+    Trả về np.ndarray float32 (np.memmap với file tạm `temp/<tên>-<ngẫu nhiên>.f32` nếu
+    use_memmap, mặc định tự bật khi video dài hơn MEMMAP_THRESHOLD_SEC), hoặc None nếu lỗi.
+    """
+    audio = None
+    try:
+        duration = get_media_duration(video_path) or 0.0
+        if use_memmap is None:
+            use_memmap = duration > MEMMAP_THRESHOLD_SEC
+
+        cmd = [
+            _ffmpeg_exe(), "-nostdin", "-v", "error",
+            "-i", video_path,
+            "-vn", "-ac", "1", "-ar", str(SAMPLE_RATE),
+            "-f", "f32le", "-",
+        ]
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        err_chunks = []
+        err_reader = threading.Thread(target=_drain_stderr, args=(proc.stderr, err_chunks), daemon=True)
+        err_reader.start()
+        try:
+            if use_memmap:
+                os.makedirs("temp", exist_ok=True)
+                # tên file riêng cho mỗi lần tách: các job chạy song song (kể cả cùng tên video) không ghi đè nhau
+                stem = os.path.splitext(os.path.basename(video_path))[0]
+                fd, pcm_path = tempfile.mkstemp(dir="temp", prefix=stem + "-", suffix=".f32")
+                audio = _decode_to_memmap(proc.stdout, fd, pcm_path)
+            else:
+                audio = _decode_to_buffer(proc.stdout, int(duration * SAMPLE_RATE) + SAMPLE_RATE)
+        finally:
+            proc.stdout.close()
+            proc.wait()
+            err_reader.join()
+        err = b"".join(err_chunks).decode("utf-8", errors="ignore")
+
+        if proc.returncode != 0:
+            raise RuntimeError(err.strip() or f"ffmpeg trả về mã lỗi {proc.returncode}")
+        if len(audio) == 0:
+            raise RuntimeError("Video không có track âm thanh.")
+        return audio
     except Exception as e:
-        st.error(f"Lỗi khi tách âm thanh: {e}")
-        return None
\ No newline at end of file
+        if audio is not None:
+            release_audio(audio)
+        get_reporter().error(f"Lỗi khi tách âm thanh: {e}")
+        return None
+
+
+def release_audio(audio):
+    """Giải phóng audio đã tách (xoá file PCM tạm nếu audio là memmap)."""
+    pcm_path = getattr(audio, "filename", None)
+    if pcm_path and os.path.exists(pcm_path):
+        os.remove(pcm_path)
@@ -0,0 +1,182 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import torch
+import whisper
+
+# ====== REGISTRY GIỮ MODEL WHISPER TRONG BỘ NHỚ ======
+# Load model Whisper (đọc vài trăm MB weight + khởi tạo torch) rất tốn thời gian,
+# nên model được giữ lại trong process, key theo (backend, size, device, precision).
+# backend: "whisper" (openai-whisper, torch) hoặc "faster-whisper" (CTranslate2).
+# Model lâu không dùng hoặc vượt giới hạn bộ nhớ sẽ bị bỏ ra (LRU).
+
+WHISPER_MODEL_SIZES = ["tiny", "base", "small", "medium"]
+DEFAULT_WHISPER_MODEL = os.getenv("WHISPER_MODEL", "small")
+
+# dung lượng RAM ước tính (MB) của mỗi model khi load ở fp32
+_ESTIMATED_MODEL_MB = {
+    "tiny": 150,
+    "base": 300,
+    "small": 1000,
+    "medium": 3000,
+}
+
+# CTranslate2 int8: weight ~1/4 fp32, cộng thêm buffer suy luận
+_INT8_MEMORY_FRACTION = 0.35
+
+# giới hạn tổng bộ nhớ cho các model đang giữ, và thời gian idle tối đa (giây)
+MEMORY_CAP_MB = int(os.getenv("WHISPER_MEMORY_CAP_MB", "4096"))
+IDLE_TIMEOUT_SEC = float(os.getenv("WHISPER_IDLE_TIMEOUT_SEC", "1800"))
+
+_lock = threading.Lock()
+_models: "OrderedDict[tuple, dict]" = OrderedDict()   # key -> {"model", "last_used", "mb"}
+_load_locks: dict = {}                                 # key -> Lock (tránh load trùng)
+_warmup_started = False
+
+
+def default_device() -> str:
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def _make_key(size: str, device: str | None, fp16: bool | None):
+    device = device or default_device()
+    # fp16 chỉ có ý nghĩa trên GPU, CPU luôn chạy fp32
+    if fp16 is None or device == "cpu":
+        fp16 = device != "cpu"
+    return ("whisper", size, device, "fp16" if fp16 else "fp32")
+
+
+def _evict_locked(keep_key=None, extra_mb: int = 0):
+    """Bỏ model idle quá lâu, rồi bỏ model ít dùng nhất cho tới khi vừa MEMORY_CAP_MB."""
+    now = time.time()
+    for key in list(_models):
+        if key != keep_key and now - _models[key]["last_used"] > IDLE_TIMEOUT_SEC:
+            del _models[key]
+
+    total = sum(entry["mb"] for entry in _models.values()) + extra_mb
+    for key in list(_models):
+        if total <= MEMORY_CAP_MB:
+            break
+        if key == keep_key:
+            continue
+        total -= _models[key]["mb"]
+        del _models[key]
+
+
+def _check_size(size: str):
+    if size not in WHISPER_MODEL_SIZES:
+        raise ValueError(f"Model Whisper không hợp lệ: {size} (chọn một trong {WHISPER_MODEL_SIZES})")
+
+
+def _get_or_load(key, load, mb: int):
+    """Model của `key` trong registry, gọi load() nếu chưa có."""
+    with _lock:
+        entry = _models.get(key)
+        if entry is not None:
+            entry["last_used"] = time.time()
+            _models.move_to_end(key)
+            return entry["model"]
+        load_lock = _load_locks.setdefault(key, threading.Lock())
+
+    # load ngoài _lock để không chặn các model khác, nhưng mỗi key chỉ load một lần
+    with load_lock:
+        with _lock:
+            entry = _models.get(key)
+            if entry is not None:
+                entry["last_used"] = time.time()
+                _models.move_to_end(key)
+                return entry["model"]
+
+        model = load()
+        with _lock:
+            _evict_locked(keep_key=key, extra_mb=mb)
+            _models[key] = {"model": model, "last_used": time.time(), "mb": mb}
+        return model
+
+
+def get_whisper_model(size: str = DEFAULT_WHISPER_MODEL, device: str | None = None, fp16: bool | None = None):
+    """
+    Trả về model Whisper đã load (load lần đầu nếu chưa có).
+    size: tiny / base / small / medium
+    """
+    _check_size(size)
+    key = _make_key(size, device, fp16)
+    _, _, device_name, precision = key
+
+    def load():
+        model = whisper.load_model(size, device=device_name)
+        return model.half() if precision == "fp16" else model
+
+    return _get_or_load(key, load, _ESTIMATED_MODEL_MB.get(size, 1000))
+
+
+def get_faster_whisper_model(
+    size: str = DEFAULT_WHISPER_MODEL,
+    device: str | None = None,
+    compute_type: str = "int8",
+    threads: int = 0,
+):
+    """
+    Trả về model faster-whisper (CTranslate2) đã load, cùng cỡ model với Whisper.
+    compute_type: int8 / int8_float16 / float16 / float32 (xem CTranslate2).
+    threads: số thread CPU của model (0 = để CTranslate2 tự chọn); chỉ có tác dụng
+    ở lần load đầu của mỗi key.
+    """
+    _check_size(size)
+    device = device or default_device()
+    key = ("faster-whisper", size, device, compute_type)
+
+    def load():
+        # import muộn: faster-whisper là phụ thuộc tuỳ chọn
+        from faster_whisper import WhisperModel
+        return WhisperModel(size, device=device, compute_type=compute_type, cpu_threads=threads)
+
+    mb = _ESTIMATED_MODEL_MB.get(size, 1000)
+    if compute_type.startswith("int8"):
+        mb = int(mb * _INT8_MEMORY_FRACTION)
+    return _get_or_load(key, load, mb)
+
+
+def is_fp16(model) -> bool:
+    """Model đang ở half precision hay không (để truyền đúng cờ fp16 cho transcribe)."""
+    return next(model.parameters()).dtype == torch.float16
+
+
+def warm_up(sizes=None, background: bool = True):
+    """
+    Load trước các model Whisper của engine phiên âm đang dùng (mặc định lấy từ biến
+    môi trường WHISPER_WARMUP, ví dụ "small,base"), mặc định ở thread nền.
+    Chỉ chạy một lần mỗi process (process worker của job_queue gọi khi khởi động).
+    """
+    global _warmup_started
+    with _lock:
+        if _warmup_started:
+            return None
+        _warmup_started = True
+
+    if sizes is None:
+        sizes = [s.strip() for s in os.getenv("WHISPER_WARMUP", "").split(",") if s.strip()]
+    if not sizes:
+        return None
+
+    def _run():
+        from src.transcription_engine import get_engine
+        for size in sizes:
+            get_engine(model_size=size)
+
+    if not background:
+        _run()
+        return None
+
+    thread = threading.Thread(target=_run, name="whisper-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def loaded_models():
+    """Danh sách key các model đang được giữ trong bộ nhớ."""
+    with _lock:
+        _evict_locked()
+        return list(_models.keys())